@@ -1 +1,8 @@
 from . import models, api
+
+
+def initialize_module(app):
+    from ..cache import TTLCache
+    from . import writer
+    writer.init_action_writer(app)
+    app.extensions['action_counts'] = TTLCache(maxsize=128, ttl=app.config.get('ACTIONS_COUNT_TTL', 60))
@@ -1,28 +1,121 @@
-from flask import Blueprint
-from flask_restful import Api, Resource, reqparse
+import base64
+import binascii
+import json
+from datetime import datetime
 
+from flask import Blueprint, current_app
+from flask_restful import Api, Resource, reqparse, inputs
+from sqlalchemy import and_, or_, text
+
+from ..database import db
 from .models import Action
+from .writer import get_action_writer
 from .api_serializers import api_actions_schema
 
 blueprint = Blueprint('actions_api', __name__, url_prefix='/api/')
 api = Api(blueprint)
 
 ACTIONS_PER_PAGE = 20
+MAX_ACTIONS_PER_PAGE = 500
+COUNT_MODES = ('exact', 'estimate')
 
 actions_reqparser = reqparse.RequestParser()
-actions_reqparser.add_argument('page', type=int, default=1)
+actions_reqparser.add_argument('cursor')
+actions_reqparser.add_argument('page_size', type=int, default=ACTIONS_PER_PAGE)
+actions_reqparser.add_argument('event_name', action='append')
+actions_reqparser.add_argument('status', type=inputs.boolean)
+actions_reqparser.add_argument('since', type=inputs.datetime_from_iso8601)
+actions_reqparser.add_argument('until', type=inputs.datetime_from_iso8601)
+actions_reqparser.add_argument('count', choices=COUNT_MODES)
+
+
+CURSOR_TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def encode_cursor(action):
+    """ Opaque cursor pointing after action in (timestamp, id) order """
+    return base64.urlsafe_b64encode(json.dumps([action.timestamp.isoformat(), action.id]).encode()).decode()
+
+
+def parse_cursor_timestamp(timestamp):
+    """ Parse timestamp written by `datetime.isoformat()`, which leaves out microseconds when they are 0 """
+    for timestamp_format in CURSOR_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(timestamp, timestamp_format)
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid cursor timestamp {timestamp}')
+
+
+def decode_cursor(cursor):
+    """ Returns (tuple): (timestamp, id) of the last action of previous page, raises ValueError if it's malformed """
+    try:
+        timestamp, action_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return parse_cursor_timestamp(timestamp), int(action_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def filter_actions(query, event_names=None, status=None, since=None, until=None):
+    if event_names:
+        query = query.filter(Action.event_name.in_(event_names))
+    if status is not None:
+        query = query.filter(Action.status == status)
+    if since is not None:
+        query = query.filter(Action.timestamp >= since)
+    if until is not None:
+        query = query.filter(Action.timestamp < until)
+    return query
+
+
+def count_actions(query, filters, mode):
+    """
+    Number of actions matching filters, exact count is cached for ACTIONS_COUNT_TTL seconds.
+    Estimate is taken from table statistics on PostgreSQL when there are no filters, it's exact count otherwise.
+    """
+    if mode == 'estimate' and not any(value is not None for value in filters.values()) \
+            and db.engine.dialect.name == 'postgresql':
+        return int(db.session.execute(text("SELECT reltuples FROM pg_class WHERE relname = 'action'")).scalar())
+    key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in filters.items()))
+    return current_app.extensions['action_counts'].get_or_set(key, query.count)
 
 
 class ActionsList(Resource):
 
     def get(self):
+        """
+        Page of actions, newest first
+
+        Query params:
+            cursor: cursor of next page from previous response
+            page_size: number of actions on page
+            event_name: only actions of these events, can be repeated
+            status: only succeeded (true) or failed (false) actions
+            since, until: only actions in this time range, ISO 8601
+            count: 'exact' or 'estimate' to get number of matching actions, not counted by default
+        """
         args = actions_reqparser.parse_args()
-        actions_qs = Action.query.filter()
-        actions = actions_qs.offset((args.get('page') - 1) * ACTIONS_PER_PAGE).limit(ACTIONS_PER_PAGE)
-        return {
-            'data': api_actions_schema.dump(actions),
-            'count': actions_qs.count()
+        filters = {'event_names': args['event_name'], 'status': args['status'], 'since': args['since'],
+                   'until': args['until']}
+        actions_qs = filter_actions(Action.query, **filters)
+        page_qs = actions_qs
+        if args['cursor']:
+            try:
+                timestamp, action_id = decode_cursor(args['cursor'])
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            page_qs = page_qs.filter(or_(Action.timestamp < timestamp,
+                                         and_(Action.timestamp == timestamp, Action.id < action_id)))
+        page_size = max(1, min(args['page_size'], MAX_ACTIONS_PER_PAGE))
+        # one more action tells if there is next page
+        actions = page_qs.order_by(Action.timestamp.desc(), Action.id.desc()).limit(page_size + 1).all()
+        result = {
+            'data': api_actions_schema.dump(actions[:page_size]),
+            'cursor': encode_cursor(actions[page_size - 1]) if len(actions) > page_size else None,
         }
+        if args['count']:
+            result['count'] = count_actions(actions_qs, filters, args['count'])
+        return result
 
 
 class ActionRetrieve(Resource):
@@ -35,5 +128,13 @@ class ActionRetrieve(Resource):
         return {'message': 'action retried'}
 
 
+class ActionWriterStats(Resource):
+
+    def get(self):
+        """ Buffered audit log writer statistics """
+        return get_action_writer().stats()
+
+
 api.add_resource(ActionsList, 'actions')
+api.add_resource(ActionWriterStats, 'actions/writer')
 api.add_resource(ActionRetrieve, 'actions/<int:id>')
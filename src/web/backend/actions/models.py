@@ -9,13 +9,15 @@ class ActionABC:
     CREATE_ROCKET_USER = 'create_rocket_user'
     CREATE_ROCKET_CHANNEL = 'create_rocket_channel'
     INVITE_USER_TO_CHANNEL = 'invite_user_to_channel'
+    KICK_USER_FROM_CHANNEL = 'kick_user_from_channel'
 
-    ROCKET_EVENTS = [CREATE_ROCKET_CHANNEL, CREATE_ROCKET_USER, INVITE_USER_TO_CHANNEL]
+    ROCKET_EVENTS = [CREATE_ROCKET_CHANNEL, CREATE_ROCKET_USER, INVITE_USER_TO_CHANNEL, KICK_USER_FROM_CHANNEL]
 
     EVENT_CHOICES = {
         CREATE_ROCKET_CHANNEL: 'Rocket channel creation',
         CREATE_ROCKET_USER: 'Rocket user creation',
-        INVITE_USER_TO_CHANNEL: 'Invite rocket user to channel'
+        INVITE_USER_TO_CHANNEL: 'Invite rocket user to channel',
+        KICK_USER_FROM_CHANNEL: 'Kick rocket user from channel'
     }
 
     @property
@@ -64,10 +66,19 @@ class ActionABC:
             return rutils.rocket_service.create_channel(**self.data)
         elif self.event_name == self.INVITE_USER_TO_CHANNEL:
             return rutils.rocket_service.invite_user_to_channel(**self.data)
+        elif self.event_name == self.KICK_USER_FROM_CHANNEL:
+            return rutils.rocket_service.kick_user_from_channel(**self.data)
 
 
 class Action(SurrogatePK, Model, ActionABC):
 
+    # actions are listed newest first by (timestamp, id) keyset, optionally filtered by event name or status
+    __table_args__ = (
+        db.Index('ix_action_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_action_event_name_timestamp_id', 'event_name', 'timestamp', 'id'),
+        db.Index('ix_action_status_timestamp_id', 'status', 'timestamp', 'id'),
+    )
+
     event_name = Column(db.String(50), nullable=False)
     timestamp = Column(db.DateTime, default=datetime.utcnow)
     _data = Column(db.Text)
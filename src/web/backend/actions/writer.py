@@ -0,0 +1,217 @@
+""" Buffered writer of audit log actions, which inserts them in batches from background thread """
+import atexit
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from ..database import db
+
+logger = logging.getLogger()
+
+
+class ActionWriter:
+    """
+    Buffers actions in memory and writes them with multi-row inserts from background thread, when `batch_size`
+    actions are buffered or the oldest one waits for `interval` seconds. Buffer holds at most `max_buffered`
+    actions: when it's full, recording waits for writer to catch up and drops the action after `put_timeout`.
+    Batch that failed to be written is put back at the head of buffer and retried after backoff, which doubles
+    after every failure up to `max_backoff` seconds; its actions are dropped only if buffer has no room for them.
+    Buffered actions are written on close, which is also called at interpreter exit: close interrupts backoff, and
+    if this last attempt fails too, actions are dropped and their number is logged.
+
+    In `sync` mode every action is inserted right away in caller's thread.
+    """
+
+    def __init__(self, app, batch_size=100, interval=1.0, max_buffered=10000, put_timeout=1.0, max_backoff=30.0,
+                 sync=False):
+        """
+        Args:
+            app (Flask): application, which database actions are written to
+            batch_size (int): max number of actions in one insert
+            interval (float): max seconds action waits in buffer
+            max_buffered (int): max number of actions in buffer
+            put_timeout (float): seconds to wait for free space in full buffer before dropping action
+            max_backoff (float): max seconds to wait before retrying failed batch
+            sync (bool): insert every action right away, without buffering
+        """
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffered = max_buffered
+        self.put_timeout = put_timeout
+        self.max_backoff = max_backoff
+        self.sync = sync
+        self._buffer = []  # (buffered at, row) tuples, oldest first
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._flushing = False  # write buffered actions without waiting for full batch or interval
+        self._in_flight = 0  # actions taken from buffer, but not written yet
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0  # actions of failed inserts, retried ones included
+        self.retries = 0  # failed inserts in a row
+
+    @staticmethod
+    def make_row(event_name, status=True, message=None, **kwargs):
+        return {
+            'event_name': event_name,
+            'timestamp': datetime.utcnow(),
+            '_data': json.dumps(kwargs),
+            'message': message,
+            'status': status,
+        }
+
+    def record(self, event_name, status=True, message=None, **kwargs):
+        """ Record action, arguments are the same as of `Action.create_event` """
+        row = self.make_row(event_name, status=status, message=message, **kwargs)
+        with self._cond:
+            buffered = not (self.sync or self._closed)
+            if buffered:
+                self._buffer_row(row)
+        if not buffered:
+            self._write([row])
+
+    def _buffer_row(self, row):
+        """ Append row to buffer, called with lock held """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='action-writer', daemon=True)
+            self._thread.start()
+        if len(self._buffer) >= self.max_buffered:
+            self._cond.wait_for(lambda: len(self._buffer) < self.max_buffered, timeout=self.put_timeout)
+        if len(self._buffer) >= self.max_buffered:
+            self.dropped += 1
+            logger.error(f'Audit log buffer is full, action {row["event_name"]} is dropped')
+            return
+        self._buffer.append((time.monotonic(), row))
+        if len(self._buffer) >= self.batch_size:
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        """ Wait until batch is ready, take it from buffer, return None when writer is closed and buffer is empty """
+        with self._cond:
+            while True:
+                if not self._buffer:
+                    self._flushing = False
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                remaining = self._buffer[0][0] + self.interval - time.monotonic()
+                if len(self._buffer) >= self.batch_size or remaining <= 0 or self._closed or self._flushing:
+                    batch = self._buffer[:self.batch_size]
+                    del self._buffer[:self.batch_size]
+                    self._in_flight += len(batch)
+                    self._cond.notify_all()  # recorders waiting for free space
+                    return batch
+                self._cond.wait(remaining)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                written = self._write([row for _, row in batch])
+                with self._cond:
+                    self._in_flight -= len(batch)
+                    if written:
+                        self.retries = 0
+                    else:
+                        self._requeue(batch)
+                    self._cond.notify_all()
+                    if not written:
+                        if self._closed:
+                            self._drop_buffered()
+                            return
+                        backoff = min(self.interval * 2 ** self.retries, self.max_backoff)
+                        self._cond.wait_for(lambda: self._closed, timeout=backoff)  # woken up by close only
+
+    def _requeue(self, batch):
+        """ Put failed batch back at the head of buffer, dropping actions it has no room for, called with lock held """
+        self.retries += 1
+        room = max(0, self.max_buffered - len(self._buffer))
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            logger.error(f'Audit log buffer is full, {len(batch) - room} actions of failed batch are dropped')
+        self._buffer[:0] = batch[:room]
+
+    def _drop_buffered(self):
+        """ Drop actions, which failed to be written on close, called with lock held """
+        self.dropped += len(self._buffer)
+        logger.error(f'Audit log writer is closed, {len(self._buffer)} actions that failed to be written are dropped')
+        self._buffer = []
+        self._cond.notify_all()
+
+    def _write(self, rows):
+        """ Insert rows, return False if insert failed """
+        from .models import Action
+        try:
+            with db.get_engine(self.app).begin() as connection:
+                connection.execute(Action.__table__.insert(), rows)
+        except Exception as e:
+            logger.exception(e)
+            with self._cond:
+                self.failed += len(rows)
+            return False
+        with self._cond:
+            self.written += len(rows)
+            self.batches += 1
+        return True
+
+    def flush(self, timeout=None):
+        """ Write buffered actions now and wait until they are written, return False on timeout """
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._buffer and not self._in_flight, timeout=timeout)
+
+    def close(self, timeout=10):
+        """ Write buffered actions and stop background thread, actions recorded after it are written right away """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                with self._cond:
+                    pending = len(self._buffer) + self._in_flight
+                logger.error(f'Audit log writer did not finish in {timeout} seconds, {pending} actions are not written')
+
+    def stats(self):
+        with self._cond:
+            return {
+                'buffered': len(self._buffer),
+                'written': self.written,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'retries': self.retries,
+                'sync': self.sync,
+            }
+
+
+def init_action_writer(app):
+    writer = ActionWriter(app,
+                          batch_size=app.config.get('ACTIONS_BATCH_SIZE', 100),
+                          interval=app.config.get('ACTIONS_FLUSH_INTERVAL', 1.0),
+                          max_buffered=app.config.get('ACTIONS_MAX_BUFFERED', 10000),
+                          max_backoff=app.config.get('ACTIONS_MAX_BACKOFF', 30),
+                          sync=app.config.get('ACTIONS_WRITE_SYNC', False))
+    app.extensions['action_writer'] = writer
+    atexit.register(writer.close)
+    return writer
+
+
+def get_action_writer():
+    return current_app.extensions['action_writer']
+
+
+def record_action(event_name, status=True, message=None, **kwargs):
+    """ Record audit log action with writer of current app, right away or in background depending on its mode """
+    get_action_writer().record(event_name, status=status, message=message, **kwargs)
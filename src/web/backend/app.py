@@ -1,7 +1,7 @@
 """The app module, containing the app factory function."""
 from flask import Flask, render_template
 
-from . import commands, public, user, core, nextcloud, rocket_chat, ldap, actions
+from . import commands, public, user, core, nextcloud, rocket_chat, ldap, actions, jobs
 from .extensions import db, login_manager, migrate
 
 
@@ -24,6 +24,10 @@ def create_app(config_object='backend.settings'):
 
 def initialize_modules(app):
     rocket_chat.initialize_module(app)
+    nextcloud.initialize_module(app)
+    ldap.initialize_module(app)
+    jobs.init_job_runner(app)
+    actions.initialize_module(app)
     return None
 
 
@@ -77,3 +81,5 @@ def register_commands(app):
     app.cli.add_command(commands.clean)
     app.cli.add_command(commands.urls)
     app.cli.add_command(commands.check_services_consistency)
+    app.cli.add_command(commands.create_teams)
+    app.cli.add_command(commands.sync_channels)
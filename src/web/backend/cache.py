@@ -0,0 +1,103 @@
+""" In-process caches shared between requests """
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe bounded LRU cache with optional time-to-live for entries.
+
+    Keeps hit/miss/eviction counters, so cache efficiency can be exposed via api.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        """
+        Args:
+            maxsize (int): max number of entries, least recently used entry is evicted when exceeded
+            ttl (float): seconds entry stays valid, None to keep entries until evicted or invalidated
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.RLock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """ Get value by key, return default if there is no such key or it's expired """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] is not None and item[0] <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                item = _MISSING
+            if item is _MISSING:
+                if count:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=_MISSING):
+        """ Set value by key, evicting least recently used entries if cache is full """
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, func):
+        """
+        Read-through: return cached value or compute it with `func`, cache and return it.
+        Value computed while cache was invalidated is returned, but not cached.
+        """
+        with self._lock:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            generation = self._generation
+        value = func()
+        with self._lock:
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """ Remove single key, or all keys if key is not passed """
+        with self._lock:
+            self._generation += 1
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
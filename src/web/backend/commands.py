@@ -133,3 +133,36 @@ def urls(url, order):
 def check_services_consistency():
     check_ldap_consistency()
     check_nextcloud_consistency()
+
+
+@click.command()
+@with_appcontext
+def sync_channels():
+    """Invite franchise and division members to their chat channels and kick those who are not members."""
+    from .ldap.models import sync_unit_channels
+    for unit in ('franchises', 'divisions'):
+        for machine_name, report in sync_unit_channels(unit).items():
+            if 'message' in report:
+                click.echo('{} {}: failed, {}'.format(unit, machine_name, report['message']))
+                continue
+            click.echo('{} {}: invited {}, kicked {}, without chat account {}, failed {}'.format(
+                unit, machine_name, len(report['invited']), len(report['kicked']), len(report['missing']),
+                len(report['failed'])))
+            for failure in report['failed']:
+                click.echo('  failed to {} {}: {}'.format(failure['action'], failure['username'], failure['message']))
+
+
+@click.command()
+@with_appcontext
+def create_teams():
+    """Create ldap entries for every franchise x division team that doesn't exist yet."""
+    from .ldap.models import LdapTeam
+    teams = [(team.machine_name, team.display_name) for team in LdapTeam.get_virtual_teams()]
+    results = LdapTeam.create_many(teams)
+    for result in results:
+        if result['status'] == 'failed':
+            click.echo('Failed to create {}: {}'.format(result['machine_name'], result['message']))
+    created = sum(1 for result in results if result['status'] == 'created')
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    click.echo('Created {} teams, {} already existed, {} failed'.format(created, len(results) - created - failed,
+                                                                        failed))
@@ -0,0 +1,82 @@
+""" Helpers to run independent calls to external services concurrently """
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from flask import current_app
+
+logger = logging.getLogger()
+
+
+def in_app_context(func, app=None):
+    """
+    Wrap function to run in its own application context, e.g. in worker thread.
+    Resources bound to context (like pooled edap connection in flask g) are released when the call ends.
+    """
+    app = app or current_app._get_current_object()
+
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def iter_concurrently(func, items, max_workers=4):
+    """
+    Call `func` for every item with at most `max_workers` calls in flight, each one in its own app context
+
+    Items are consumed lazily, so `items` can be a generator of any length.
+
+    Yields (tuple): (item, result, exception) in order of completion, exception is None if call succeeded
+    """
+    func = in_app_context(func)
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def submit_next():
+            for item in items:
+                in_flight[executor.submit(func, item)] = item
+                return True
+            return False
+
+        for _ in range(max_workers):
+            if not submit_next():
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                exception = future.exception()
+                yield item, None if exception else future.result(), exception
+                submit_next()
+
+
+def map_concurrently(func, items, max_workers=4):
+    """
+    Call `func` for every item with at most `max_workers` calls in flight
+
+    Returns (list): (item, result, exception) tuples in order of items
+    """
+    items = list(items)
+    results = [None] * len(items)
+    indexed_items = enumerate(items)
+    for (index, item), result, exception in iter_concurrently(lambda indexed_item: func(indexed_item[1]),
+                                                              indexed_items, max_workers=max_workers):
+        results[index] = (item, result, exception)
+    return results
+
+
+def run_step(func, *args, **kwargs):
+    """
+    Call function as a named step of bigger operation, catching and logging its exception
+
+    Returns (dict): 'success', 'duration' in seconds, 'result' of call or error 'message'
+    """
+    started = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        logger.exception(e)
+        return {'success': False, 'duration': round(time.monotonic() - started, 3), 'message': str(e)}
+    return {'success': True, 'duration': round(time.monotonic() - started, 3), 'result': result}
@@ -1 +1 @@
-from . import views
+from . import models, views
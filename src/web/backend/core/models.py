@@ -0,0 +1,17 @@
+"""Models shared by all modules."""
+from datetime import datetime
+
+from ..database import db, Column, Model
+
+
+class JobRecord(Model):
+    """ Last known state of job, shared by all web workers, so that job can be polled from any of them """
+
+    __tablename__ = 'job'
+
+    id = Column(db.String(32), primary_key=True)
+    name = Column(db.String(50), nullable=False)
+    status = Column(db.String(20), nullable=False)
+    _data = Column(db.Text, nullable=False)  # json of `Job.to_dict()`
+    updated_at = Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(db.DateTime, index=True)
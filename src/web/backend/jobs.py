@@ -0,0 +1,255 @@
+""" Background jobs for long provisioning operations, run in worker pool, with state stored in database """
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_
+
+from .concurrency import in_app_context
+from .core.models import JobRecord
+from .database import db
+
+logger = logging.getLogger()
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Step:
+    """ Named step of job, runs after all steps it `depends` on succeeded, skipped if any of them didn't """
+
+    def __init__(self, name, func, depends=()):
+        self.name = name
+        self.func = func
+        self.depends = tuple(depends)
+        self.status = PENDING
+        self.duration = None
+        self.result = None
+        self.message = None
+        self.exception = None
+
+    def run(self):
+        self.status = RUNNING
+        started = time.monotonic()
+        try:
+            self.result = self.func()
+            self.status = SUCCEEDED
+        except Exception as e:
+            logger.exception(e)
+            self.exception = e
+            self.message = str(e)
+            self.status = FAILED
+        self.duration = round(time.monotonic() - started, 3)
+        return self.status == SUCCEEDED
+
+    def to_dict(self):
+        return {'name': self.name, 'status': self.status, 'duration': self.duration, 'message': self.message,
+                'depends': list(self.depends)}
+
+
+def run_steps(steps, on_change=None, heartbeat=None):
+    """
+    Run steps as soon as their dependencies succeed, independent steps at the same time, each in its own thread
+    and app context, so that wall-clock time is the one of the slowest chain of dependent steps.
+
+    Args:
+        steps (list): `Step` instances
+        on_change (callable): called in caller's thread when steps are started or finished,
+            and every `heartbeat` seconds while they run
+        heartbeat (float): seconds between `on_change` calls while no step finishes
+
+    Returns (bool): True if all steps succeeded
+    """
+    by_name = {step.name: step for step in steps}
+
+    def ready_steps():
+        """ Skip steps with failed dependencies, return steps which dependencies all succeeded """
+        changed = True
+        while changed:
+            changed = False
+            for step in steps:
+                if step.status == PENDING and any(by_name[name].status in (FAILED, SKIPPED) for name in step.depends):
+                    step.status = SKIPPED
+                    changed = True
+        return [step for step in steps
+                if step.status == PENDING and all(by_name[name].status == SUCCEEDED for name in step.depends)]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(steps)), thread_name_prefix='step') as executor:
+        running = set()
+        while True:
+            for step in ready_steps():
+                step.status = RUNNING
+                running.add(executor.submit(in_app_context(step.run)))
+            if not running:
+                break
+            if on_change:
+                on_change()
+            _, running = wait(running, timeout=heartbeat, return_when=FIRST_COMPLETED)
+    return all(step.status == SUCCEEDED for step in steps)
+
+
+class Job:
+    """
+    Steps, run in background with `run_steps`
+
+    Job fails if any step fails, steps that depend on failed step are skipped. `result` is built from results
+    of steps by `make_result` callable, which receives dict of them by step name.
+    """
+
+    def __init__(self, name, steps, make_result=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.steps = steps
+        self.make_result = make_result
+        self.status = PENDING
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def run(self, on_change=None, heartbeat=None):
+        """ Run steps, calling `on_change` whenever job or its steps change, see `run_steps` """
+        self.status = RUNNING
+        self.started_at = time.time()
+        if on_change:
+            on_change()
+        status = SUCCEEDED if run_steps(self.steps, on_change=on_change, heartbeat=heartbeat) else FAILED
+        if self.make_result:
+            try:
+                self.result = self.make_result({step.name: step.result for step in self.steps})
+            except Exception as e:
+                logger.exception(e)
+        self.finished_at = time.time()
+        self.status = status  # set last, finished job has result and finish time
+        if on_change:
+            on_change()
+
+    def to_dict(self):
+        done = sum(step.status in (SUCCEEDED, FAILED, SKIPPED) for step in self.steps)
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': round(done / len(self.steps), 3) if self.steps else 1.0,
+            'steps': [step.to_dict() for step in self.steps],
+            'result': self.result,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+        }
+
+
+class JobRunner:
+    """
+    Runs jobs in thread pool of this process, each job in its own app context. State of job is written to `job`
+    table whenever it changes, and every `heartbeat` seconds while it runs, so that it can be read in any process.
+    Job not updated for `stale_after` seconds is reported failed: process that ran it was stopped or restarted.
+    Finished jobs are kept for `ttl` seconds.
+    """
+
+    def __init__(self, max_workers=2, ttl=3600, stale_after=300):
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.heartbeat = stale_after / 3
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, name, steps, make_result=None):
+        """
+        Queue job
+
+        Args:
+            name (str): job name, e.g. 'create_franchise'
+            steps (list): `Step` instances
+            make_result (callable): builds job result from dict of steps results by step name
+
+        Returns (Job): queued job
+        """
+        job = Job(name, steps, make_result=make_result)
+        self._prune()
+        self._save(job, created=True)
+        run = in_app_context(lambda: job.run(on_change=lambda: self._save(job), heartbeat=self.heartbeat),
+                             current_app._get_current_object())
+        self._executor.submit(run)
+        return job
+
+    @staticmethod
+    def _save(job, created=False):
+        data = job.to_dict()
+        values = {
+            'name': job.name,
+            'status': job.status,
+            '_data': json.dumps(data),
+            'updated_at': datetime.utcnow(),
+            'finished_at': datetime.utcfromtimestamp(job.finished_at) if job.finished else None,
+        }
+        table = JobRecord.__table__
+        try:
+            with db.engine.begin() as connection:
+                if created:
+                    connection.execute(table.insert(), dict(values, id=job.id))
+                else:
+                    connection.execute(table.update().where(table.c.id == job.id), values)
+        except Exception as e:
+            if created:
+                raise
+            # job goes on, its state is written with next change
+            logger.exception(e)
+
+    def _to_dict(self, row):
+        """ Job state from row, unfinished job which process stopped updating it is reported as failed """
+        data = json.loads(row._data)
+        if data['status'] not in (SUCCEEDED, FAILED) and \
+                (datetime.utcnow() - row.updated_at).total_seconds() > self.stale_after:
+            data['status'] = FAILED
+            for step in data['steps']:
+                if step['status'] in (PENDING, RUNNING):
+                    step['status'] = FAILED
+                    step['message'] = 'Job was interrupted'
+        return data
+
+    def get(self, job_id):
+        """ Get job dict by id, None if there is no such job or it was finished more than ttl seconds ago """
+        table = JobRecord.__table__
+        query = table.select().where(table.c.id == job_id).where(
+            or_(table.c.finished_at.is_(None), table.c.finished_at >= self._expired_before()))
+        with db.engine.connect() as connection:
+            row = connection.execute(query).first()
+        return self._to_dict(row) if row else None
+
+    def list(self):
+        """ Dicts of all kept jobs, in order of creation """
+        self._prune()
+        with db.engine.connect() as connection:
+            rows = connection.execute(JobRecord.__table__.select()).fetchall()
+        return sorted((self._to_dict(row) for row in rows), key=lambda job: job['created_at'])
+
+    def _expired_before(self):
+        return datetime.utcfromtimestamp(time.time() - self.ttl)
+
+    def _prune(self):
+        table = JobRecord.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.finished_at < self._expired_before()))
+
+
+def init_job_runner(app):
+    runner = JobRunner(max_workers=app.config.get('JOBS_WORKERS', 2), ttl=app.config.get('JOBS_TTL', 3600),
+                       stale_after=app.config.get('JOBS_STALE_AFTER', 300))
+    app.extensions['jobs'] = runner
+    return runner
+
+
+def get_job_runner():
+    return current_app.extensions['jobs']
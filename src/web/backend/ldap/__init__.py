@@ -1 +1,7 @@
 from . import api
+
+
+def initialize_module(app):
+    from . import utils
+    utils.init_edap_pool(app)
+    utils.init_org_graph(app)
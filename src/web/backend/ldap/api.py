@@ -1,16 +1,24 @@
-from flask import Blueprint, jsonify, request
+import json
+from bisect import bisect_right
+
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context, url_for
 from flask.views import MethodView
 from edap import ObjectDoesNotExist, ConstraintError, MultipleObjectsFound
 from marshmallow import ValidationError
 
 from ..utils import EncoderWithBytes
-from .serializers import edap_user_schema, edap_users_schema, edap_franchise_schema, edap_franchises_schema, \
-    edap_divisions_schema, edap_teams_schema, edap_division_schema
-from .api_serializers import api_franchise_schema, api_user_schema, api_users_schema, api_franchises_schema, \
-    api_divisions_schema, api_teams_schema
-
-from .models import LdapDivision, LdapFranchise, LdapUser
-from .utils import get_config_divisions, merge_divisions, EdapMixin
+from .serializers import edap_user_schema, edap_franchise_schema, edap_teams_schema, edap_division_schema
+from .api_serializers import api_franchise_schema, api_user_schema, api_franchises_schema, api_divisions_schema, \
+    api_teams_schema
+
+from ..concurrency import iter_concurrently, run_step
+from ..jobs import Step, get_job_runner
+from ..nextcloud.utils import request_ldap_cache_flush
+from .imports import iter_import_rows, UnsupportedImportFormat
+from .models import LdapDivision, LdapFranchise, LdapUser, LdapTeam, lazy_teams_enabled, sync_channels_steps
+from .projections import project_users, project_groups
+from .utils import get_config_divisions, merge_divisions, EdapMixin, get_edap_pool, get_edap_cache, \
+    get_org_graph, search_org_units, get_group_members, FRANCHISES_UNIT, DIVISIONS_UNIT, TEAMS_UNIT
 
 blueprint = Blueprint('divisions_api', __name__, url_prefix='/api/ldap/')
 blueprint.json_encoder = EncoderWithBytes
@@ -23,11 +31,53 @@ def handle_not_found(e):
 
 class UserListViewSet(EdapMixin, MethodView):
 
+    MAX_PAGE_SIZE = 1000
+
     def get(self):
-        """ List users """
-        res = self.edap.get_users()
-        data = edap_users_schema.load(res)
-        return jsonify(api_users_schema.dump(data))
+        """
+        List users
+
+        Query params:
+            page_size, cursor: return single page of users sorted by uid and cursor (last uid) of next page
+            stream: stream all users (sorted by uid if ldap server can sort by it), fetching them page by page
+            query: filter users, which uid starts with query (for paged and streamed listing)
+        """
+        if request.args.get('stream'):
+            return self.stream()
+        if 'page_size' in request.args or 'cursor' in request.args:
+            return self.get_page()
+        graph = get_org_graph()
+        res = graph.get_users() if graph else self.edap.get_users()
+        return jsonify(project_users(res))
+
+    def get_page_size(self):
+        page_size = request.args.get('page_size', type=int) or current_app.config.get('EDAP_PAGE_SIZE', 500)
+        return max(1, min(page_size, self.MAX_PAGE_SIZE))
+
+    def get_page(self):
+        """ Single page of users with cursor of next page, cursor is the last uid of page """
+        entries, next_cursor = self.edap.get_users_page(query=request.args.get('query'),
+                                                        after=request.args.get('cursor'),
+                                                        page_size=self.get_page_size())
+        return jsonify({
+            'data': project_users(entries),
+            'cursor': next_cursor
+        })
+
+    def stream(self):
+        """ Stream json array of users, serializing each ldap page as soon as it arrives """
+        pages = self.edap.iter_users_pages(query=request.args.get('query'), page_size=self.get_page_size())
+
+        def generate():
+            separator = ''
+            yield '['
+            for entries in pages:
+                for user in project_users(entries):
+                    yield separator + json.dumps(user, cls=EncoderWithBytes)
+                    separator = ','
+            yield ']'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     def post(self):
         """ Create user """
@@ -47,38 +97,118 @@ class UserListViewSet(EdapMixin, MethodView):
         return jsonify(res)
 
 
+class UserImportViewSet(EdapMixin, MethodView):
+
+    RESERVED_CONNECTIONS = 2  # pooled connections of import request itself and of org graph refresh
+
+    def post(self):
+        """
+        Create users from CSV (with uid, name, surname, mail, password header) or NDJSON request body
+
+        Rows are validated and created as the body is read, with up to USER_IMPORT_CONCURRENCY users created at the
+        same time. Response is NDJSON stream with result of every row in order of completion, followed by summary.
+        Row status is 'created', 'chat_failed' (ldap user is created, chat account is not), 'invalid' or 'failed'.
+        Nextcloud ldap cache is flushed once, after all users are created.
+        """
+        try:
+            rows = iter_import_rows(request.stream, request.mimetype)
+        except UnsupportedImportFormat as e:
+            return jsonify({'message': str(e)}), 415
+        everybody_team = LdapTeam.get_everybody_team()
+        # every import thread holds pooled connection, leave some for this request and org graph refresh
+        max_workers = max(1, min(current_app.config.get('USER_IMPORT_CONCURRENCY', 8),
+                                 get_edap_pool().size - self.RESERVED_CONNECTIONS))
+
+        def import_user(row):
+            number, data = row
+            if data is None:
+                return {'row': number, 'status': 'invalid', 'errors': {'_schema': ['Row can not be parsed']}}
+            try:
+                user_data = api_user_schema.load(data)
+            except ValidationError as err:
+                return {'row': number, 'uid': data.get('uid'), 'status': 'invalid', 'errors': err.messages}
+            password = user_data.pop('password')
+            user = LdapUser(**user_data)
+            result = user.create_for_import(password, everybody_team)
+            status = 'created' if result['rocket']['success'] else 'chat_failed'
+            return {'row': number, 'uid': user.uid, 'status': status, **result}
+
+        def generate():
+            counts = {'created': 0, 'chat_failed': 0, 'invalid': 0, 'failed': 0}
+            for (number, data), result, exception in iter_concurrently(import_user, rows, max_workers=max_workers):
+                if exception is not None:
+                    result = {'row': number, 'uid': (data or {}).get('uid'), 'status': 'failed',
+                              'message': str(exception)}
+                counts[result['status']] += 1
+                yield json.dumps(result, cls=EncoderWithBytes) + '\n'
+            created = counts['created'] + counts['chat_failed']
+            nextcloud = run_step(request_ldap_cache_flush, wait=True) if created else None
+            yield json.dumps({'summary': counts, 'nextcloud': nextcloud}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 class UserRetrieveViewSet(EdapMixin,
                           MethodView):
     """ ViewSet for single user """
     def get(self, username):
         """ List users """
+        graph = get_org_graph()
+        if graph:
+            return self.get_from_org_graph(graph, username)
         try:
             user = edap_user_schema.load(self.edap.get_user(username))
         except MultipleObjectsFound:
             return jsonify({'message': 'More than 1 user found'}), 409
         except ObjectDoesNotExist:
             return jsonify({'message': 'User does not exist'}), 404
-        user_groups = self.edap.get_user_groups(username)
-        user = {
+        return jsonify(self.serialize(user, user.get_memberships()))
+
+    def get_from_org_graph(self, graph, username):
+        user_entry = graph.get_user(username)
+        if not user_entry:
+            return jsonify({'message': 'User does not exist'}), 404
+        user = edap_user_schema.load(user_entry)
+        return jsonify(self.serialize(user, user.get_memberships(groups=graph.get_user_groups(username))))
+
+    @staticmethod
+    def serialize(user, memberships):
+        """ User with groups, franchises, divisions and teams where user is a member """
+        return {
             **api_user_schema.dump(user),
-            "groups": [group for group in user_groups],
-            "franchises": api_franchises_schema.dump(user.get_franchises()),
-            "divisions": api_divisions_schema.dump(user.get_divisions()),
-            "teams": api_teams_schema.dump(user.get_teams())
+            "groups": memberships['groups'],
+            "franchises": api_franchises_schema.dump(memberships['franchises']),
+            "divisions": api_divisions_schema.dump(memberships['divisions']),
+            "teams": api_teams_schema.dump(memberships['teams'])
         }
-        return jsonify(user)
 
     def delete(self, username):
-        """ Delete user """
+        """ Delete user, response contains result and duration of every step """
         result = dict(success=True)
         try:
             user = edap_user_schema.load(self.edap.get_user(username))
-            user.delete()
+            result['steps'] = user.delete()
         except Exception as exc:
             result['success'] = False
             result['message'] = str(exc)
             return jsonify(result), 500
-        return jsonify(result)
+        result['success'] = all(step['success'] for step in result['steps'].values())
+        return jsonify(result), 200 if result['success'] else 500
+
+
+class UserPhotoViewSet(EdapMixin, MethodView):
+
+    def get(self, username):
+        """ User's jpegPhoto, 304 if it matches If-None-Match ETag """
+        photo = self.edap.get_user_photo(username)
+        if photo is None:
+            return jsonify({'message': 'User has no photo'}), 404
+        photo_bytes, digest = photo
+        response = Response(photo_bytes, mimetype='image/jpeg')
+        response.set_etag(digest)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True  # revalidate with ETag, photo can be changed
+        return response.make_conditional(request)
 
 
 class UserGroupViewSet(EdapMixin,
@@ -107,11 +237,53 @@ class UserGroupViewSet(EdapMixin,
         return jsonify({'message': 'Success'}), 202
 
 
+def start_provisioning_job(name, unit):
+    """ Run creation steps of franchise or division in background, respond with 202 and job to poll """
+    steps = [Step(step_name, func, depends) for step_name, func, depends in unit.provisioning_steps()]
+    job = get_job_runner().submit(name, steps, make_result=unit.creation_result)
+    return jsonify({'message': 'Creation started', 'job': job.to_dict()}), 202, \
+        {'Location': url_for('.job_api', job_id=job.id)}
+
+
+class JobViewSet(MethodView):
+
+    def get(self, job_id=None):
+        """ Get provisioning job with progress, status and duration of every step, or list of all jobs """
+        runner = get_job_runner()
+        if job_id is None:
+            return jsonify(runner.list())
+        job = runner.get(job_id)
+        if job is None:
+            return jsonify({'message': 'Job does not exist'}), 404
+        return jsonify(job)
+
+
+class ChannelMembersSyncViewSet(EdapMixin, MethodView):
+
+    SCHEMAS = {FRANCHISES_UNIT: edap_franchise_schema, DIVISIONS_UNIT: edap_division_schema}
+
+    def post(self, unit=None, machine_name=None):
+        """
+        Sync chat channel members with members of franchise or division and respond with report,
+        or start background job, which syncs channels of all franchises and divisions
+        """
+        if unit is None:
+            steps = [Step(step_name, func) for step_name, func in sync_channels_steps()]
+            job = get_job_runner().submit('sync_channels', steps, make_result=lambda results: results)
+            return jsonify({'message': 'Sync started', 'job': job.to_dict()}), 202, \
+                {'Location': url_for('.job_api', job_id=job.id)}
+        group = self.SCHEMAS[unit].load(self.edap.get_unit_group(unit, machine_name))
+        try:
+            return jsonify(group.sync_channel_members())
+        except Exception as e:
+            return jsonify({'message': str(e)}), 400
+
+
 class ConfigDivisionsListViewSet(EdapMixin, MethodView):
 
     def get(self):
         """ Get merged divisions from config and ldap """
-        ldap_divisions = self.edap.get_divisions()
+        ldap_divisions = search_org_units(DIVISIONS_UNIT)
         config_divisions = get_config_divisions()
         divisions = merge_divisions(config_divisions, ldap_divisions)
         return jsonify({'divisions': divisions})
@@ -126,8 +298,7 @@ class ConfigDivisionsListViewSet(EdapMixin, MethodView):
             return jsonify({"message": "Division doesn't exist in config file"}), 400
         div_display_name = config_divisions[div_machine_name]
         division = LdapDivision(machine_name=div_machine_name, display_name=div_display_name)
-        res = division.create()
-        return jsonify(res)
+        return start_provisioning_job('create_division', division)
 
 
 class DivisionsViewSet(EdapMixin, MethodView):
@@ -135,9 +306,34 @@ class DivisionsViewSet(EdapMixin, MethodView):
     def get(self):
         """ Get divisions from ldap """
         query = request.args.get('query')
-        search = f"description={query}*" if query else ""
-        ldap_divisions = edap_divisions_schema.load(self.edap.get_divisions(search))
-        return jsonify(api_divisions_schema.dump(ldap_divisions))
+        limit = request.args.get('limit', type=int)
+        return jsonify(project_groups(search_org_units(DIVISIONS_UNIT, query, limit=limit)))
+
+
+class GroupMembersViewSet(EdapMixin, MethodView):
+
+    MAX_PAGE_SIZE = 1000
+
+    def get(self, unit, machine_name):
+        """
+        Page of uids of franchise, division or team members, sorted by uid
+
+        Query params:
+            page_size: number of uids on page
+            cursor: last uid of previous page
+        """
+        members = get_group_members(unit, machine_name)
+        if members is None:
+            return jsonify({'message': 'Group does not exist'}), 404
+        page_size = request.args.get('page_size', type=int) or current_app.config.get('EDAP_PAGE_SIZE', 500)
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        start = bisect_right(members, request.args['cursor']) if request.args.get('cursor') else 0
+        page = members[start:start + page_size]
+        return jsonify({
+            'data': page,
+            'total': len(members),
+            'cursor': page[-1] if start + page_size < len(members) else None
+        })
 
 
 class DivisionViewSet(EdapMixin, MethodView):
@@ -151,19 +347,15 @@ class FranchisesViewSet(EdapMixin, MethodView):
 
     def get(self):
         query = request.args.get('query')
-        search = f"description={query}*" if query else ""
-        franchises = edap_franchises_schema.load(self.edap.get_franchises(search))
-        return jsonify(api_franchises_schema.dump(franchises))
+        limit = request.args.get('limit', type=int)
+        return jsonify(project_groups(search_org_units(FRANCHISES_UNIT, query, limit=limit)))
 
     def post(self):
+        """ Start franchise creation job """
         franchise = api_franchise_schema.load(request.json)
-        try:
-            create_res = franchise.create()
-        except ConstraintError as e:
-            return jsonify({'message': str(e)}), 409
-        except Exception as e:
-            return jsonify({'message': str(e)}), 400
-        return jsonify(create_res), 201
+        if LdapFranchise.check_exists_by_display_name(franchise.display_name):
+            return jsonify({'message': 'Franchise with such display name already exists'}), 409
+        return start_provisioning_job('create_franchise', franchise)
 
 
 def suggest_franchise_name(franchise_machine_name):
@@ -187,9 +379,21 @@ class TeamsViewSet(EdapMixin, MethodView):
     def get(self):
         """ Get teams from ldap """
         query = request.args.get('query')
-        search = f"description={query}*" if query else ""
-        ldap_teams = edap_teams_schema.load(self.edap.get_teams(search))
-        return jsonify(api_teams_schema.dump(ldap_teams))
+        limit = request.args.get('limit', type=int)
+        if lazy_teams_enabled():
+            teams = self.get_virtual_teams(query)
+            return jsonify(api_teams_schema.dump(teams[:limit] if limit else teams))
+        return jsonify(project_groups(search_org_units(TEAMS_UNIT, query, limit=limit)))
+
+    def get_virtual_teams(self, query=None):
+        """ Teams for every franchise x division combination, with existing ldap teams taking precedence """
+        teams = {team.machine_name: team for team in LdapTeam.get_virtual_teams()}
+        teams.update((team.machine_name, team) for team in edap_teams_schema.load(search_org_units(TEAMS_UNIT)))
+        teams = sorted(teams.values(), key=lambda team: team.display_name or '')
+        if query:
+            query = query.lower()
+            teams = [team for team in teams if (team.display_name or '').lower().startswith(query)]
+        return teams
 
 
 class TeamViewSet(EdapMixin, MethodView):
@@ -250,14 +454,55 @@ class UserTeamsViewSet(EdapMixin, MethodView):
         return jsonify({'message': 'success'}), 202
 
 
+def edap_pool_stats():
+    """ Ldap connections pool usage statistics """
+    return jsonify(get_edap_pool().stats())
+
+
+class EdapCacheViewSet(MethodView):
+
+    def get(self):
+        """ Franchises, divisions, teams cache statistics """
+        return jsonify(get_edap_cache().stats())
+
+    def delete(self):
+        """ Drop cached franchises, divisions, teams """
+        get_edap_cache().invalidate()
+        return jsonify({'message': 'success'}), 202
+
+
+class OrgGraphViewSet(MethodView):
+
+    def get(self):
+        """ In-memory org graph statistics """
+        graph = get_org_graph()
+        if not graph:
+            return jsonify({'message': 'Org graph is disabled'}), 404
+        return jsonify(graph.stats())
+
+    def post(self):
+        """ Force org graph refresh, rebuild it from scratch if 'full' param is passed """
+        graph = get_org_graph()
+        if not graph:
+            return jsonify({'message': 'Org graph is disabled'}), 404
+        graph.refresh(full=bool(request.args.get('full')))
+        return jsonify(graph.stats())
+
+
 user_list_view = UserListViewSet.as_view('users_api')
 blueprint.add_url_rule('/users/', view_func=user_list_view, methods=['GET', 'POST'])
 
+user_import_view = UserImportViewSet.as_view('user_import_api')
+blueprint.add_url_rule('/users/import', view_func=user_import_view, methods=['POST'])
+
 user_view = UserRetrieveViewSet.as_view('user_api')
 blueprint.add_url_rule('/users/<username>', view_func=user_view, methods=['GET', 'DELETE'])
 blueprint.add_url_rule('/users/<username>', view_func=user_view, methods=['PATCH'])
 blueprint.add_url_rule('/users/<username>/<action>', view_func=user_view, methods=['PATCH'])
 
+user_photo_view = UserPhotoViewSet.as_view('user_photo_api')
+blueprint.add_url_rule('/users/<username>/photo', view_func=user_photo_view, methods=['GET'])
+
 user_group_view = UserGroupViewSet.as_view('user_groups_api')
 blueprint.add_url_rule('/users/<username>/groups/', view_func=user_group_view, methods=['POST', 'DELETE'])
 
@@ -270,6 +515,11 @@ blueprint.add_url_rule('divisions', view_func=divisions_list_view, methods=['GET
 division_view = DivisionViewSet.as_view('division_api')
 blueprint.add_url_rule('divisions/<division_name>', view_func=division_view, methods=['DELETE'])
 
+group_members_view = GroupMembersViewSet.as_view('group_members_api')
+for _unit in (FRANCHISES_UNIT, DIVISIONS_UNIT, TEAMS_UNIT):
+    blueprint.add_url_rule(f'{_unit}/<machine_name>/members', view_func=group_members_view, methods=['GET'],
+                           defaults={'unit': _unit})
+
 franchises_view = FranchisesViewSet.as_view('franchise_api')
 blueprint.add_url_rule('franchises', view_func=franchises_view, methods=['GET', 'POST'])
 
@@ -294,3 +544,22 @@ blueprint.add_url_rule('user/<uid>/divisions', view_func=user_divisions_view, me
 
 user_teams_view = UserTeamsViewSet.as_view('user_teams_api')
 blueprint.add_url_rule('user/<uid>/teams', view_func=user_teams_view, methods=['POST', 'DELETE'])
+
+blueprint.add_url_rule('pool', view_func=edap_pool_stats, methods=['GET'])
+
+edap_cache_view = EdapCacheViewSet.as_view('edap_cache_api')
+blueprint.add_url_rule('cache', view_func=edap_cache_view, methods=['GET', 'DELETE'])
+
+channel_members_sync_view = ChannelMembersSyncViewSet.as_view('channel_members_sync_api')
+blueprint.add_url_rule('chats/sync', view_func=channel_members_sync_view, methods=['POST'])
+for _unit in (FRANCHISES_UNIT, DIVISIONS_UNIT):
+    blueprint.add_url_rule(f'{_unit}/<machine_name>/chat/sync', view_func=channel_members_sync_view,
+                           methods=['POST'], defaults={'unit': _unit})
+
+job_view = JobViewSet.as_view('job_api')
+blueprint.add_url_rule('jobs', view_func=job_view, methods=['GET'])
+blueprint.add_url_rule('jobs/<job_id>', view_func=job_view, methods=['GET'])
+
+org_graph_view = OrgGraphViewSet.as_view('org_graph_api')
+blueprint.add_url_rule('org-graph', view_func=org_graph_view, methods=['GET'])
+blueprint.add_url_rule('org-graph/refresh', view_func=org_graph_view, methods=['POST'])
@@ -0,0 +1,227 @@
+""" Edap client extended with TEAP specific behaviour """
+import hashlib
+
+import ldap
+from edap import Edap, ObjectDoesNotExist, MultipleObjectsFound
+from ldap.filter import escape_filter_chars
+
+from .paging import iter_pages, search_after
+
+# names of organizational units containing posix groups of each kind
+FRANCHISES_UNIT = 'franchises'
+DIVISIONS_UNIT = 'divisions'
+TEAMS_UNIT = 'teams'
+
+
+def copy_entries(entries):
+    """ Copy edap entries, so that consumers (e.g. serializers unpacking values in place) don't modify cached data """
+    if isinstance(entries, dict):
+        return dict(entries)
+    if isinstance(entries, (list, tuple)):
+        return type(entries)(copy_entries(entry) for entry in entries)
+    return entries
+
+
+class TeapEdap(Edap):
+    """
+    Edap with read-through cache for organizational units (franchises, divisions, teams) lookups.
+
+    Org units change rarely, so listings are cached in process-wide cache shared by all pooled connections
+    and invalidated whenever TEAP creates or deletes org unit. Searches by memberUid are never cached, as they
+    depend on membership, which changes much more often.
+
+    Every write is also reported to org graph, if it's used, so that it's refreshed before next read.
+
+    User searches never fetch jpegPhoto, photos are fetched one by one with `get_user_photo` and kept in
+    separate LRU cache. Group searches never fetch memberUid (Everybody team has every user as a member), members
+    are listed with `get_group_members`.
+    """
+
+    PEOPLE_UNIT = 'people'
+    # everything api needs from user entry, jpegPhoto can be megabytes and is left out on purpose
+    USER_ATTRIBUTES = ['objectClass', 'uid', 'givenName', 'sn', 'mail', 'cn']
+    GROUP_ATTRIBUTES = ['objectClass', 'cn', 'description', 'gidNumber']
+
+    def __init__(self, hostname, admin, admin_pass, domain, cache=None, org_graph=None, photo_cache=None):
+        self.org_cache = cache
+        self.org_graph = org_graph
+        self.photo_cache = photo_cache
+        self.domain_dn = ','.join(f'dc={part}' for part in domain.split('.'))
+        super().__init__(hostname, admin, admin_pass, domain)
+
+    @property
+    def people_dn(self):
+        return f'ou={self.PEOPLE_UNIT},{self.domain_dn}'
+
+    @staticmethod
+    def users_filter(query=None):
+        """ Ldap filter for users, which uid starts with query if passed """
+        if query:
+            return f'(uid={escape_filter_chars(query)}*)'
+        return '(uid=*)'
+
+    def iter_users_pages(self, query=None, attrlist=None, page_size=500, sort_by='uid'):
+        """ Iterate over users page by page (sorted by `sort_by` if server can sort), fetching pages when needed """
+        return iter_pages(self.ldap, self.people_dn, self.users_filter(query),
+                          attrlist=attrlist or self.USER_ATTRIBUTES, page_size=page_size, sort_by=sort_by)
+
+    def get_users_page(self, query=None, after=None, page_size=500):
+        """ Page of users sorted by uid, which uid is greater than `after`, see `search_after` """
+        return search_after(self.ldap, self.people_dn, self.users_filter(query), attrlist=self.USER_ATTRIBUTES,
+                            page_size=page_size, sort_by='uid', after=after)
+
+    def search_users(self, search_filter, attrlist=None):
+        """ Get user entries in edap format, without photos unless `attrlist` asks for them """
+        data = self.ldap.search_s(self.people_dn, ldap.SCOPE_SUBTREE, search_filter,
+                                  attrlist=attrlist or self.USER_ATTRIBUTES)
+        return [{'fqdn': dn, **attrs} for dn, attrs in data if dn]
+
+    def get_users(self, search=None):
+        """ Get all users, or users matching `search` (e.g. 'mail=jdoe@example.com') """
+        return self.search_users(f'(&(uid=*)({search}))' if search else '(uid=*)')
+
+    def get_user(self, uid, attrlist=None):
+        """
+        Get single user entry
+
+        Raises:
+            ObjectDoesNotExist: if there is no user with such uid
+            MultipleObjectsFound: if more than one user has such uid
+        """
+        users = self.search_users(f'(uid={escape_filter_chars(uid)})', attrlist=attrlist)
+        if not users:
+            raise ObjectDoesNotExist(f'User {uid} does not exist')
+        if len(users) > 1:
+            raise MultipleObjectsFound(f'More than one user with uid {uid}')
+        return users[0]
+
+    def get_user_photo(self, uid):
+        """
+        Get user's jpegPhoto with its content hash, cached in photo cache if it's used
+
+        Returns (tuple): (photo bytes, sha1 hex digest) or None if user has no photo
+
+        Raises:
+            ObjectDoesNotExist: if there is no user with such uid
+        """
+        def fetch():
+            photos = self.get_user(uid, attrlist=['jpegPhoto']).get('jpegPhoto')
+            if not photos:
+                return None
+            return photos[0], hashlib.sha1(photos[0]).hexdigest()
+
+        if self.photo_cache is None:
+            return fetch()
+        return self.photo_cache.get_or_set(uid, fetch)
+
+    def unit_dn(self, unit):
+        return f'ou={unit},{self.domain_dn}'
+
+    @staticmethod
+    def groups_filter(search=None):
+        """ Ldap filter for posix groups, also matching `search` (e.g. 'memberUid=jdoe') if passed """
+        if search:
+            return f'(&(objectClass=posixGroup)({search}))'
+        return '(objectClass=posixGroup)'
+
+    def search_groups(self, unit=None, search=None, attrlist=None):
+        """ Get posix group entries of organizational unit (of whole domain if unit is None), without members """
+        base_dn = self.unit_dn(unit) if unit else self.domain_dn
+        data = self.ldap.search_s(base_dn, ldap.SCOPE_SUBTREE, self.groups_filter(search),
+                                  attrlist=attrlist or self.GROUP_ATTRIBUTES)
+        return [{'fqdn': dn, **attrs} for dn, attrs in data if dn]
+
+    def get_unit_group(self, unit, machine_name, attrlist=None):
+        """
+        Get single group of organizational unit by machine name
+
+        Raises:
+            ObjectDoesNotExist: if there is no such group
+            MultipleObjectsFound: if more than one group has such machine name
+        """
+        groups = self.search_groups(unit, f'cn={escape_filter_chars(machine_name)}', attrlist=attrlist)
+        if not groups:
+            raise ObjectDoesNotExist(f'Group {machine_name} does not exist in {unit}')
+        if len(groups) > 1:
+            raise MultipleObjectsFound(f'More than one group {machine_name} in {unit}')
+        return groups[0]
+
+    def get_group_members(self, unit, machine_name):
+        """ Get sorted uids of group members, the only read which fetches memberUid """
+        group = self.get_unit_group(unit, machine_name, attrlist=['memberUid'])
+        return sorted(uid.decode('utf-8') for uid in group.get('memberUid', []))
+
+    def _cached(self, method_name, load, *args):
+        if self.org_cache is None or any('memberUid' in str(arg) for arg in args):
+            return load(*args)
+        return copy_entries(self.org_cache.get_or_set((method_name, args), lambda: load(*args)))
+
+    def invalidate_org_cache(self):
+        if self.org_cache is not None:
+            self.org_cache.invalidate()
+
+    def get_franchises(self, search=None):
+        return self._cached('get_franchises', self.search_groups, FRANCHISES_UNIT, search)
+
+    def get_divisions(self, search=None):
+        return self._cached('get_divisions', self.search_groups, DIVISIONS_UNIT, search)
+
+    def get_teams(self, search=None):
+        return self._cached('get_teams', self.search_groups, TEAMS_UNIT, search)
+
+    def get_groups(self, search=None):
+        return self.search_groups(None, search)
+
+    def get_user_groups(self, uid):
+        return self.search_groups(None, f'memberUid={escape_filter_chars(uid)}')
+
+    def get_franchise(self, machine_name):
+        return self.get_unit_group(FRANCHISES_UNIT, machine_name)
+
+    def get_division(self, machine_name):
+        return self.get_unit_group(DIVISIONS_UNIT, machine_name)
+
+    def get_team(self, machine_name):
+        return self.get_unit_group(TEAMS_UNIT, machine_name)
+
+    def get_team_component_units(self, team_machine_name):
+        return self._cached('get_team_component_units', super().get_team_component_units, team_machine_name)
+
+    def on_write(self, method_name, *args, succeeded=True):
+        """ Keep caches in sync after successful or failed write through this client """
+        if method_name in ORG_WRITE_METHODS:
+            self.invalidate_org_cache()
+        if method_name in USER_WRITE_METHODS and self.photo_cache is not None and args:
+            self.photo_cache.invalidate(args[0])
+        if self.org_graph is not None:
+            self.org_graph.on_write(method_name, *args, succeeded=succeeded)
+
+
+# edap methods changing franchises, divisions or teams
+ORG_WRITE_METHODS = ('create_franchise', 'create_division', 'create_team', 'delete_division', 'delete_team')
+
+# edap methods creating or deleting users, first argument is uid
+USER_WRITE_METHODS = ('add_user', 'delete_user')
+
+# edap methods changing users or memberships
+MEMBERSHIP_WRITE_METHODS = ('add_user', 'delete_user', 'make_uid_member_of', 'remove_uid_member_of',
+                            'make_user_member_of_team', 'remove_uid_member_of_team',
+                            'make_user_member_of_franchise', 'remove_uid_member_of_franchise',
+                            'make_uid_member_of_division', 'remove_uid_member_of_division')
+
+
+def _write_method(method_name):
+    def method(self, *args, **kwargs):
+        try:
+            result = getattr(super(TeapEdap, self), method_name)(*args, **kwargs)
+        except Exception:
+            self.on_write(method_name, *args, *kwargs.values(), succeeded=False)
+            raise
+        self.on_write(method_name, *args, *kwargs.values())
+        return result
+    method.__name__ = method_name
+    return method
+
+
+for _method_name in ORG_WRITE_METHODS + MEMBERSHIP_WRITE_METHODS:
+    setattr(TeapEdap, _method_name, _write_method(_method_name))
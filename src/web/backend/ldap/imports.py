@@ -0,0 +1,56 @@
+""" Parsing of bulk user import files, row by row as request body is read """
+import csv
+import json
+
+CSV_MIMETYPES = ('text/csv',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+
+class UnsupportedImportFormat(Exception):
+    """ Import file is neither CSV nor NDJSON """
+
+
+def iter_lines(stream):
+    """ Decoded lines of binary stream, read lazily """
+    for line in stream:
+        yield line.decode('utf-8')
+
+
+def iter_csv_rows(lines):
+    """ Yields (tuple): (row number, dict of row values by header), empty values are left out """
+    for number, row in enumerate(csv.DictReader(lines), start=1):
+        yield number, {key: value for key, value in row.items() if key and value}
+
+
+def iter_ndjson_rows(lines):
+    """ Yields (tuple): (row number, parsed json object or None if line isn't valid json object) """
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def iter_import_rows(stream, mimetype):
+    """
+    Iterate over users in import file
+
+    Args:
+        stream: binary stream of file, e.g. request.stream
+        mimetype (str): mimetype of file, CSV or NDJSON
+
+    Yields (tuple): (row number, user data dict or None if row can't be parsed)
+
+    Raises:
+        UnsupportedImportFormat: if mimetype is neither CSV nor NDJSON
+    """
+    if mimetype in CSV_MIMETYPES:
+        return iter_csv_rows(iter_lines(stream))
+    if mimetype in NDJSON_MIMETYPES:
+        return iter_ndjson_rows(iter_lines(stream))
+    raise UnsupportedImportFormat(f'Unsupported import format {mimetype}, expected CSV or NDJSON')
@@ -1,17 +1,43 @@
-""" Models to work with ldap objects, operated by EDAP library """
+"""
+Models to work with ldap objects, operated by EDAP library
+
+Models declare `__slots__` and intern machine names, as whole directory can be loaded into them at once.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import ldap
 from edap import ObjectDoesNotExist, ConstraintError
+from flask import current_app
 from nextcloud.base import Permission as NxcPermission
 
-from .utils import EdapMixin, get_edap
-from ..nextcloud.utils import get_nextcloud, get_group_folder, flush_nextcloud_ldap_cache
+from .edap_client import copy_entries
+from .utils import EdapMixin, get_edap, get_org_graph, get_group_members, get_unit_entries, classify_groups, \
+    FRANCHISES_UNIT, DIVISIONS_UNIT, TEAMS_UNIT
+from ..nextcloud.utils import get_group_folder, request_ldap_cache_flush, create_group_folder, \
+    grant_access_to_group_folder, set_permissions_to_group_folder
 from ..rocket_chat import utils as rutils
+from ..concurrency import map_concurrently, in_app_context, run_step
+from ..jobs import Step, run_steps
 
 # TODO: separate layer with edap from data models
 NEXTCLOUD_ADMIN_GROUP = "admin"
 
 
+def intern_name(name):
+    """ Intern machine name or uid, shared by many objects and memberships, keep None as is """
+    return sys.intern(name) if isinstance(name, str) else name
+
+
+def lazy_teams_enabled():
+    """ Whether franchise x division teams are created on first use instead of with franchise or division """
+    return current_app.config.get('EDAP_LAZY_TEAMS', False)
+
+
 class GroupChatMixin:
     """ Mixin for posix groups to work with chat channels """
+    __slots__ = ()
 
     @property
     def chat_name(self):
@@ -30,11 +56,24 @@ class GroupChatMixin:
         Check if franchise channel in chat exists
         Returns (bool):
         """
-        return bool(rutils.rocket_service.get_channel_by_name(self.chat_name))
+        return bool(rutils.rocket_service.get_channel_id(self.chat_name))
+
+    def sync_channel_members(self):
+        """
+        Invite group members missing in chat channel and kick channel members who are not in group
+
+        Returns (dict): sync report, see `RocketChatService.sync_channel_members`
+        """
+        uids = get_group_members(self.UNIT, self.machine_name)
+        if uids is None:
+            raise ObjectDoesNotExist(f'Group {self.machine_name} does not exist in {self.UNIT}')
+        return rutils.rocket_service.sync_channel_members(
+            self.chat_name, uids, max_workers=current_app.config.get('ROCKETCHAT_SYNC_CONCURRENCY', 8))
 
 
 class GroupFolderMixin:
     """ Mixin for posix groups to work with group folder in Nextcloud """
+    __slots__ = ()
 
     @property
     def folder_path(self):
@@ -45,18 +84,78 @@ class GroupFolderMixin:
 
     def folder_exists(self):
         """ Check if group folder exists in Nextcloud """
-        nxc = get_nextcloud()
-        data = nxc.get_group_folders().data
-        for _, folder_info in data.items():
-            if folder_info['mount_point'] == self.folder_path:
-                return True
-        return False
+        return get_group_folder(self.folder_path) is not None
+
+
+class ProvisioningError(Exception):
+    """ Provisioning step completed without exception, but reported failure """
+
+
+class ProvisioningMixin:
+    """ Mixin for franchises and divisions, created in ldap, Nextcloud and chat step by step """
+    __slots__ = ()
+
+    def provisioning_steps(self):
+        """
+        Steps of creation. Group folder and chat channel don't depend on each other or on teams,
+        so they are created at the same time, once ldap entry exists.
+
+        Returns (list): (name, callable, names of steps it depends on) tuples
+        """
+        steps = [('ldap', self.add_to_edap, ())]
+        if not lazy_teams_enabled():
+            steps.append(('teams', self.create_teams_step, ('ldap',)))
+        steps += [('folder', self.create_folder_step, ('ldap',)), ('rocket', self.create_channel_step, ('ldap',))]
+        return steps
+
+    def create_teams_step(self):
+        """ Create teams, raise ProvisioningError if any of them failed """
+        results = self.create_teams()
+        failed = [f"{team['machine_name']} ({team['message']})" for team in results if team['status'] == 'failed']
+        if failed:
+            raise ProvisioningError(f'Failed to create teams: {", ".join(failed)}')
+        return results
+
+    def create_folder_step(self):
+        """ Create group folder, raise ProvisioningError if Nextcloud reported failure """
+        if not self.create_folder():
+            raise ProvisioningError(f'Failed to create group folder {self.folder_path}')
+        return True
+
+    def create_channel_step(self):
+        """ Create chat channel, raise ProvisioningError if Rocket.Chat reported failure """
+        channel_res = self.create_channel()
+        if not channel_res.get('success'):
+            raise ProvisioningError(f'Failed to create chat channel {self.chat_name}: {channel_res.get("error")}')
+        return channel_res
+
+    @staticmethod
+    def creation_result(results):
+        """ Creation response from results of steps by step name """
+        return {
+            'rocket': results.get('rocket'),
+            'folder': {
+                'success': results.get('folder')
+            }
+        }
+
+    def create(self):
+        """
+        Create unit with self.machine_name, self.display_name, create corresponding teams, folder and channel,
+        raise exception of the first failed step
+        """
+        steps = [Step(name, func, depends) for name, func, depends in self.provisioning_steps()]
+        if not run_steps(steps):
+            raise next(step.exception for step in steps if step.exception is not None)
+        return self.creation_result({step.name: step.result for step in steps})
 
 
 class User:
+    __slots__ = ('uid', 'given_name', 'mail', 'surname', 'groups', 'franchises', 'divisions', 'teams', 'picture_bytes')
+
     def __init__(self, uid=None, given_name=None, mail=None, surname=None, groups=None, franchises=None, divisions=None,
                  teams=None, picture_bytes=b""):
-        self.uid = uid
+        self.uid = intern_name(uid)
         self.given_name = given_name
         self.mail = mail
         self.surname = surname
@@ -74,6 +173,7 @@ class User:
 
 
 class LdapUser(EdapMixin, User):
+    __slots__ = ('fqdn',)
 
     def __init__(self, fqdn=None, *args, **kwargs):
         self.fqdn = fqdn
@@ -90,9 +190,9 @@ class LdapUser(EdapMixin, User):
         ret = self.edap.add_user(self.uid, self.given_name, self.surname, password, self.mail, self.picture_bytes)
         return ret
 
-    def add_to_everybody_team(self):
-        """ Add user to everybody team in edap """
-        everybody_team = LdapTeam.get_everybody_team()
+    def add_to_everybody_team(self, everybody_team=None):
+        """ Add user to everybody team in edap, `everybody_team` is looked up if it's not passed """
+        everybody_team = everybody_team or LdapTeam.get_everybody_team()
         ret = self.edap.make_user_member_of_team(self.uid, everybody_team.machine_name)
         return ret
 
@@ -100,25 +200,68 @@ class LdapUser(EdapMixin, User):
         self.add_to_edap(password)
         self.add_to_everybody_team()
 
-        nxc = get_nextcloud()
-        flush_nextcloud_ldap_cache(nxc)
+        request_ldap_cache_flush()
 
         rocket_data = self.create_chat_account(password)
         return {
             'rocket': rocket_data
         }
 
+    def create_for_import(self, password, everybody_team=None):
+        """
+        Create user as a part of bulk import: ldap entry, Everybody team membership and chat account.
+        Nextcloud ldap cache is not flushed, importer flushes it once for all users.
+
+        Returns (dict): result of 'rocket' step, see `run_step`, it fails if chat reported failure;
+            ldap errors are raised
+        """
+        self.add_to_edap(password)
+        self.add_to_everybody_team(everybody_team)
+
+        def create_chat_account():
+            rocket_data = self.create_chat_account(password)
+            if not rocket_data.get('success'):
+                raise Exception(rocket_data.get('error', 'Failed to create chat account'))
+            return rocket_data
+
+        return {
+            'rocket': run_step(create_chat_account)
+        }
+
     def delete(self):
-        self.remove_from_all_groups()
-        res = self.edap.delete_user(self.uid)
-        self.delete_chat_account()
-        return res
+        """
+        Remove user from all groups and delete ldap entry, deleting chat account at the same time
+
+        Returns (dict): result of each step ('groups', 'ldap', 'rocket'), see `run_step`
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            rocket_future = executor.submit(in_app_context(run_step), self.delete_chat_account)
+            groups_res = run_step(self.remove_from_all_groups)
+            if groups_res['success'] and all(each['success'] for each in groups_res['result']):
+                ldap_res = run_step(self.edap.delete_user, self.uid)
+            else:
+                ldap_res = {'success': False, 'duration': 0, 'message': 'User is not removed from all groups'}
+            rocket_res = rocket_future.result()
+        return {
+            'groups': groups_res,
+            'ldap': ldap_res,
+            'rocket': rocket_res
+        }
 
     def remove_from_all_groups(self):
-        """ Remove user from all ldap groups """
+        """
+        Remove user from all ldap groups, with up to EDAP_BULK_CONCURRENCY removals at the same time
+
+        Returns (list): dicts with group 'fqdn', 'success' and error 'message' for every group
+        """
         user_groups = self.edap.get_user_groups(self.uid)
-        for each in user_groups:
-            self.edap.remove_uid_member_of(self.uid, each['fqdn'])
+
+        def remove(group):
+            get_edap().remove_uid_member_of(self.uid, group['fqdn'])
+
+        results = map_concurrently(remove, user_groups, max_workers=current_app.config.get('EDAP_BULK_CONCURRENCY', 4))
+        return [{'fqdn': group['fqdn'], 'success': exception is None, 'message': str(exception) if exception else None}
+                for group, _, exception in results]
 
     def create_chat_account(self, password):
         """
@@ -133,10 +276,35 @@ class LdapUser(EdapMixin, User):
         return rocket_res.json()
 
     def delete_chat_account(self):
-        """ Delete user's chat account """
-        rocket_user = rutils.rocket_service.get_user_by_username(self.uid)
-        if rocket_user and rocket_user.get('_id'):
-            return rutils.rocket_service.delete_user(rocket_user['_id'])
+        """ Delete user's chat account, return True if account existed and was deleted """
+        rocket_user_id = rutils.rocket_service.get_user_id(self.uid)
+        if rocket_user_id:
+            res = rutils.rocket_service.delete_user(rocket_user_id, username=self.uid)
+            if res.status_code != 200:
+                raise Exception(res.json().get('error', 'Failed to delete chat account'))
+            return True
+        return False
+
+    def get_memberships(self, groups=None):
+        """
+        Get all groups where user is a member with single ldap search, split to franchises, divisions and teams
+
+        Args:
+            groups (list): user's groups edap entries, if they are already fetched
+
+        Returns (dict): raw edap 'groups' entries, loaded 'franchises', 'divisions' and 'teams'
+        """
+        from .serializers import edap_franchises_schema, edap_divisions_schema, edap_teams_schema
+        if groups is None:
+            groups = self.edap.get_user_groups(self.uid)
+        units = classify_groups(groups)
+        # serializers unpack entries in place, keep raw groups intact
+        return {
+            'groups': groups,
+            'franchises': edap_franchises_schema.load(copy_entries(units[FRANCHISES_UNIT])),
+            'divisions': edap_divisions_schema.load(copy_entries(units[DIVISIONS_UNIT])),
+            'teams': edap_teams_schema.load(copy_entries(units[TEAMS_UNIT])),
+        }
 
     def get_teams(self):
         """ Get teams where user is a member """
@@ -154,6 +322,8 @@ class LdapUser(EdapMixin, User):
 
     def add_to_team(self, team_machine_name):
         """ Add user to team and to respective franchise and division groups """
+        if lazy_teams_enabled():
+            LdapTeam.ensure_exists(team_machine_name)
         self.edap.make_user_member_of_team(self.uid, team_machine_name)
 
         self.add_user_to_implied_structures(team_machine_name)
@@ -189,10 +359,13 @@ class LdapUser(EdapMixin, User):
 
 class Franchise(GroupChatMixin, GroupFolderMixin):
 
+    __slots__ = ('machine_name', 'display_name')
+
+    UNIT = FRANCHISES_UNIT
     GROUP_FOLDER = 'Franchises'
 
     def __init__(self, machine_name=None, display_name=None):
-        self.machine_name = machine_name
+        self.machine_name = intern_name(machine_name)
         self.display_name = display_name
 
     @property
@@ -208,23 +381,22 @@ class Franchise(GroupChatMixin, GroupFolderMixin):
         Create subfolder in 'Franchises' folder with read-write access to members of Franchise
         and read access for 'Everybody' team
         """
-        nxc = get_nextcloud()
         main_franchises_folder = get_group_folder(Franchise.GROUP_FOLDER)
 
         if not main_franchises_folder:
             Franchise.create_main_folder()
 
-        create_folder_res = nxc.create_group_folder(self.folder_path)
+        create_folder_res = create_group_folder(self.folder_path)
         folder_id = create_folder_res.data['id']
 
-        grant_access_res = nxc.grant_access_to_group_folder(
+        grant_access_res = grant_access_to_group_folder(
                 folder_id, self.machine_name)
-        grant_everybody_access = nxc.grant_access_to_group_folder(
+        grant_everybody_access = grant_access_to_group_folder(
                 folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID)
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 folder_id, NEXTCLOUD_ADMIN_GROUP)
 
-        nxc.set_permissions_to_group_folder(
+        set_permissions_to_group_folder(
                 folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID,
                 str(NxcPermission.READ.value))
 
@@ -236,22 +408,22 @@ class Franchise(GroupChatMixin, GroupFolderMixin):
         Create main 'Franchises' folder in root directory
         with read rights for 'Everybody' team
         """
-        nxc = get_nextcloud()
-        create_main_folder_res = nxc.create_group_folder(Franchise.GROUP_FOLDER)
+        create_main_folder_res = create_group_folder(Franchise.GROUP_FOLDER)
 
         main_folder_id = create_main_folder_res.data['id']
 
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 main_folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID)
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 main_folder_id, NEXTCLOUD_ADMIN_GROUP)
 
-        nxc.set_permissions_to_group_folder(
+        set_permissions_to_group_folder(
                 main_folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID,
                 str(NxcPermission.READ.value))
 
 
-class LdapFranchise(EdapMixin, Franchise):
+class LdapFranchise(EdapMixin, ProvisioningMixin, Franchise):
+    __slots__ = ('fqdn',)
 
     def __init__(self, fqdn=None, *args, **kwargs):
         self.fqdn = fqdn
@@ -260,20 +432,6 @@ class LdapFranchise(EdapMixin, Franchise):
     def __repr__(self):
         return f'<LdapFranchise(fqdn={self.fqdn})>'
 
-    def create(self):
-        """ Create franchise with self.machine_name, self.display_name, create corresponding teams """
-        self.add_to_edap()
-        self.create_teams()
-        # create group folder
-        folder_success = self.create_folder()
-        channel_res = self.create_channel()
-        return {
-            'rocket': channel_res,
-            'folder': {
-                'success': folder_success
-            }
-        }
-
     def add_to_edap(self):
         """ Create franchise entity in ldap """
         if LdapFranchise.check_exists_by_display_name(self.display_name):
@@ -296,10 +454,10 @@ class LdapFranchise(EdapMixin, Franchise):
         """
         from .serializers import edap_divisions_schema
         divisions = edap_divisions_schema.load(self.edap.get_divisions())
-        for division in divisions:
-            machine_name = self.edap.make_team_machine_name(self.machine_name, division.machine_name)
-            display_name = self.edap.make_team_display_name(self.display_name, division.display_name)
-            self.edap.create_team(machine_name, display_name)
+        teams = [(self.edap.make_team_machine_name(self.machine_name, division.machine_name),
+                  self.edap.make_team_display_name(self.display_name, division.display_name))
+                 for division in divisions]
+        return LdapTeam.create_many(teams)
 
     @staticmethod
     def check_exists_by_display_name(display_name):
@@ -334,10 +492,13 @@ class LdapFranchise(EdapMixin, Franchise):
 
 class Division(GroupChatMixin, GroupFolderMixin):
 
+    __slots__ = ('machine_name', 'display_name')
+
+    UNIT = DIVISIONS_UNIT
     GROUP_FOLDER = 'Divisions'
 
     def __init__(self, machine_name=None, display_name=None):
-        self.machine_name = machine_name
+        self.machine_name = intern_name(machine_name)
         self.display_name = display_name
 
     @property
@@ -353,23 +514,22 @@ class Division(GroupChatMixin, GroupFolderMixin):
         Create subfolder in 'Divisions' folder with read-write access to members of Division
         and read access for 'Everybody' team
         """
-        nxc = get_nextcloud()
         main_folder = get_group_folder(Division.GROUP_FOLDER)
 
         if not main_folder:
             Division.create_main_folder()
 
-        create_folder_res = nxc.create_group_folder(self.folder_path)
+        create_folder_res = create_group_folder(self.folder_path)
         folder_id = create_folder_res.data['id']
 
-        grant_access_res = nxc.grant_access_to_group_folder(
+        grant_access_res = grant_access_to_group_folder(
                 folder_id, self.machine_name)
-        grant_everybody_access = nxc.grant_access_to_group_folder(
+        grant_everybody_access = grant_access_to_group_folder(
                 folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID)
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 folder_id, NEXTCLOUD_ADMIN_GROUP)
 
-        nxc.set_permissions_to_group_folder(
+        set_permissions_to_group_folder(
                 folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID,
                 str(NxcPermission.READ.value))
 
@@ -381,22 +541,23 @@ class Division(GroupChatMixin, GroupFolderMixin):
         Create main 'Divisions' folder in root directory
         with read rights for 'Everybody' team
         """
-        nxc = get_nextcloud()
-        create_main_folder_res = nxc.create_group_folder(Division.GROUP_FOLDER)
+        create_main_folder_res = create_group_folder(Division.GROUP_FOLDER)
 
         main_folder_id = create_main_folder_res.data['id']
 
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 main_folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID)
-        nxc.grant_access_to_group_folder(
+        grant_access_to_group_folder(
                 main_folder_id, NEXTCLOUD_ADMIN_GROUP)
 
-        nxc.set_permissions_to_group_folder(
+        set_permissions_to_group_folder(
                 main_folder_id, LdapTeam.EVERYBODY_NEXTCLOUD_GROUP_ID,
                 str(NxcPermission.READ.value))
 
 
-class LdapDivision(EdapMixin, Division):
+class LdapDivision(EdapMixin, ProvisioningMixin, Division):
+    __slots__ = ('fqdn',)
+
     def __init__(self, fqdn=None, *args, **kwargs):
         self.fqdn = fqdn
         super(LdapDivision, self).__init__(*args, **kwargs)
@@ -408,19 +569,6 @@ class LdapDivision(EdapMixin, Division):
         """ Add division entity to edap """
         return self.edap.create_division(self.machine_name, display_name=self.display_name)
 
-    def create(self):
-        """ Create division with self.machine_name, self.display_name, create corresponding teams """
-        self.add_to_edap()
-        self.create_teams()
-        folder_success = self.create_folder()
-        channel_res = self.create_channel()
-        return {
-            'rocket': channel_res,
-            'folder': {
-                'success': folder_success
-            }
-        }
-
     def create_teams(self):
         """
          When a new division is created, an LDAP entry is created for it, and team entries are created as well,
@@ -430,10 +578,10 @@ class LdapDivision(EdapMixin, Division):
          """
         from .serializers import edap_franchises_schema
         franchises = edap_franchises_schema.load(self.edap.get_franchises())
-        for franchise in franchises:
-            machine_name = self.edap.make_team_machine_name(franchise.machine_name, self.machine_name)
-            display_name = self.edap.make_team_display_name(franchise.display_name, self.display_name)
-            self.edap.create_team(machine_name, display_name)
+        teams = [(self.edap.make_team_machine_name(franchise.machine_name, self.machine_name),
+                  self.edap.make_team_display_name(franchise.display_name, self.display_name))
+                 for franchise in franchises]
+        return LdapTeam.create_many(teams)
 
     def add_user(self, uid):
         self.edap.make_uid_member_of_division(uid, self.machine_name)
@@ -444,8 +592,10 @@ class LdapDivision(EdapMixin, Division):
 
 
 class Team:
+    __slots__ = ('machine_name', 'display_name')
+
     def __init__(self, machine_name=None, display_name=None):
-        self.machine_name = machine_name
+        self.machine_name = intern_name(machine_name)
         self.display_name = display_name
 
 
@@ -458,27 +608,112 @@ STRING_OPERATIONS = dict(
 
 
 class LdapTeam(EdapMixin, Team):
+    __slots__ = ('fqdn', 'nextcloud_string_operation')
 
     EVERYBODY_MACHINE_NAME = 'everybody'
     EVERYBODY_DISPLAY_NAME = 'Everybody'
     EVERYBODY_NEXTCLOUD_GROUP_ID = 'Everybody'
 
-    def __init__(self, fqdn=None, *args, **kwargs):
+    def __init__(self, fqdn=None, *args, nextcloud_string_operation='noop', **kwargs):
         self.fqdn = fqdn
-        self.n_conversion_fun = STRING_OPERATIONS["noop"]
-        if "nextcloud_string_operation" in kwargs:
-            self.n_conversion_fun = STRING_OPERATIONS[kwargs["nextcloud_string_operation"]]
-        self.EVERYBODY_NEXTCLOUD_GROUP_ID = self.n_conversion_fun(self.EVERYBODY_MACHINE_NAME)
+        self.nextcloud_string_operation = nextcloud_string_operation
         super(LdapTeam, self).__init__(*args, **kwargs)
 
+    @property
+    def n_conversion_fun(self):
+        return STRING_OPERATIONS[self.nextcloud_string_operation]
+
     def __repr__(self):
         return f'<LdapTeam(fqdn={self.fqdn}>'
 
     def get_team_components(self):
         from .serializers import edap_franchise_schema, edap_division_schema
-        franchise_json, division_json = self.edap.get_team_component_units(self.machine_name)
+        graph = get_org_graph()
+        units = graph.get_team_component_units(self.machine_name) if graph else None
+        franchise_json, division_json = units or self.edap.get_team_component_units(self.machine_name)
         return edap_franchise_schema.load(franchise_json), edap_division_schema.load(division_json)
 
+    @staticmethod
+    def create_many(teams, max_workers=None):
+        """
+        Create teams concurrently, with at most `max_workers` ldap adds in flight. Existing teams are skipped,
+        so it's safe to call it again after partial failure.
+
+        Args:
+            teams (list): (machine_name, display_name) tuples
+            max_workers (int): max number of simultaneous ldap adds, EDAP_BULK_CONCURRENCY setting by default
+
+        Returns (list): dicts with 'machine_name', 'status' (created, exists or failed) and 'message' for every team
+        """
+        edap = get_edap()
+        existing = {team['cn'][0].decode('utf-8') for team in edap.get_teams()}
+        max_workers = max_workers or current_app.config.get('EDAP_BULK_CONCURRENCY', 4)
+
+        def create(team):
+            machine_name, display_name = team
+            get_edap().create_team(machine_name, display_name)
+
+        to_create = [team for team in teams if team[0] not in existing]
+        results = [{'machine_name': machine_name, 'status': 'exists', 'message': None}
+                   for machine_name, _ in teams if machine_name in existing]
+        for (machine_name, _), _, exception in map_concurrently(create, to_create, max_workers=max_workers):
+            if exception is None:
+                results.append({'machine_name': machine_name, 'status': 'created', 'message': None})
+            elif isinstance(exception, ldap.ALREADY_EXISTS):
+                results.append({'machine_name': machine_name, 'status': 'exists', 'message': None})
+            else:
+                results.append({'machine_name': machine_name, 'status': 'failed', 'message': str(exception)})
+        return results
+
+    @staticmethod
+    def get_virtual_teams():
+        """
+        Get teams for every franchise x division combination, computed from franchises and divisions,
+        regardless whether team entry exists in ldap. Fqdn is the one team entry has or will have once created.
+        """
+        from .serializers import edap_franchises_schema, edap_divisions_schema
+        edap = get_edap()
+        franchises = edap_franchises_schema.load(edap.get_franchises())
+        divisions = edap_divisions_schema.load(edap.get_divisions())
+        teams = []
+        for franchise in franchises:
+            for division in divisions:
+                machine_name = edap.make_team_machine_name(franchise.machine_name, division.machine_name)
+                teams.append(LdapTeam(fqdn=f'cn={machine_name},{edap.unit_dn(TEAMS_UNIT)}',
+                                      machine_name=machine_name,
+                                      display_name=edap.make_team_display_name(franchise.display_name,
+                                                                               division.display_name)))
+        return teams
+
+    @staticmethod
+    def ensure_exists(machine_name):
+        """
+        Create franchise x division team entry if it doesn't exist yet, looking up only its franchise and division
+
+        Returns (dict): 'machine_name', 'status' (created or exists) and 'message' of team
+
+        Raises:
+            ObjectDoesNotExist: if team doesn't exist and there is no such franchise x division combination
+        """
+        edap = get_edap()
+        try:
+            edap.get_team(machine_name)
+            return {'machine_name': machine_name, 'status': 'exists', 'message': None}
+        except ObjectDoesNotExist:
+            pass
+        try:
+            franchise, division = LdapTeam(machine_name=machine_name).get_team_components()
+        except (ObjectDoesNotExist, ValueError):  # ValueError if machine name can't be split into components
+            raise ObjectDoesNotExist(f'Team {machine_name} does not exist')
+        try:
+            edap.create_team(machine_name, edap.make_team_display_name(franchise.display_name,
+                                                                       division.display_name))
+        except ldap.ALREADY_EXISTS:  # created concurrently
+            return {'machine_name': machine_name, 'status': 'exists', 'message': None}
+        except ldap.LDAPError as e:
+            raise ConstraintError(f'Failed to create team {machine_name}. {e}')
+        return {'machine_name': machine_name, 'status': 'created', 'message': None}
+
     @staticmethod
     def get_everybody_team():
         """ Get or create and return 'Everybody' Team """
@@ -490,3 +725,23 @@ class LdapTeam(EdapMixin, Team):
             edap.create_team(LdapTeam.EVERYBODY_MACHINE_NAME, LdapTeam.EVERYBODY_DISPLAY_NAME)
             everybody_team = edap.get_team(LdapTeam.EVERYBODY_MACHINE_NAME)
         return edap_team_schema.load(everybody_team)
+
+
+def sync_unit_channels(unit):
+    """
+    Sync chat channel members of all franchises or all divisions, one channel after another
+
+    Returns (dict): sync report or error 'message' by machine name
+    """
+    from .serializers import edap_franchises_schema, edap_divisions_schema
+    schema = {FRANCHISES_UNIT: edap_franchises_schema, DIVISIONS_UNIT: edap_divisions_schema}[unit]
+    reports = {}
+    for group in schema.load(get_unit_entries(unit)):
+        step = run_step(group.sync_channel_members)
+        reports[group.machine_name] = step['result'] if step['success'] else {'message': step['message']}
+    return reports
+
+
+def sync_channels_steps():
+    """ (name, callable) steps to sync chat channels of all franchises and divisions """
+    return [(unit, partial(sync_unit_channels, unit)) for unit in (FRANCHISES_UNIT, DIVISIONS_UNIT)]
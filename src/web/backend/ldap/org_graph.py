@@ -0,0 +1,284 @@
+""" In-memory index of users, org units and memberships, built from ldap subtree scan """
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from .edap_client import copy_entries
+from .paging import iter_pages
+from .utils import get_parent_unit, FRANCHISES_UNIT, DIVISIONS_UNIT, TEAMS_UNIT
+
+logger = logging.getLogger()
+
+ENTRIES_FILTER = '(|(objectClass=posixGroup)(uid=*))'
+ENTRIES_ATTRIBUTES = ['objectClass', 'uid', 'givenName', 'sn', 'mail', 'cn', 'description', 'memberUid',
+                      'modifyTimestamp']
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class OrgGraph:
+    """
+    Per-process snapshot of users, groups and memberUid edges between them.
+
+    Snapshot is built with single paged subtree search and then kept fresh by fetching only entries, which
+    modifyTimestamp is newer than the latest one seen. Deleted entries can't be found by such delta search, so
+    deletions done by TEAP are applied directly, and the whole snapshot is rebuilt every `full_refresh` seconds.
+
+    Once `start` is called, the snapshot is built and rebuilt in background thread, and requests only wait for
+    incremental refreshes.
+    """
+
+    def __init__(self, pool, max_age=30, full_refresh=3600, page_size=1000):
+        """
+        Args:
+            pool (EdapPool): pool to take connection for refreshes from
+            max_age (float): max seconds since last refresh for data to be served without refreshing it first
+            full_refresh (float): seconds after which snapshot is rebuilt from scratch
+            page_size (int): page size of subtree search
+        """
+        self.pool = pool
+        self.max_age = max_age
+        self.full_refresh = full_refresh
+        self.page_size = page_size
+
+        self._lock = threading.RLock()  # guards data
+        self._refresh_lock = threading.RLock()  # only one refresh at a time
+        self._users = {}  # uid -> entry
+        self._groups = {}  # fqdn -> entry
+        self._members = defaultdict(set)  # group fqdn -> uids
+        self._memberships = defaultdict(set)  # uid -> group fqdns
+        self._team_components = {}  # team machine name -> (franchise fqdn, division fqdn)
+        self._last_modified = None
+        self._refreshed_at = None
+        self._built_at = None
+        self._stale = False
+        self._refresher = None
+
+        # incremented when group is added or removed or its cn or description changes, to rebuild name indexes
+        self.names_version = 0
+        self.full_refreshes = 0
+        self.incremental_refreshes = 0
+
+    def start(self):
+        """ Build snapshot in background thread and rebuild it there every `full_refresh` seconds """
+        with self._refresh_lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._run_full_refreshes, name='org-graph-refresh',
+                                               daemon=True)
+            self._refresher.start()
+
+    def _run_full_refreshes(self):
+        while True:
+            try:
+                with self._refresh_lock:  # snapshot could be built by request, which came before this thread
+                    if self._seconds_to_full_refresh() <= 0:
+                        self.refresh(full=True)
+                delay = max(self._seconds_to_full_refresh(), 0)
+            except Exception as e:
+                logger.exception(f'Org graph full refresh failed: {e}')
+                delay = self.max_age
+            time.sleep(delay)
+
+    def _seconds_to_full_refresh(self):
+        with self._lock:
+            if self._built_at is None:
+                return 0
+            return self._built_at + self.full_refresh - time.monotonic()
+
+    def ensure_fresh(self):
+        """
+        Refresh snapshot if it was never built, is older than max_age or was changed by TEAP.
+        Request arriving while snapshot is built in background waits for the build.
+        """
+        if self._needed_refresh() is None:
+            return
+        with self._refresh_lock:
+            needed = self._needed_refresh()  # could be refreshed by another thread while waiting for lock
+            if needed is not None:
+                self.refresh(full=needed == 'full')
+
+    def refresh(self, full=False):
+        """ Fetch entries changed since last refresh, or rebuild snapshot from scratch if `full` """
+        with self._refresh_lock:
+            started = time.monotonic()
+            with self._lock:
+                self._stale = False  # writes done during refresh will make snapshot stale again
+                search_filter = ENTRIES_FILTER
+                if not full and self._last_modified:
+                    search_filter = f'(&{ENTRIES_FILTER}(modifyTimestamp>={self._last_modified}))'
+            with self.pool.connection() as edap:
+                entries = [entry
+                           for page in iter_pages(edap.ldap, edap.domain_dn, search_filter,
+                                                  attrlist=ENTRIES_ATTRIBUTES, page_size=self.page_size)
+                           for entry in page]
+                with self._lock:
+                    names = self._group_names()
+                    if full:
+                        self._clear()
+                    for entry in entries:
+                        self._add_entry(entry)
+                    if self._group_names() != names:
+                        self.names_version += 1
+                    self._index_team_components(edap)
+                    self._refreshed_at = time.monotonic()
+                    if full:
+                        self._built_at = self._refreshed_at
+                        self.full_refreshes += 1
+                    else:
+                        self.incremental_refreshes += 1
+            logger.info(f'Org graph {"full" if full else "incremental"} refresh: {len(entries)} entries '
+                        f'in {time.monotonic() - started:.3f}s')
+
+    def _needed_refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._built_at is None:
+                return 'full'
+            if self._refresher is None and now - self._built_at > self.full_refresh:
+                return 'full'
+            if self._stale or now - self._refreshed_at > self.max_age:
+                return 'incremental'
+        return None
+
+    def on_write(self, method_name, *args, succeeded=True):
+        """
+        Apply change done through edap client, make next read refresh changed entries.
+        Failed write could still have changed something, so it only makes next read refresh.
+        """
+        with self._lock:
+            self._stale = True
+            if not succeeded or not args:
+                return
+            if method_name == 'delete_user':
+                self._remove_user(args[0])
+            elif method_name == 'delete_team':
+                self._remove_group(TEAMS_UNIT, args[0])
+            elif method_name == 'delete_division':
+                self._remove_group(DIVISIONS_UNIT, args[0])
+
+    def get_users(self):
+        self.ensure_fresh()
+        with self._lock:
+            return copy_entries(list(self._users.values()))
+
+    def get_user(self, uid):
+        """ Get user entry or None if user doesn't exist """
+        self.ensure_fresh()
+        with self._lock:
+            user = self._users.get(uid)
+            return dict(user) if user else None
+
+    def get_groups(self, unit=None, query=None, attribute='description'):
+        """
+        Get group entries
+
+        Args:
+            unit (str): only groups from this organizational unit if passed
+            query (str): only groups which `attribute` starts with query, case insensitive
+            attribute (str): attribute to filter by
+        """
+        self.ensure_fresh()
+        query = query.lower() if query else None
+
+        def matches(group):
+            if unit is not None and get_parent_unit(group['fqdn']) != unit:
+                return False
+            return not query or any(_decode(value).lower().startswith(query) for value in group.get(attribute, []))
+
+        with self._lock:
+            return copy_entries([group for group in self._groups.values() if matches(group)])
+
+    def get_user_groups(self, uid):
+        self.ensure_fresh()
+        with self._lock:
+            return copy_entries([self._groups[fqdn] for fqdn in self._memberships.get(uid, ())
+                                 if fqdn in self._groups])
+
+    def get_members(self, unit, machine_name):
+        """ Get sorted uids of members of unit's group, None if there is no such group """
+        self.ensure_fresh()
+        with self._lock:
+            for fqdn, group in self._groups.items():
+                if get_parent_unit(fqdn) == unit and _decode(group['cn'][0]) == machine_name:
+                    return sorted(self._members.get(fqdn, ()))
+        return None
+
+    def get_team_component_units(self, team_machine_name):
+        """ Get (franchise, division) entries of team or None if it's not franchise x division team """
+        self.ensure_fresh()
+        with self._lock:
+            components = self._team_components.get(team_machine_name)
+            if not components or any(fqdn not in self._groups for fqdn in components):
+                return None
+            return copy_entries(tuple(self._groups[fqdn] for fqdn in components))
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'users': len(self._users),
+                'groups': len(self._groups),
+                'memberships': sum(len(uids) for uids in self._members.values()),
+                'age': round(now - self._refreshed_at, 3) if self._refreshed_at is not None else None,
+                'max_age': self.max_age,
+                'stale': self._stale,
+                'last_modified': self._last_modified,
+                'full_refreshes': self.full_refreshes,
+                'incremental_refreshes': self.incremental_refreshes,
+            }
+
+    def _clear(self):
+        self._users = {}
+        self._groups = {}
+        self._members = defaultdict(set)
+        self._memberships = defaultdict(set)
+        self._last_modified = None
+
+    def _add_entry(self, entry):
+        modified = _decode(entry.pop('modifyTimestamp', [None])[0])
+        if modified and (self._last_modified is None or modified > self._last_modified):
+            self._last_modified = modified
+
+        if b'posixGroup' in entry.get('objectClass', []):
+            fqdn = entry['fqdn']
+            for uid in self._members.pop(fqdn, ()):
+                self._memberships[uid].discard(fqdn)
+            self._groups[fqdn] = entry
+            # the same uids appear in many groups, keep single copy of each; members are only kept in the index,
+            # so that group entries are served without them, like from edap client
+            for uid in map(sys.intern, map(_decode, entry.pop('memberUid', []))):
+                self._members[fqdn].add(uid)
+                self._memberships[uid].add(fqdn)
+        elif entry.get('uid'):
+            self._users[sys.intern(_decode(entry['uid'][0]))] = entry
+
+    def _remove_user(self, uid):
+        self._users.pop(uid, None)
+        for fqdn in self._memberships.pop(uid, ()):
+            self._members[fqdn].discard(uid)
+
+    def _remove_group(self, unit, machine_name):
+        for fqdn, group in list(self._groups.items()):
+            if get_parent_unit(fqdn) == unit and _decode(group['cn'][0]) == machine_name:
+                del self._groups[fqdn]
+                self.names_version += 1
+                for uid in self._members.pop(fqdn, ()):
+                    self._memberships[uid].discard(fqdn)
+
+    def _group_names(self):
+        return {fqdn: (group.get('cn'), group.get('description')) for fqdn, group in self._groups.items()}
+
+    def _index_team_components(self, edap):
+        franchises = [group for group in self._groups.values() if get_parent_unit(group['fqdn']) == FRANCHISES_UNIT]
+        divisions = [group for group in self._groups.values() if get_parent_unit(group['fqdn']) == DIVISIONS_UNIT]
+        self._team_components = {
+            edap.make_team_machine_name(_decode(franchise['cn'][0]), _decode(division['cn'][0])):
+                (franchise['fqdn'], division['fqdn'])
+            for franchise in franchises
+            for division in divisions
+        }
@@ -0,0 +1,110 @@
+""" Paged ldap searches using Simple Paged Results control (RFC 2696) with optional server side sorting (RFC 2891) """
+import bisect
+import logging
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.filter import escape_filter_chars
+
+logger = logging.getLogger()
+
+# max number of values in single `(|(uid=...)(uid=...))` filter
+KEYS_PER_FILTER = 100
+
+
+def search_page(conn, base_dn, search_filter, attrlist=None, page_size=100, cookie=b'', sort_by=None):
+    """
+    Fetch single page of search results
+
+    Args:
+        conn (ldap.ldapobject.LDAPObject): bound ldap connection
+        base_dn (str): search base
+        search_filter (str): ldap filter
+        attrlist (list): attributes to fetch, all if None
+        page_size (int): max number of entries on page
+        cookie (bytes): cookie of previous page, empty for the first page
+        sort_by (str): attribute to sort by on server side, not critical if server doesn't support sorting
+
+    Returns (tuple): (entries in edap format, cookie of next page, empty if it was the last page)
+    """
+    controls = [SimplePagedResultsControl(True, size=page_size, cookie=cookie)]
+    if sort_by:
+        controls.append(SSSRequestControl(criticality=False, ordering_rules=[sort_by]))
+    msgid = conn.search_ext(base_dn, ldap.SCOPE_SUBTREE, search_filter, attrlist=attrlist, serverctrls=controls)
+    _, data, _, response_controls = conn.result3(msgid)
+
+    next_cookie = b''
+    for control in response_controls:
+        if control.controlType == SimplePagedResultsControl.controlType:
+            next_cookie = control.cookie
+    entries = [{'fqdn': dn, **attrs} for dn, attrs in data if dn]  # references don't have dn
+    return entries, next_cookie
+
+
+def iter_pages(conn, base_dn, search_filter, attrlist=None, page_size=100, sort_by=None):
+    """
+    Iterate over all pages of search results, fetching next page only when previous one is consumed.
+    Search is abandoned on server if iteration is stopped early, e.g. when streaming client disconnects.
+    """
+    cookie = b''
+    while True:
+        entries, cookie = search_page(conn, base_dn, search_filter, attrlist=attrlist, page_size=page_size,
+                                      cookie=cookie, sort_by=sort_by)
+        try:
+            yield entries
+        except GeneratorExit:
+            if cookie:
+                abandon_search(conn, base_dn, search_filter, cookie, sort_by=sort_by)
+            raise
+        if not cookie:
+            break
+
+
+def abandon_search(conn, base_dn, search_filter, cookie, sort_by=None):
+    """ Release server side state of unfinished paged search by requesting page of size 0 """
+    try:
+        search_page(conn, base_dn, search_filter, attrlist=['1.1'], page_size=0, cookie=cookie, sort_by=sort_by)
+    except ldap.LDAPError as e:
+        logger.warning(f'Failed to abandon paged search: {e}')
+
+
+def _first_value(entry, attribute):
+    values = entry.get(attribute) or [b'']
+    return values[0].decode('utf-8') if isinstance(values[0], bytes) else values[0]
+
+
+def search_after(conn, base_dn, search_filter, attrlist=None, page_size=100, sort_by='uid', after=None,
+                 scan_page_size=1000):
+    """
+    Fetch page of entries sorted by `sort_by` attribute, which value is greater than `after`.
+
+    Cursor is the last value of page, nothing is kept on server or in process between pages, so next page can be
+    fetched with any connection by any web worker. Server has to support only Simple Paged Results control:
+    attributes like uid usually have no ORDERING matching rule, so neither `(uid>=...)` filters nor server side
+    sorting can be relied on. Instead `sort_by` values of all matching entries are fetched (without any other
+    attributes) and sorted case-insensitively in process, and then entries of the page are fetched by their values.
+
+    Returns (tuple): (entries, `after` value for the next page or None if it was the last page)
+    """
+    keys = sorted((_first_value(entry, sort_by)
+                   for page in iter_pages(conn, base_dn, search_filter, attrlist=[sort_by], page_size=scan_page_size)
+                   for entry in page), key=str.lower)
+    start = bisect.bisect_right([key.lower() for key in keys], after.lower()) if after else 0
+    page_keys = keys[start:start + page_size]
+
+    position = {key.lower(): index for index, key in enumerate(page_keys)}
+    entries = []
+    for chunk_start in range(0, len(page_keys), KEYS_PER_FILTER):
+        chunk = page_keys[chunk_start:chunk_start + KEYS_PER_FILTER]
+        keys_filter = ''.join(f'({sort_by}={escape_filter_chars(key)})' for key in chunk)
+        for page in iter_pages(conn, base_dn, f'(&{search_filter}(|{keys_filter}))', attrlist=attrlist,
+                               page_size=len(chunk)):
+            entries.extend(page)
+    # entries changed between the two searches are left out
+    entries = sorted((entry for entry in entries if _first_value(entry, sort_by).lower() in position),
+                     key=lambda entry: position[_first_value(entry, sort_by).lower()])
+
+    if start + page_size < len(keys):
+        return entries, page_keys[-1]
+    return entries, None
@@ -0,0 +1,192 @@
+""" Process-wide pool of bound Edap connections, shared between requests """
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import ldap
+
+logger = logging.getLogger()
+
+# errors after which connection can't be trusted anymore, it's closed instead of being returned to the pool
+BROKEN_CONNECTION_ERRORS = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT)
+
+
+class PoolTimeout(Exception):
+    """ No connection became available in the pool within timeout """
+
+
+class ErrorTrackingConnection:
+    """
+    Proxy of ldap connection, which remembers if any call failed with connection error.
+
+    Views and steps catch ldap errors in many places, so the error often doesn't reach the end of app context.
+    Pool checks the flag on checkin and discards broken connection instead of handing it to the next request.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.broken = False
+
+    def __getattr__(self, name):
+        attr = getattr(self.conn, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            except BROKEN_CONNECTION_ERRORS:
+                self.broken = True
+                raise
+        return call
+
+
+class EdapPool:
+    """
+    Thread-safe pool of long-lived Edap instances.
+
+    Connections are created lazily up to `size`, checked out for the duration of a unit of work and returned
+    afterwards. Connection that was idle longer than `keepalive` seconds is health-checked before it is handed out,
+    and dropped connections are replaced with a freshly bound one.
+    """
+
+    def __init__(self, factory, size=10, timeout=5, keepalive=60):
+        """
+        Args:
+            factory (callable): creates new bound Edap instance
+            size (int): max number of connections
+            timeout (float): seconds to wait for a free connection
+            keepalive (float): seconds of idleness after which connection is checked before use
+        """
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.keepalive = keepalive
+
+        self._idle = []  # list of (edap, last_used) tuples, most recently used last
+        self._created = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def checkout(self):
+        """ Take connection from the pool, create new one if pool is not full yet """
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                if self._idle:
+                    edap, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    edap, last_used = None, None
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise PoolTimeout(f'No free ldap connection in pool after {self.timeout} seconds')
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if edap is None:
+                edap = self.factory()
+            elif time.monotonic() - last_used > self.keepalive and not self._is_alive(edap):
+                logger.info('Idle ldap connection is dead, reconnecting')
+                self._close(edap)
+                edap = self.factory()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return edap
+
+    def checkin(self, edap, discard=False):
+        """
+        Return connection to the pool
+
+        Args:
+            edap (Edap): connection received from `checkout`
+            discard (bool): close connection instead of reusing it, e.g. when server went down
+        """
+        discard = discard or self._is_broken(edap)
+        if discard:
+            self._close(edap)
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+            else:
+                self._idle.append((edap, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """ Context manager to checkout connection and return it back to the pool afterwards """
+        edap = self.checkout()
+        discard = False
+        try:
+            yield edap
+        except BROKEN_CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.checkin(edap, discard=discard)
+
+    def clear(self):
+        """ Close all idle connections """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for edap, _ in idle:
+            self._close(edap)
+
+    def stats(self):
+        """ Pool usage statistics """
+        with self._cond:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'reconnects': self._reconnects,
+                'wait_total': round(self._wait_total, 6),
+                'wait_avg': round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+                'wait_max': round(self._wait_max, 6),
+            }
+
+    @staticmethod
+    def _is_broken(edap):
+        # only connections wrapped in ErrorTrackingConnection know about their failures
+        return getattr(edap.ldap, 'broken', False) is True
+
+    @staticmethod
+    def _is_alive(edap):
+        try:
+            edap.ldap.whoami_s()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    @staticmethod
+    def _close(edap):
+        try:
+            edap.ldap.unbind_s()
+        except ldap.LDAPError:
+            pass
@@ -0,0 +1,81 @@
+""" Case insensitive prefix index over group names for typeahead search """
+import heapq
+from bisect import bisect_left
+
+from .edap_client import copy_entries
+
+# match kinds, lower is better
+FULL_MATCH = 0
+DISPLAY_NAME_PREFIX = 1
+MACHINE_NAME_PREFIX = 2
+WORD_PREFIX = 3
+
+
+def _first_value(entry, attribute):
+    values = entry.get(attribute) or [b'']
+    value = values[0]
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class PrefixIndex:
+    """
+    Sorted array of lowercase display names, machine names and display name words, searched with bisect.
+
+    Results are ranked by match kind (full name match, display name prefix, machine name prefix, prefix of a word
+    inside display name), then by display name length and alphabetically.
+    """
+
+    def __init__(self, entries, display_attribute='description', machine_attribute='cn'):
+        """
+        Args:
+            entries (list): edap group entries
+            display_attribute (str): attribute with display name
+            machine_attribute (str): attribute with machine name
+        """
+        self.entries = entries
+        self._display_names = [_first_value(entry, display_attribute) for entry in entries]
+
+        keys = []
+        for position, entry in enumerate(entries):
+            display_name = self._display_names[position].lower()
+            machine_name = _first_value(entry, machine_attribute).lower()
+            if display_name:
+                keys.append((display_name, DISPLAY_NAME_PREFIX, position))
+                keys.extend((word, WORD_PREFIX, position) for word in display_name.split()[1:])
+            if machine_name:
+                keys.append((machine_name, MACHINE_NAME_PREFIX, position))
+        keys.sort()
+        self._keys = [key for key, _, _ in keys]
+        self._refs = [(kind, position) for _, kind, position in keys]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=None):
+        """
+        Get entries which display name, machine name or a word of display name starts with query
+
+        Args:
+            query (str): name prefix, case insensitive
+            limit (int): max number of best ranked entries to return, all if None
+
+        Returns (list): copies of matching edap entries, best matches first
+        """
+        query = query.lower()
+        ranks = {}
+        index = bisect_left(self._keys, query)
+        while index < len(self._keys) and self._keys[index].startswith(query):
+            kind, position = self._refs[index]
+            rank = FULL_MATCH if kind != WORD_PREFIX and self._keys[index] == query else kind
+            if rank < ranks.get(position, WORD_PREFIX + 1):
+                ranks[position] = rank
+            index += 1
+
+        def sort_key(position):
+            return ranks[position], len(self._display_names[position]), self._display_names[position].lower()
+
+        if limit:
+            positions = heapq.nsmallest(limit, ranks, key=sort_key)
+        else:
+            positions = sorted(ranks, key=sort_key)
+        return copy_entries([self.entries[position] for position in positions])
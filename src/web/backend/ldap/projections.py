@@ -0,0 +1,44 @@
+"""
+Single pass projections of edap entries straight to api json, for list endpoints.
+
+Produce the same output as loading entries with .serializers schemas and dumping resulting models with
+.api_serializers schemas, without building intermediate model objects.
+"""
+
+
+def first_text(values):
+    """ First value of ldap attribute as text, None if attribute is missing or empty """
+    if not values:
+        return None
+    value = values[0]
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def project_user(entry):
+    """ Project edap user entry to api_user_schema json """
+    get = entry.get
+    return {
+        'uid': first_text(get('uid')),
+        'name': first_text(get('givenName')),
+        'mail': first_text(get('mail')),
+        'surname': first_text(get('sn')),
+        'groups': None,
+    }
+
+
+def project_group(entry):
+    """ Project edap franchise, division or team entry to api_franchise/division/team_schema json """
+    get = entry.get
+    return {
+        'fqdn': get('fqdn'),
+        'machineName': first_text(get('cn')),
+        'displayName': first_text(get('description')),
+    }
+
+
+def project_users(entries):
+    return [project_user(entry) for entry in entries]
+
+
+def project_groups(entries):
+    return [project_group(entry) for entry in entries]
@@ -1,29 +1,174 @@
 import logging
 
 from flask import g, current_app
-from edap import Edap, ObjectDoesNotExist
+from edap import ObjectDoesNotExist
 import configparser
+import ldap
+import ldap.dn
+
+from ..cache import TTLCache
+from .edap_client import TeapEdap, FRANCHISES_UNIT, DIVISIONS_UNIT, TEAMS_UNIT
+from .pool import EdapPool, ErrorTrackingConnection, BROKEN_CONNECTION_ERRORS
+from .prefix_index import PrefixIndex
 
 logger = logging.getLogger()
 
 
+def create_edap(config, cache=None, org_graph=None, photo_cache=None):
+    """ Create new bound Edap instance from app config, which connection reports its failures to the pool """
+    edap = TeapEdap(config['EDAP_HOSTNAME'],
+                    config['EDAP_USER'],
+                    config['EDAP_PASSWORD'],
+                    config['EDAP_DOMAIN'],
+                    cache=cache,
+                    org_graph=org_graph,
+                    photo_cache=photo_cache)
+    edap.ldap = ErrorTrackingConnection(edap.ldap)
+    return edap
+
+
+def init_edap_pool(app):
+    """ Create process-wide edap connections pool and return connections to it at the end of app context """
+    cache = TTLCache(maxsize=app.config.get('EDAP_CACHE_SIZE', 256), ttl=app.config.get('EDAP_CACHE_TTL', 300))
+    app.extensions['edap_cache'] = cache
+    photo_cache = TTLCache(maxsize=app.config.get('EDAP_PHOTO_CACHE_SIZE', 256),
+                           ttl=app.config.get('EDAP_PHOTO_CACHE_TTL', 3600))
+    app.extensions['edap_photo_cache'] = photo_cache
+    pool = EdapPool(factory=lambda: create_edap(app.config, cache=cache, org_graph=app.extensions.get('org_graph'),
+                                                photo_cache=photo_cache),
+                    size=app.config.get('EDAP_POOL_SIZE', 10),
+                    timeout=app.config.get('EDAP_POOL_TIMEOUT', 5),
+                    keepalive=app.config.get('EDAP_POOL_KEEPALIVE', 60))
+    app.extensions['edap_pool'] = pool
+    app.teardown_appcontext(release_edap)
+    return pool
+
+
+def init_org_graph(app):
+    """ Create in-memory org graph, if it's enabled in settings, and start building it in background """
+    from .org_graph import OrgGraph
+    graph = None
+    if app.config.get('EDAP_ORG_GRAPH', False):
+        graph = OrgGraph(app.extensions['edap_pool'],
+                         max_age=app.config.get('EDAP_ORG_GRAPH_MAX_AGE', 30),
+                         full_refresh=app.config.get('EDAP_ORG_GRAPH_FULL_REFRESH', 3600),
+                         page_size=app.config.get('EDAP_PAGE_SIZE', 500))
+        graph.start()
+    app.extensions['org_graph'] = graph
+    return graph
+
+
+def get_org_graph():
+    """ Get in-memory org graph, None if it's disabled """
+    return current_app.extensions.get('org_graph')
+
+
+def get_edap_pool():
+    return current_app.extensions['edap_pool']
+
+
+def get_edap_cache():
+    return current_app.extensions['edap_cache']
+
+
+def get_edap_photo_cache():
+    return current_app.extensions['edap_photo_cache']
+
+
 def get_edap():
-    """ Create if doesn't exist or return edap from flask g object """
+    """ Checkout edap connection from pool if it wasn't taken in current context yet, store it in flask g object """
     if 'edap' not in g:
-        g.edap = Edap(current_app.config['EDAP_HOSTNAME'],
-                      current_app.config['EDAP_USER'],
-                      current_app.config['EDAP_PASSWORD'],
-                      current_app.config['EDAP_DOMAIN'])
+        g.edap = get_edap_pool().checkout()
     return g.edap
 
 
+def release_edap(exc=None):
+    """ Return edap connection taken in current context back to pool """
+    edap = g.pop('edap', None)
+    if edap is not None:
+        get_edap_pool().checkin(edap, discard=isinstance(exc, BROKEN_CONNECTION_ERRORS))
+
+
 class EdapMixin:
+    __slots__ = ()
 
     @property
     def edap(self):
         return get_edap()
 
 
+def get_unit_entries(unit=None):
+    """
+    Get all franchises, divisions or teams edap entries, all groups if unit is None.
+    Answered from org graph if it's enabled, from ldap otherwise.
+    """
+    graph = get_org_graph()
+    if graph:
+        return graph.get_groups(unit)
+    edap = get_edap()
+    getters = {
+        FRANCHISES_UNIT: edap.get_franchises,
+        DIVISIONS_UNIT: edap.get_divisions,
+        TEAMS_UNIT: edap.get_teams,
+        None: edap.get_groups,
+    }
+    return getters[unit]()
+
+
+def get_group_members(unit, machine_name):
+    """
+    Get sorted uids of members of franchise, division or team, None if there is no such group.
+    Answered from org graph if it's enabled, from ldap otherwise.
+    """
+    graph = get_org_graph()
+    if graph:
+        return graph.get_members(unit, machine_name)
+    try:
+        return get_edap().get_group_members(unit, machine_name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def get_prefix_index(unit=None):
+    """
+    Get prefix index over names of franchises, divisions or teams (all groups if unit is None).
+    Index is kept in org units cache, so it's rebuilt when they are changed by TEAP or cache entry expires,
+    or, if org graph is enabled, when names of graph groups change.
+    """
+    graph = get_org_graph()
+    names_version = None
+    if graph:
+        graph.ensure_fresh()
+        names_version = graph.names_version
+    cache = get_edap_cache()
+    key = ('prefix_index', unit)
+
+    def build():
+        return names_version, PrefixIndex(get_unit_entries(unit))
+
+    version, index = cache.get_or_set(key, build)
+    if version != names_version:
+        cache.invalidate(key)
+        version, index = cache.get_or_set(key, build)
+    return index
+
+
+def search_org_units(unit, query=None, limit=None):
+    """
+    Get franchises, divisions or teams edap entries, which display name, machine name or a word of
+    display name starts with query, best matches first
+
+    Args:
+        unit (str): FRANCHISES_UNIT, DIVISIONS_UNIT or TEAMS_UNIT, all groups if None
+        query (str): name prefix
+        limit (int): max number of entries to return
+    """
+    if not query:
+        entries = get_unit_entries(unit)
+        return entries[:limit] if limit else entries
+    return get_prefix_index(unit).search(query, limit=limit)
+
+
 def get_config_divisions():
     """ Get divisions from config file `ldap.ini` where key is division machine_name, value is display name """
     config = configparser.ConfigParser()
@@ -68,6 +213,38 @@ def merge_divisions(config_divisions, ldap_divisions):
     return divisions
 
 
+def get_parent_unit(fqdn):
+    """
+    Get name of organizational unit which contains ldap entry, e.g. 'divisions' for cn=it,ou=divisions,dc=example,dc=com
+
+    Args:
+        fqdn (str): distinguished name of entry
+
+    Returns (str): lowercase unit name or None for top level entries
+    """
+    rdns = ldap.dn.str2dn(fqdn)
+    if len(rdns) < 2:
+        return None
+    return rdns[1][0][1].lower()
+
+
+def classify_groups(groups):
+    """
+    Split posix groups to franchises, divisions and teams by organizational unit they are stored in
+
+    Args:
+        groups (list): edap group entries, each having 'fqdn' key
+
+    Returns (dict): edap entries by unit name, groups from other units are omitted
+    """
+    units = {FRANCHISES_UNIT: [], DIVISIONS_UNIT: [], TEAMS_UNIT: []}
+    for group in groups:
+        unit = get_parent_unit(group['fqdn'])
+        if unit in units:
+            units[unit].append(group)
+    return units
+
+
 def check_consistency():
     """ Check if all required system objects exist in Edap """
     edap = get_edap()
@@ -1 +1,8 @@
 from . import api
+
+
+def initialize_module(app):
+    from . import utils
+    utils.init_nextcloud(app)
+    utils.init_ldap_cache_flusher(app)
+    utils.init_group_folder_index(app)
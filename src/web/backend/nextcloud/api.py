@@ -4,9 +4,9 @@ from flask.views import MethodView
 from edap import ConstraintError, MultipleObjectsFound, ObjectDoesNotExist
 
 from ..utils import EncoderWithBytes
-from ..ldap.utils import EdapMixin
+from ..ldap.utils import EdapMixin, search_org_units
 
-from .utils import get_nextcloud, flush_nextcloud_ldap_cache
+from .utils import get_nextcloud, request_ldap_cache_flush, nextcloud_stats
 
 blueprint = Blueprint('nextcloud_api', __name__, url_prefix='/api')
 blueprint.json_encoder = EncoderWithBytes
@@ -36,8 +36,7 @@ class GroupListViewSet(NextCloudMixin,
     def get(self):
         """ List groups """
         query = request.args.get('query')
-        search = f'cn={query}*' if query else None
-        res = self.edap.get_groups(search=search)
+        res = search_org_units(None, query, limit=request.args.get('limit', type=int))
         return jsonify([obj for obj in res]), 200
 
     def post(self, group_name=None):
@@ -46,7 +45,7 @@ class GroupListViewSet(NextCloudMixin,
         if not group_name:
             return jsonify({'message': 'group_name is required'}), 400
         res = self.nextcloud.add_group(group_name)
-        flush_nextcloud_ldap_cache(self.nextcloud)
+        request_ldap_cache_flush()
         return self.nxc_response(res), 201
 
     def delete(self):
@@ -65,7 +64,7 @@ class GroupListViewSet(NextCloudMixin,
                     self.nextcloud.delete_group(group_name)
             else:
                 self.nextcloud.delete_group(group_name)
-        flush_nextcloud_ldap_cache(self.nextcloud)
+        request_ldap_cache_flush()
 
         return jsonify({"message": "ok"}), 202
 
@@ -87,7 +86,7 @@ class GroupViewSet(NextCloudMixin, EdapMixin, MethodView):
     def delete(self, group_name, username=None):
         """ Delete group """
         res = self.nextcloud.delete_group(group_name)
-        flush_nextcloud_ldap_cache(self.nextcloud)
+        request_ldap_cache_flush()
         return self.nxc_response(res), 202
 
 
@@ -116,6 +115,11 @@ class GroupSubadminViewSet(NextCloudMixin, MethodView):
         return self.nxc_response(res), 202
 
 
+def nextcloud_stats_view():
+    """ Nextcloud connections reuse, clients, ldap cache flushes and group folders index statistics """
+    return jsonify(nextcloud_stats())
+
+
 group_list_view = GroupListViewSet.as_view('groups_api')
 blueprint.add_url_rule('/groups/', view_func=group_list_view, methods=["GET", "POST", "DELETE"])
 
@@ -125,3 +129,5 @@ blueprint.add_url_rule('/groups/<group_name>', view_func=group_view, methods=["G
 group_subadmins_view = GroupSubadminViewSet.as_view('group_subadmins_api')
 blueprint.add_url_rule('/groups/<group_name>/subadmins', view_func=group_view, methods=["POST", "DELETE"])
 blueprint.add_url_rule('/groups/<group_name>/subadmins/<username>', view_func=group_view, methods=["DELETE"])
+
+blueprint.add_url_rule('/nextcloud/stats', view_func=nextcloud_stats_view, methods=['GET'])
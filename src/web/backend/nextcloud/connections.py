@@ -0,0 +1,130 @@
+""" Keep-alive HTTP connections to Nextcloud, shared by all Nextcloud clients of the process """
+import threading
+from http.cookiejar import CookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class BlockCookies(CookiePolicy):
+    """ Don't keep cookies between calls, every call is authenticated on its own as with plain `requests.get` """
+    return_ok = set_ok = domain_return_ok = path_return_ok = lambda self, *args, **kwargs: False
+    netscape = True
+    rfc2965 = hide_cookie2 = False
+
+
+class NextcloudHttp:
+    """
+    Drop-in replacement of `requests` module for nextcloud-API.
+
+    nextcloud-API calls module level `requests.get`, `requests.post` etc., which open new connection (and do TLS
+    handshake) for every call. Here calls go through one thread-safe session with connection pool instead, so
+    connections are kept alive and reused between calls, requests and threads. Anything else (exceptions etc.)
+    is taken from `requests`.
+    """
+
+    def __init__(self, pool_size=10, timeout=30, retries=0, keepalive=True):
+        """
+        Args:
+            pool_size (int): max number of connections kept to Nextcloud
+            timeout (float): seconds to wait for connection and for response, if call doesn't set its own
+            retries (int): number of retries of failed connections
+            keepalive (bool): keep connections open between calls
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.cookies.set_policy(BlockCookies())
+        if not keepalive:
+            self.session.headers['Connection'] = 'close'
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.calls += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        return self.request('GET', url, params=params, **kwargs)
+
+    def options(self, url, **kwargs):
+        return self.request('OPTIONS', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request('POST', url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request('PATCH', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def stats(self):
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        opened = sum(pool.num_connections for pool in pools)
+        sent = sum(pool.num_requests for pool in pools)
+        return {
+            'calls': self.calls,
+            'connections_opened': opened,
+            'connections_reused': max(sent - opened, 0),
+            'reuse_ratio': round(1 - opened / sent, 3) if sent else None,
+            'pool_size': self.pool_size,
+            'timeout': self.timeout,
+        }
+
+
+class NextcloudClients:
+    """
+    Nextcloud clients that share keep-alive connections, one client per thread and reused by all requests
+    served by the thread: client keeps per call state (url of api it calls), so it can't be shared between threads.
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory (callable): creates new NextCloud client
+        """
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def get(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.factory()
+            with self._lock:
+                self.created += 1
+        return client
+
+    def stats(self):
+        return {'clients': self.created}
+
+
+def install(http):
+    """
+    Route HTTP calls of nextcloud-API through `http`
+
+    nextcloud-API clients don't accept session or requester to use: every call is made with module level
+    `requests.get`, `requests.post` etc. of `nextcloud.requester`, so `requests` of this module is the only patch
+    point. Tests check that no other module of the library uses `requests`, fix this function if they fail after
+    nextcloud-API upgrade.
+    """
+    from nextcloud import requester
+    requester.requests = http
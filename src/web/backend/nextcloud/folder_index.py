@@ -0,0 +1,102 @@
+""" Index of Nextcloud group folders by mount point, shared between requests """
+import threading
+import time
+
+
+class GroupFolderIndex:
+    """
+    Mount point -> folder id and groups access of Nextcloud group folders.
+
+    Index is built from full group folders listing and rebuilt when it's older than `ttl` or when looked up mount
+    point is missing (folder could be created outside of TEAP), but not more often than every `miss_refresh`
+    seconds. Folders created and access granted by TEAP are applied in place.
+    """
+
+    def __init__(self, ttl=300, miss_refresh=5):
+        """
+        Args:
+            ttl (float): seconds after which index is rebuilt on next lookup
+            miss_refresh (float): min seconds between rebuilds caused by lookups of missing mount points
+        """
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self._lock = threading.RLock()  # guards data
+        self._refresh_lock = threading.Lock()  # only one refresh at a time
+        self._folders = {}  # mount point -> {'id': folder id, 'groups': {group id: permissions}}
+        self._ids = {}  # folder id -> mount point
+        self._refreshed_at = None
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self, nxc):
+        """ Rebuild index from full group folders listing, lookups are served from old index meanwhile """
+        with self._refresh_lock:
+            self._refresh(nxc)
+
+    def _refresh(self, nxc):
+        # if there are no group folders, response data is empty list
+        data = nxc.get_group_folders().data or {}
+        folders = {folder_info['mount_point']: {'id': str(folder_id), 'groups': dict(folder_info.get('groups') or {})}
+                   for folder_id, folder_info in data.items()}
+        with self._lock:
+            self._folders = folders
+            self._ids = {folder['id']: mount_point for mount_point, folder in folders.items()}
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+
+    def _needs_refresh(self, mount_point):
+        with self._lock:
+            if self._refreshed_at is None:
+                return True
+            age = time.monotonic() - self._refreshed_at
+            return age > self.ttl or (mount_point not in self._folders and age > self.miss_refresh)
+
+    def get(self, nxc, mount_point):
+        """
+        Get folder by mount point
+
+        Args:
+            nxc (NextCloud): client to rebuild index with, if it's needed
+            mount_point (str): folder mount point
+
+        Returns (dict): copy of folder 'id' and 'groups' access, None if there is no such folder
+        """
+        if self._needs_refresh(mount_point):
+            with self._refresh_lock:
+                if self._needs_refresh(mount_point):  # could be refreshed by another thread while waiting for lock
+                    self._refresh(nxc)
+        with self._lock:
+            folder = self._folders.get(mount_point)
+            if folder is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {'id': folder['id'], 'groups': dict(folder['groups'])}
+
+    def add(self, mount_point, folder_id):
+        """ Record folder created by TEAP """
+        with self._lock:
+            self._folders[mount_point] = {'id': str(folder_id), 'groups': {}}
+            self._ids[str(folder_id)] = mount_point
+
+    def set_access(self, folder_id, group_id, permissions):
+        """ Record access granted or changed by TEAP """
+        with self._lock:
+            mount_point = self._ids.get(str(folder_id))
+            if mount_point is not None:
+                self._folders[mount_point]['groups'][group_id] = permissions
+
+    def invalidate(self):
+        with self._lock:
+            self._refreshed_at = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'folders': len(self._folders),
+                'refreshes': self.refreshes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'ttl': self.ttl,
+            }
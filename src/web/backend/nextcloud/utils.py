@@ -1,20 +1,48 @@
 import logging
+import threading
 
-from flask import g, current_app
+from flask import current_app
 
 from nextcloud import NextCloud
 from nextcloud.base import Permission
 
+from .folder_index import GroupFolderIndex
+from .connections import NextcloudHttp, NextcloudClients, install
+
 logger = logging.getLogger()
 
 
+def create_nextcloud(config):
+    return NextCloud(endpoint=config['NEXTCLOUD_HOST'],
+                     user=config['NEXTCLOUD_USER'],
+                     password=config['NEXTCLOUD_PASSWORD'])
+
+
+def init_nextcloud(app):
+    """ Create process-wide keep-alive HTTP connections pool, used by all Nextcloud clients, and clients registry """
+    http = NextcloudHttp(pool_size=app.config.get('NEXTCLOUD_POOL_SIZE', 10),
+                         timeout=app.config.get('NEXTCLOUD_TIMEOUT', 30),
+                         retries=app.config.get('NEXTCLOUD_RETRIES', 0),
+                         keepalive=app.config.get('NEXTCLOUD_KEEPALIVE', True))
+    install(http)
+    app.extensions['nextcloud_http'] = http
+    app.extensions['nextcloud_clients'] = NextcloudClients(lambda: create_nextcloud(app.config))
+    return http
+
+
 def get_nextcloud():
-    """ Create if doesn't exist or return edap from flask g object """
-    if 'nextcloud' not in g:
-        g.nextcloud = NextCloud(endpoint=current_app.config['NEXTCLOUD_HOST'],
-                                user=current_app.config['NEXTCLOUD_USER'],
-                                password=current_app.config['NEXTCLOUD_PASSWORD'])
-    return g.nextcloud
+    """ Get Nextcloud client of current thread, it's reused between requests and shares connections with others """
+    return current_app.extensions['nextcloud_clients'].get()
+
+
+def nextcloud_stats():
+    """ Nextcloud connections, clients, ldap cache flushes and group folders index statistics """
+    return {
+        'http': current_app.extensions['nextcloud_http'].stats(),
+        'clients': current_app.extensions['nextcloud_clients'].stats(),
+        'ldap_cache_flush': current_app.extensions['nextcloud_flusher'].stats(),
+        'group_folders': get_group_folder_index().stats(),
+    }
 
 
 def flush_nextcloud_ldap_cache(n):
@@ -22,6 +50,146 @@ def flush_nextcloud_ldap_cache(n):
     n.ldap_cache_flush(config_id)
 
 
+class LdapCacheFlusher:
+    """
+    Coalesces Nextcloud ldap cache flush requests.
+
+    Every flush makes Nextcloud query ldap again for everything, so flush requests made within `delay` seconds
+    after the first one are served by single flush. Flush can also be done synchronously, when caller needs
+    Nextcloud to see ldap changes right away; it also serves all requests pending at the moment.
+    Ldap config id is fetched once and fetched again only if flush with it fails.
+    Failed background flush is retried, waiting twice longer after every failure, up to `max_backoff` seconds.
+    """
+
+    def __init__(self, factory, delay=2, max_backoff=60):
+        """
+        Args:
+            factory (callable): creates NextCloud client, used only by flusher
+            delay (float): seconds to wait for more requests before flushing
+            max_backoff (float): max seconds to wait before retrying failed background flush
+        """
+        self.factory = factory
+        self.delay = delay
+        self.max_backoff = max_backoff
+        self._nextcloud = None
+        self._config_id = None
+        self._lock = threading.Lock()  # guards counters and timer
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._timer = None
+        self._requested = 0  # number of last flush request
+        self._flushed = 0  # number of last request served by started flush
+        self._retries = 0  # failed background flushes in a row
+        self.flushes = 0
+        self.failures = 0
+
+    def request(self, wait=False):
+        """
+        Request flush
+
+        Args:
+            wait (bool): flush now and return when it's done, instead of flushing after delay in background
+
+        Raises:
+            Exception: if `wait` and flush failed
+        """
+        with self._lock:
+            self._requested += 1
+            number = self._requested
+            if not wait and self._timer is None:
+                self._schedule(self.delay)
+        if wait:
+            self._flush(number)
+
+    def _schedule(self, delay):
+        """ Start timer of background flush, called with lock held """
+        self._timer = threading.Timer(delay, self._flush_pending)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_pending(self):
+        with self._lock:
+            self._timer = None
+            number = self._requested
+        try:
+            self._flush(number)
+        except Exception as e:
+            logger.exception(e)
+            with self._lock:
+                self._retries += 1
+                backoff = min(self.delay * 2 ** self._retries, self.max_backoff)
+                if self._timer is None and self._requested > self._flushed:
+                    logger.warning(f'Nextcloud ldap cache flush is retried in {backoff}s')
+                    self._schedule(backoff)
+            return
+        with self._lock:
+            self._retries = 0
+
+    def _flush(self, number):
+        """ Flush unless request `number` was served by flush started after it """
+        with self._flush_lock:
+            with self._lock:
+                if self._flushed >= number:
+                    return
+                served, self._flushed = self._flushed, self._requested
+            try:
+                self._flush_with_config_id()
+            except Exception:
+                with self._lock:
+                    self._flushed = served  # next flush serves these requests again
+                    self.failures += 1
+                raise
+            self.flushes += 1
+
+    def _flush_with_config_id(self):
+        if self._nextcloud is None:
+            self._nextcloud = self.factory()
+        cached = self._config_id is not None
+        if not cached:
+            self._config_id = self._nextcloud.get_ldap_lowest_existing_config_id()
+        res = self._nextcloud.ldap_cache_flush(self._config_id)
+        if cached and not getattr(res, 'is_ok', True):
+            # config could be recreated with another id
+            self._config_id = self._nextcloud.get_ldap_lowest_existing_config_id()
+            res = self._nextcloud.ldap_cache_flush(self._config_id)
+        if not getattr(res, 'is_ok', True):
+            self._config_id = None
+            raise Exception(f'Nextcloud ldap cache flush failed. {res.meta.get("message", "")}')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requested,
+                'flushes': self.flushes,
+                'failures': self.failures,
+                'pending': self._requested > self._flushed,
+                'retries': self._retries,
+                'delay': self.delay,
+            }
+
+
+def init_ldap_cache_flusher(app):
+    flusher = LdapCacheFlusher(lambda: create_nextcloud(app.config),
+                               delay=app.config.get('NEXTCLOUD_FLUSH_DELAY', 2),
+                               max_backoff=app.config.get('NEXTCLOUD_FLUSH_MAX_BACKOFF', 60))
+    app.extensions['nextcloud_flusher'] = flusher
+    return flusher
+
+
+def request_ldap_cache_flush(wait=False):
+    """ Make Nextcloud see ldap changes, right away if `wait`, or with next coalesced flush otherwise """
+    current_app.extensions['nextcloud_flusher'].request(wait=wait)
+
+
+def init_group_folder_index(app):
+    index = GroupFolderIndex(ttl=app.config.get('NEXTCLOUD_FOLDERS_TTL', 300))
+    app.extensions['nextcloud_folder_index'] = index
+    return index
+
+
+def get_group_folder_index():
+    return current_app.extensions['nextcloud_folder_index']
+
+
 def get_group_folder(mount_point):
     """
     Get nextcloud folder id by mount point
@@ -29,30 +197,50 @@ def get_group_folder(mount_point):
     Args:
         mount_point (str): nextcloud folder mount point
 
-    Returns:
+    Returns (str): folder id, None if there is no such folder
     """
-    nxc = get_nextcloud()
-    group_folders = nxc.get_group_folders().data
-    if group_folders:  # if there is no group folders, response data will be empty list
-        for key, value in group_folders.items():
-            if value['mount_point'] == mount_point:
-                return key
-    return None
+    folder = get_group_folder_index().get(get_nextcloud(), mount_point)
+    return folder['id'] if folder else None
+
+
+def create_group_folder(mount_point):
+    """ Create group folder and add it to group folders index """
+    res = get_nextcloud().create_group_folder(mount_point)
+    if res.is_ok:
+        get_group_folder_index().add(mount_point, res.data['id'])
+    return res
+
+
+def grant_access_to_group_folder(folder_id, group_id):
+    """ Give group access to group folder (all permissions, as Nextcloud does by default) """
+    res = get_nextcloud().grant_access_to_group_folder(folder_id, group_id)
+    if res.is_ok:
+        get_group_folder_index().set_access(folder_id, group_id, Permission.ALL.value)
+    return res
+
+
+def set_permissions_to_group_folder(folder_id, group_id, permissions):
+    """ Set group permissions to group folder """
+    res = get_nextcloud().set_permissions_to_group_folder(folder_id, group_id, permissions)
+    if res.is_ok:
+        get_group_folder_index().set_access(folder_id, group_id, int(permissions))
+    return res
 
 
 def check_consistency():
     """ Check if all required system objects exist in Edap """
     from ..ldap.models import Franchise, Division
     nxc = get_nextcloud()
+    index = get_group_folder_index()
+    index.refresh(nxc)
 
-    main_franchises_folder_id = get_group_folder(Franchise.GROUP_FOLDER)
-    if not main_franchises_folder_id:
+    main_franchises_folder = index.get(nxc, Franchise.GROUP_FOLDER)
+    if not main_franchises_folder:
         logger.warning('Nextcloud main franchises folder is missing. '
                        'It will be created automatically, when new franchise is created')
 
     # check permission for everybody team
-    if main_franchises_folder_id:
-        main_franchises_folder = nxc.get_group_folder(main_franchises_folder_id).data
+    if main_franchises_folder:
         if 'everybody' not in main_franchises_folder['groups']:
             logger.warning('Nextcloud main franchises folder doesn\'t have Read permission for Everybody Team')
         elif main_franchises_folder['groups']['everybody'] != Permission.READ:
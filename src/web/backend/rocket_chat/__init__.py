@@ -7,4 +7,5 @@ def register_blueprint(app):
 
 def initialize_module(app):
     from . import utils
+    utils.init_rocket_auth(app)
     utils.populate_service(app.config["SQLALCHEMY_DATABASE_URI"])
@@ -53,30 +53,36 @@ class UserRocketChannels(rutils.RocketMixin, MethodView):
 
     def post(self, user_id):
         channel = request.json.get('channel')
-        rocket_user = rutils.rocket_service.get_user_by_username(user_id)
-        rocket_channel = rutils.rocket_service.get_channel_by_name(channel)
+        rocket_user_id = rutils.rocket_service.get_user_id(user_id)
+        rocket_channel_id = rutils.rocket_service.get_channel_id(channel)
 
-        if not rocket_channel:
+        if not rocket_channel_id:
             return jsonify({'message': 'Rocket channel not found'}), 404
 
-        if not rocket_user:
+        if not rocket_user_id:
             return jsonify({'message': 'Rocket user not found'}), 404
 
-        res = rutils.rocket_service.invite_user_to_channel(rocket_channel=rocket_channel['_id'],
-                                                    rocket_user=rocket_user['_id'])
+        res = rutils.rocket_service.invite_user_to_channel(rocket_channel=rocket_channel_id,
+                                                           rocket_user=rocket_user_id)
+        if res.status_code != 200:
+            # cached ids could be of deleted user or channel
+            rutils.rocket_service.forget_ids(username=user_id, channel_name=channel)
         return jsonify(res.json()), res.status_code
 
     def delete(self, user_id, channel):
-        rocket_user = rutils.rocket_service.get_user_by_username(user_id)
-        rocket_channel = rutils.rocket_service.get_channel_by_name(channel)
+        rocket_user_id = rutils.rocket_service.get_user_id(user_id)
+        rocket_channel_id = rutils.rocket_service.get_channel_id(channel)
 
-        if not rocket_channel:
+        if not rocket_channel_id:
             return jsonify({'message': 'Rocket channel not found'}), 404
 
-        if not rocket_user:
+        if not rocket_user_id:
             return jsonify({'message': 'Rocket user not found'}), 404
 
-        self.rocket.channels_kick(rocket_channel['_id'], rocket_user['_id'])
+        res = rutils.rocket_service.kick_user_from_channel(rocket_channel=rocket_channel_id,
+                                                           rocket_user=rocket_user_id)
+        if res is None or res.status_code != 200:
+            rutils.rocket_service.forget_ids(username=user_id, channel_name=channel)
         return jsonify({"message": "success"}), 202
 
 
@@ -91,23 +97,26 @@ class UserTeamsChatsViewSet(rutils.RocketMixin, EdapMixin, MethodView):
         except ObjectDoesNotExist:
             return jsonify({'message': 'Team corresponding franchise or division are not found'}), 404
 
-        user = rutils.rocket_service.get_user_by_username(uid)
+        user_id = rutils.rocket_service.get_user_id(uid)
 
-        franchise_channel = rutils.rocket_service.get_channel_by_name(franchise.chat_name)
-        division_channel = rutils.rocket_service.get_channel_by_name(division.chat_name)
+        channel_ids = rutils.rocket_service.get_channel_ids([franchise.chat_name, division.chat_name])
+        franchise_channel_id = channel_ids.get(franchise.chat_name)
+        division_channel_id = channel_ids.get(division.chat_name)
 
-        if not all([user, franchise_channel, division_channel]):
+        if not all([user_id, franchise_channel_id, division_channel_id]):
             return jsonify({'message': 'Corresponding franchise or division channels not found'}), 400
 
-        franchise_chat_res = rutils.rocket_service.invite_user_to_channel(rocket_channel=franchise_channel['_id'],
-                                                                   rocket_user=user['_id'])
-        division_chat_res = rutils.rocket_service.invite_user_to_channel(rocket_channel=division_channel['_id'],
-                                                                  rocket_user=user['_id'])
+        franchise_chat_res = rutils.rocket_service.invite_user_to_channel(rocket_channel=franchise_channel_id,
+                                                                          rocket_user=user_id)
+        division_chat_res = rutils.rocket_service.invite_user_to_channel(rocket_channel=division_channel_id,
+                                                                         rocket_user=user_id)
 
         if franchise_chat_res.status_code != 200:
+            rutils.rocket_service.forget_ids(username=uid, channel_name=franchise.chat_name)
             return jsonify(franchise_chat_res.json()), franchise_chat_res.status_code
 
         if division_chat_res.status_code != 200:
+            rutils.rocket_service.forget_ids(username=uid, channel_name=division.chat_name)
             return jsonify(division_chat_res.json()), division_chat_res.status_code
 
         return jsonify({'message': 'success'}), 200
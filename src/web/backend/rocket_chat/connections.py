@@ -0,0 +1,97 @@
+""" Process-wide Rocket.Chat auth token and keep-alive HTTP session, shared between requests """
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from rocketchat_API.rocketchat import RocketChat
+
+AUTH_TOKEN_HEADER = 'X-Auth-Token'
+USER_ID_HEADER = 'X-User-Id'
+
+
+class RocketHttp(requests.Session):
+    """
+    Session used by all Rocket.Chat clients of process. When call made with cached token gets 401 (token expired
+    or was revoked), it logs in again and repeats the call with new token.
+    """
+
+    def __init__(self, auth, pool_size=10):
+        super().__init__()
+        self.rocket_auth = auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        res = super().request(method, url, **kwargs)
+        headers = kwargs.get('headers')
+        if res.status_code == 401 and headers and headers.get(AUTH_TOKEN_HEADER):
+            # client headers are updated in place, so its next calls use new token too
+            headers.update(self.rocket_auth.refresh(stale=headers[AUTH_TOKEN_HEADER]))
+            res = super().request(method, url, **kwargs)
+        return res
+
+
+class RocketAuth:
+    """
+    Logs in to Rocket.Chat once per process and creates clients authenticated with cached token.
+
+    Login is expensive and rate-limited by Rocket.Chat, so it's done only when there is no token yet or when
+    cached token is rejected; concurrent rejections of the same token cause single login.
+    """
+
+    def __init__(self, user, password, server_url, timeout=30, pool_size=10):
+        """
+        Args:
+            user (str): Rocket.Chat admin username
+            password (str): Rocket.Chat admin password
+            server_url (str): Rocket.Chat url
+            timeout (float): seconds to wait for response
+            pool_size (int): max number of connections kept to Rocket.Chat
+        """
+        self.user = user
+        self.password = password
+        self.server_url = server_url
+        self.timeout = timeout
+        self.http = RocketHttp(self, pool_size=pool_size)
+        self._lock = threading.Lock()
+        self._headers = None  # auth token and user id headers
+        self.logins = 0
+        self.refreshes = 0
+
+    def _login(self):
+        rocket = RocketChat(self.user, self.password, server_url=self.server_url, timeout=self.timeout,
+                            session=self.http)
+        self.logins += 1
+        return {AUTH_TOKEN_HEADER: rocket.headers[AUTH_TOKEN_HEADER], USER_ID_HEADER: rocket.headers[USER_ID_HEADER]}
+
+    def headers(self):
+        """ Auth headers, log in if there is no token yet """
+        with self._lock:
+            if self._headers is None:
+                self._headers = self._login()
+            return dict(self._headers)
+
+    def refresh(self, stale):
+        """ Log in again, unless `stale` token was already replaced, return new auth headers """
+        with self._lock:
+            if self._headers is None or self._headers[AUTH_TOKEN_HEADER] == stale:
+                self._headers = None
+                self._headers = self._login()
+                self.refreshes += 1
+            return dict(self._headers)
+
+    def client(self):
+        """
+        Create Rocket.Chat client authenticated with cached token, it doesn't log in by itself
+
+        Raises:
+            RocketAuthenticationException: if there is no cached token and login failed
+        """
+        headers = self.headers()
+        return RocketChat(auth_token=headers[AUTH_TOKEN_HEADER], user_id=headers[USER_ID_HEADER],
+                          server_url=self.server_url, timeout=self.timeout, session=self.http)
+
+    def stats(self):
+        with self._lock:
+            return {'logins': self.logins, 'refreshes': self.refreshes, 'authenticated': self._headers is not None}
@@ -1,23 +1,46 @@
+import json
 import logging
 from functools import wraps
 import re
 
 from flask import g, current_app
 
-from rocketchat_API.rocketchat import RocketChat
 from ..actions.models import Action
+from ..actions.writer import record_action
+from ..cache import TTLCache
+from ..concurrency import iter_concurrently
+from .connections import RocketAuth
 
 logger = logging.getLogger()
 
+LOOKUP_CHUNK_SIZE = 50  # names per $in query, keeps query string short
+LOOKUP_PAGE_SIZE = 100
+KEPT_ROOM_ROLES = ('owner', 'moderator')  # channel members with these roles are not kicked by sync
+
+
+def init_rocket_auth(app):
+    """ Create process-wide Rocket.Chat auth token cache and HTTP session, login happens on first use """
+    auth = RocketAuth(app.config.get("ROCKETCHAT_USER"),
+                      app.config.get("ROCKETCHAT_PASSWORD"),
+                      server_url=app.config.get("ROCKETCHAT_HOST"),
+                      timeout=app.config.get("ROCKETCHAT_TIMEOUT", 30),
+                      pool_size=app.config.get("ROCKETCHAT_POOL_SIZE", 10))
+    app.extensions['rocket_auth'] = auth
+    app.extensions['rocket_id_cache'] = TTLCache(maxsize=app.config.get("ROCKETCHAT_ID_CACHE_SIZE", 1024),
+                                                 ttl=app.config.get("ROCKETCHAT_ID_CACHE_TTL", 600))
+    return auth
+
+
+def get_rocket_id_cache():
+    """ Cache of Rocket.Chat ids: ('user', username) -> user id, ('channel', channel name) -> room id """
+    return current_app.extensions['rocket_id_cache']
+
 
 def get_rocket():
-    """ Create if doesn't exist or return edap from flask g object """
+    """ Create if doesn't exist or return rocket client, authenticated with cached token, from flask g object """
     if 'rocket' not in g:
         try:
-            g.rocket = RocketChat(
-                    current_app.config["ROCKETCHAT_USER"],
-                    current_app.config["ROCKETCHAT_PASSWORD"],
-                    server_url=current_app.config["ROCKETCHAT_HOST"])
+            g.rocket = current_app.extensions['rocket_auth'].client()
             g.rocket_exception = None
         except Exception as e:
             g.rocket = None
@@ -38,6 +61,16 @@ class RocketMixin:
         return get_rocket()
 
 
+def response_error(res, default):
+    """ Error message of unsuccessful Rocket.Chat call, `default` if call failed or response has no error """
+    if res is None:
+        return default
+    try:
+        return res.json().get('error') or default
+    except ValueError:  # not json, e.g. error page of proxy
+        return default
+
+
 def log_rocket_action(event_name):
     def wrapper(func):
         @wraps(func)
@@ -57,7 +90,7 @@ def log_rocket_action(event_name):
                 message = str(e)
             # TODO: what to do with password in create_user method?
             filtered_kwargs = {key: value for key, value in kwargs.items() if key != 'password'}
-            Action.create_event(event_name=event_name, status=status, message=message, **filtered_kwargs)
+            record_action(event_name, status=status, message=message, **filtered_kwargs)
             return res
         return inner_wrapper
     return wrapper
@@ -78,7 +111,10 @@ class RocketChatService(RocketMixin):
         Returns (response):
 
         """
-        return self.rocket.users_create(email, name, password, username, requirePasswordChange=True)
+        res = self.rocket.users_create(email, name, password, username, requirePasswordChange=True)
+        if res.status_code == 200:
+            get_rocket_id_cache().set(('user', username), res.json()['user']['_id'])
+        return res
 
     def create_channel(self, channel_name):
         """
@@ -89,13 +125,23 @@ class RocketChatService(RocketMixin):
         Returns:
 
         """
-        return self.rocket.channels_create(channel_name)
+        res = self.rocket.channels_create(channel_name)
+        if res.status_code == 200:
+            get_rocket_id_cache().set(('channel', channel_name), res.json()['channel']['_id'])
+        return res
 
     def invite_user_to_channel(self, rocket_channel, rocket_user):
         return self.rocket.channels_invite(rocket_channel, rocket_user)
 
-    def delete_user(self, user_id):
-        return self.rocket.users_delete(user_id)
+    def kick_user_from_channel(self, rocket_channel, rocket_user):
+        return self.rocket.channels_kick(rocket_channel, rocket_user)
+
+    def delete_user(self, user_id, username=None):
+        """ Delete user by rocket id, forget cached id of `username` """
+        res = self.rocket.users_delete(user_id)
+        if username is not None:
+            self.forget_ids(username=username)
+        return res
 
     def get_channel_by_name(self, channel_name):
         """ Get rocket channel json object by it's name """
@@ -118,6 +164,174 @@ class RocketChatService(RocketMixin):
             return None
         return users[0]
 
+    def _list_by_names(self, list_method, items_key, field, names):
+        """
+        Find objects by names with `$in` queries of at most LOOKUP_CHUNK_SIZE names, reading all pages of results
+
+        Args:
+            list_method (callable): rocket list method, e.g. users_list
+            items_key (str): key of objects list in response, e.g. 'users'
+            field (str): field to match names against, e.g. 'username'
+            names (iterable): names to find
+
+        Returns (dict): rocket json object by name, names that weren't found are left out
+        """
+        names = list(dict.fromkeys(names))
+        found = {}
+        for start in range(0, len(names), LOOKUP_CHUNK_SIZE):
+            query = json.dumps({field: {'$in': names[start:start + LOOKUP_CHUNK_SIZE]}})
+            offset = 0
+            while True:
+                res = list_method(query=query, count=LOOKUP_PAGE_SIZE, offset=offset)
+                if res.status_code != 200:
+                    break
+                data = res.json()
+                items = data[items_key]
+                found.update((item[field], item) for item in items)
+                offset += len(items)
+                if not items or offset >= data.get('total', offset):
+                    break
+        return found
+
+    def get_users_by_usernames(self, usernames):
+        """ Get rocket user json objects by usernames, returns dict by username without not found users """
+        return self._list_by_names(self.rocket.users_list, 'users', 'username', usernames)
+
+    def get_channels_by_names(self, channel_names):
+        """ Get rocket channel json objects by names, returns dict by name without not found channels """
+        return self._list_by_names(self.rocket.channels_list, 'channels', 'fname', channel_names)
+
+    def get_channel_members(self, rocket_channel):
+        """
+        Get all members of channel, reading channels.members page by page
+
+        Returns (dict): rocket user id by username
+        """
+        members = {}
+        offset = 0
+        while True:
+            res = self.rocket.channels_members(room_id=rocket_channel, count=LOOKUP_PAGE_SIZE, offset=offset)
+            if res.status_code != 200:
+                raise Exception(res.json().get('error', 'Failed to get channel members'))
+            data = res.json()
+            page = data['members']
+            members.update((member['username'], member['_id']) for member in page)
+            offset += len(page)
+            if not page or offset >= data.get('total', offset):
+                break
+        return members
+
+    def get_channel_role_holders(self, rocket_channel, roles=KEPT_ROOM_ROLES):
+        """ Get usernames of channel members, who hold any of `roles` in channel """
+        res = self.rocket.channels_roles(room_id=rocket_channel)
+        if res.status_code != 200:
+            raise Exception(res.json().get('error', 'Failed to get channel roles'))
+        return {role['u']['username'] for role in res.json()['roles'] if set(role.get('roles', ())) & set(roles)}
+
+    def sync_channel_members(self, channel_name, usernames, max_workers=8):
+        """
+        Make channel members the same as given usernames: invite and kick only the difference, concurrently.
+        Rocket.Chat account TEAP works with, accounts listed in ROCKETCHAT_SYNC_KEEP setting and channel owners
+        and moderators are never kicked.
+
+        Args:
+            channel_name (str): channel name
+            usernames (iterable): usernames channel should have as members
+            max_workers (int): max number of invite and kick calls in flight
+
+        Returns (dict): 'channel' name, usernames 'invited', 'kicked', 'kept' (not in usernames, but never kicked),
+            'missing' (without chat account), 'failed' invites and kicks with error 'message'
+
+        Raises:
+            Exception: if channel doesn't exist or its members can't be read
+        """
+        rocket_channel = self.get_channel_id(channel_name)
+        if not rocket_channel:
+            raise Exception(f'Rocket channel {channel_name} not found')
+        current = self.get_channel_members(rocket_channel)
+        wanted = set(usernames)
+        to_invite = sorted(wanted - current.keys())
+        to_kick = current.keys() - wanted
+        kept = set()
+        if to_kick:
+            keep = {current_app.config.get("ROCKETCHAT_USER"), *current_app.config.get("ROCKETCHAT_SYNC_KEEP", [])}
+            kept = to_kick & (keep | self.get_channel_role_holders(rocket_channel))
+        user_ids = self.get_user_ids(to_invite) if to_invite else {}
+        changes = [('invite', username, user_ids[username]) for username in to_invite if username in user_ids]
+        changes += [('kick', username, current[username]) for username in sorted(to_kick - kept)]
+
+        def apply(change):
+            action, _, rocket_user = change
+            method = self.invite_user_to_channel if action == 'invite' else self.kick_user_from_channel
+            res = method(rocket_channel=rocket_channel, rocket_user=rocket_user)
+            # logging service returns None if call raised, the exception is already logged
+            if res is None or res.status_code != 200:
+                raise Exception(response_error(res, f'Failed to {action} user'))
+
+        report = {'channel': channel_name, 'invited': [], 'kicked': [], 'kept': sorted(kept),
+                  'missing': [username for username in to_invite if username not in user_ids], 'failed': []}
+        for (action, username, _), _, exception in iter_concurrently(apply, changes, max_workers=max_workers):
+            if exception is not None:
+                report['failed'].append({'username': username, 'action': action, 'message': str(exception)})
+            else:
+                report['invited' if action == 'invite' else 'kicked'].append(username)
+        for key in ('invited', 'kicked'):
+            report[key].sort()
+        report['failed'].sort(key=lambda failure: failure['username'])
+        return report
+
+    @staticmethod
+    def _cached_ids(kind, names, load):
+        cache = get_rocket_id_cache()
+        ids = {}
+        for name in names:
+            rocket_id = cache.get((kind, name))
+            if rocket_id is not None:
+                ids[name] = rocket_id
+        missing = [name for name in names if name not in ids]
+        if missing:
+            for name, obj in load(missing).items():
+                if obj.get('_id'):
+                    ids[name] = obj['_id']
+                    cache.set((kind, name), obj['_id'])
+        return ids
+
+    def get_user_ids(self, usernames):
+        """ Get rocket user ids by usernames with single lookup of not cached ones, returns dict by username """
+        return self._cached_ids('user', usernames, self.get_users_by_usernames)
+
+    def get_channel_ids(self, channel_names):
+        """ Get rocket channel ids by names with single lookup of not cached ones, returns dict by name """
+        return self._cached_ids('channel', channel_names, self.get_channels_by_names)
+
+    @staticmethod
+    def _cached_id(key, load):
+        cache = get_rocket_id_cache()
+        rocket_id = cache.get(key)
+        if rocket_id is None:
+            obj = load()
+            rocket_id = obj.get('_id') if obj else None
+            if rocket_id:
+                cache.set(key, rocket_id)
+        return rocket_id
+
+    def get_user_id(self, username):
+        """ Get rocket user id by username, None if there is no such user. Found ids are cached """
+        return self._cached_id(('user', username), lambda: self.get_user_by_username(username))
+
+    def get_channel_id(self, channel_name):
+        """ Get rocket channel id by it's name, None if there is no such channel. Found ids are cached """
+        return self._cached_id(('channel', channel_name), lambda: self.get_channel_by_name(channel_name))
+
+    @staticmethod
+    def forget_ids(username=None, channel_name=None):
+        """ Drop cached ids, e.g. when Rocket.Chat didn't find object by them """
+        cache = get_rocket_id_cache()
+        if username is not None:
+            cache.invalidate(('user', username))
+        if channel_name is not None:
+            cache.invalidate(('channel', channel_name))
+
 
 class LoggingRocketChatService(RocketChatService):
     @log_rocket_action(event_name=Action.CREATE_ROCKET_USER)
@@ -132,6 +346,10 @@ class LoggingRocketChatService(RocketChatService):
     def invite_user_to_channel(self, rocket_channel, rocket_user):
         return super().invite_user_to_channel(rocket_channel, rocket_user)
 
+    @log_rocket_action(event_name=Action.KICK_USER_FROM_CHANNEL)
+    def kick_user_from_channel(self, rocket_channel, rocket_user):
+        return super().kick_user_from_channel(rocket_channel, rocket_user)
+
 
 def populate_service(logging_enabled):
     global rocket_service
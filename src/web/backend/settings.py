@@ -25,14 +25,52 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 NEXTCLOUD_HOST = env.str('NEXTCLOUD_HOST')
 NEXTCLOUD_USER = env.str('NEXTCLOUD_USER')
 NEXTCLOUD_PASSWORD = env.str("NEXTCLOUD_PASSWORD")
+NEXTCLOUD_FLUSH_DELAY = env.float("NEXTCLOUD_FLUSH_DELAY", default=2)  # seconds to gather ldap cache flush requests
+NEXTCLOUD_FLUSH_MAX_BACKOFF = env.float("NEXTCLOUD_FLUSH_MAX_BACKOFF", default=60)  # max seconds between flush retries
+NEXTCLOUD_FOLDERS_TTL = env.float("NEXTCLOUD_FOLDERS_TTL", default=300)  # seconds to trust group folders index
+NEXTCLOUD_POOL_SIZE = env.int("NEXTCLOUD_POOL_SIZE", default=10)  # keep-alive connections to Nextcloud
+NEXTCLOUD_TIMEOUT = env.float("NEXTCLOUD_TIMEOUT", default=30)  # seconds to wait for connection and for response
+NEXTCLOUD_RETRIES = env.int("NEXTCLOUD_RETRIES", default=0)  # retries of failed connections
+NEXTCLOUD_KEEPALIVE = env.bool("NEXTCLOUD_KEEPALIVE", default=True)
 
 # Rocket chat
 ROCKETCHAT_USER = env.str("ROCKETCHAT_USER")
 ROCKETCHAT_PASSWORD = env.str("ROCKETCHAT_PASSWORD")
 ROCKETCHAT_HOST = env.str("ROCKETCHAT_HOST")
+ROCKETCHAT_TIMEOUT = env.float("ROCKETCHAT_TIMEOUT", default=30)  # seconds to wait for response
+ROCKETCHAT_POOL_SIZE = env.int("ROCKETCHAT_POOL_SIZE", default=10)  # keep-alive connections to Rocket.Chat
+ROCKETCHAT_ID_CACHE_SIZE = env.int("ROCKETCHAT_ID_CACHE_SIZE", default=1024)  # cached user and channel ids
+ROCKETCHAT_ID_CACHE_TTL = env.float("ROCKETCHAT_ID_CACHE_TTL", default=600)
+ROCKETCHAT_SYNC_CONCURRENCY = env.int("ROCKETCHAT_SYNC_CONCURRENCY", default=8)  # invites and kicks in flight
+ROCKETCHAT_SYNC_KEEP = env.list("ROCKETCHAT_SYNC_KEEP", default=[])  # usernames never kicked by sync, e.g. bots
 
 # Edap
 EDAP_HOSTNAME = env.str("EDAP_HOSTNAME")
 EDAP_USER = env.str("EDAP_USER")
 EDAP_PASSWORD = env.str("EDAP_PASSWORD")
 EDAP_DOMAIN = env.str("EDAP_DOMAIN")
+EDAP_POOL_SIZE = env.int("EDAP_POOL_SIZE", default=10)
+EDAP_POOL_TIMEOUT = env.float("EDAP_POOL_TIMEOUT", default=5)  # seconds to wait for free connection
+EDAP_POOL_KEEPALIVE = env.float("EDAP_POOL_KEEPALIVE", default=60)  # check idle connection before use after N seconds
+EDAP_CACHE_SIZE = env.int("EDAP_CACHE_SIZE", default=256)
+EDAP_CACHE_TTL = env.float("EDAP_CACHE_TTL", default=300)  # seconds to keep franchises, divisions, teams lookups
+EDAP_PHOTO_CACHE_SIZE = env.int("EDAP_PHOTO_CACHE_SIZE", default=256)  # number of user photos kept in memory
+EDAP_PHOTO_CACHE_TTL = env.float("EDAP_PHOTO_CACHE_TTL", default=3600)
+EDAP_PAGE_SIZE = env.int("EDAP_PAGE_SIZE", default=500)
+EDAP_BULK_CONCURRENCY = env.int("EDAP_BULK_CONCURRENCY", default=4)  # max simultaneous ldap writes in bulk operations
+# users created at the same time by import, each holds pooled connection, so it's capped at EDAP_POOL_SIZE - 2
+USER_IMPORT_CONCURRENCY = env.int("USER_IMPORT_CONCURRENCY", default=8)
+JOBS_WORKERS = env.int("JOBS_WORKERS", default=2)  # franchises and divisions created at the same time in background
+JOBS_TTL = env.float("JOBS_TTL", default=3600)  # seconds to keep finished jobs
+JOBS_STALE_AFTER = env.float("JOBS_STALE_AFTER", default=300)  # seconds without update before job is reported failed
+EDAP_LAZY_TEAMS = env.bool("EDAP_LAZY_TEAMS", default=False)  # create franchise x division teams on first use
+EDAP_ORG_GRAPH = env.bool("EDAP_ORG_GRAPH", default=False)  # answer read endpoints from in-memory org graph
+EDAP_ORG_GRAPH_MAX_AGE = env.float("EDAP_ORG_GRAPH_MAX_AGE", default=30)  # seconds before changes are fetched
+EDAP_ORG_GRAPH_FULL_REFRESH = env.float("EDAP_ORG_GRAPH_FULL_REFRESH", default=3600)  # seconds between rebuilds
+
+ACTIONS_BATCH_SIZE = env.int("ACTIONS_BATCH_SIZE", default=100)  # audit log actions written with one insert
+ACTIONS_FLUSH_INTERVAL = env.float("ACTIONS_FLUSH_INTERVAL", default=1)  # max seconds action waits to be written
+ACTIONS_MAX_BUFFERED = env.int("ACTIONS_MAX_BUFFERED", default=10000)
+ACTIONS_MAX_BACKOFF = env.float("ACTIONS_MAX_BACKOFF", default=30)  # max seconds before failed batch is retried
+ACTIONS_WRITE_SYNC = env.bool("ACTIONS_WRITE_SYNC", default=False)  # write every action right away, without buffer
+ACTIONS_COUNT_TTL = env.float("ACTIONS_COUNT_TTL", default=60)  # seconds to cache number of actions matching filters
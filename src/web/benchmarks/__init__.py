@@ -0,0 +1 @@
+"""Micro-benchmarks, run from web project directory, e.g. `python -m benchmarks.projections`."""
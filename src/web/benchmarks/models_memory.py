@@ -0,0 +1,97 @@
+"""Compare peak RSS of loading users and teams into dict-backed models and into slotted models."""
+import argparse
+import resource
+import subprocess
+import sys
+
+from backend.ldap.models import LdapUser, LdapTeam, STRING_OPERATIONS
+
+
+class DictUser:
+    """ User model as it was before __slots__ """
+
+    def __init__(self, fqdn=None, uid=None, given_name=None, mail=None, surname=None, groups=None, franchises=None,
+                 divisions=None, teams=None, picture_bytes=b""):
+        self.fqdn = fqdn
+        self.uid = uid
+        self.given_name = given_name
+        self.mail = mail
+        self.surname = surname
+        self.groups = groups
+        self.franchises = franchises
+        self.divisions = divisions
+        self.teams = teams
+        self.picture_bytes = picture_bytes
+
+
+class DictTeam:
+    """ Team model as it was before __slots__, with per instance conversion function """
+
+    def __init__(self, fqdn=None, machine_name=None, display_name=None):
+        self.fqdn = fqdn
+        self.n_conversion_fun = STRING_OPERATIONS["noop"]
+        self.EVERYBODY_NEXTCLOUD_GROUP_ID = self.n_conversion_fun('everybody')
+        self.machine_name = machine_name
+        self.display_name = display_name
+
+
+MODELS = {
+    'dict': (DictUser, DictTeam),
+    'slots': (LdapUser, LdapTeam),
+}
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_entries(count):
+    users = [{'fqdn': f'uid=user{n},ou=people,dc=example,dc=com', 'uid': [b'user%d' % n],
+              'givenName': [b'Name%d' % n], 'mail': [b'user%d@example.com' % n], 'sn': [b'Surname%d' % n]}
+             for n in range(count)]
+    teams = [{'fqdn': f'cn=fr{n % 100}-div{n // 100},ou=teams,dc=example,dc=com',
+              'cn': [b'fr%d-div%d' % (n % 100, n // 100)], 'description': [b'Fr %d Div %d' % (n % 100, n // 100)]}
+             for n in range(count)]
+    return users, teams
+
+
+def load(variant, count):
+    """ Build `count` users and teams with given models, return peak RSS growth in KB """
+    user_model, team_model = MODELS[variant]
+    user_entries, team_entries = make_entries(count)
+    before = max_rss_kb()
+    # values are decoded per object, as marshmallow schemas do
+    users = [user_model(fqdn=entry['fqdn'], uid=entry['uid'][0].decode('utf-8'),
+                        given_name=entry['givenName'][0].decode('utf-8'), mail=entry['mail'][0].decode('utf-8'),
+                        surname=entry['sn'][0].decode('utf-8'))
+             for entry in user_entries]
+    teams = [team_model(fqdn=entry['fqdn'], machine_name=entry['cn'][0].decode('utf-8'),
+                        display_name=entry['description'][0].decode('utf-8'))
+             for entry in team_entries]
+    assert len(users) == len(teams) == count
+    return max_rss_kb() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--variant', choices=sorted(MODELS))
+    args = parser.parse_args()
+
+    if args.variant:
+        print(load(args.variant, args.count))
+        return
+
+    # peak RSS never goes down, so every variant is measured in a fresh process
+    results = {
+        variant: int(subprocess.check_output([sys.executable, '-m', 'benchmarks.models_memory',
+                                              '--count', str(args.count), '--variant', variant]))
+        for variant in ('dict', 'slots')
+    }
+    print(f"{args.count} users and {args.count} teams: dict models {results['dict'] / 1024:.1f} MiB, "
+          f"slots models {results['slots'] / 1024:.1f} MiB, "
+          f"{1 - results['slots'] / results['dict']:.0%} less")
+
+
+if __name__ == '__main__':
+    main()
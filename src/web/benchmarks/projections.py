@@ -0,0 +1,51 @@
+"""Compare marshmallow load + dump pipeline with single pass projections for list endpoints."""
+import argparse
+import timeit
+
+from backend.ldap.api_serializers import api_users_schema, api_teams_schema
+from backend.ldap.projections import project_users, project_groups
+from backend.ldap.serializers import edap_users_schema, edap_teams_schema
+
+
+def make_users(count):
+    return [{'fqdn': f'uid=user{n},ou=people,dc=example,dc=com', 'uid': [f'user{n}'.encode()],
+             'givenName': [f'Name{n}'.encode()], 'sn': [f'Surname{n}'.encode()],
+             'mail': [f'user{n}@example.com'.encode()], 'cn': [f'Name{n} Surname{n}'.encode()],
+             'objectClass': [b'inetOrgPerson', b'posixAccount']}
+            for n in range(count)]
+
+
+def make_teams(count):
+    return [{'fqdn': f'cn=team{n},ou=teams,dc=example,dc=com', 'cn': [f'team{n}'.encode()],
+             'description': [f'Team {n}'.encode()], 'gidNumber': [str(n).encode()],
+             'objectClass': [b'posixGroup', b'top']}
+            for n in range(count)]
+
+
+def copies(entries):
+    # schemas unpack entries in place, so every run needs fresh entries
+    return [dict(entry) for entry in entries]
+
+
+def bench(name, entries, schema_pipeline, projection, repeat):
+    assert schema_pipeline(copies(entries)) == projection(entries)
+    schema_time = min(timeit.repeat(lambda: schema_pipeline(copies(entries)), number=1, repeat=repeat))
+    projection_time = min(timeit.repeat(lambda: projection(copies(entries)), number=1, repeat=repeat))
+    print(f'{name}: {len(entries)} entries, schemas {schema_time:.3f}s, projection {projection_time:.3f}s, '
+          f'{schema_time / projection_time:.1f}x faster')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    bench('users', make_users(args.count), lambda entries: api_users_schema.dump(edap_users_schema.load(entries)),
+          project_users, args.repeat)
+    bench('teams', make_teams(args.count), lambda entries: api_teams_schema.dump(edap_teams_schema.load(entries)),
+          project_groups, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
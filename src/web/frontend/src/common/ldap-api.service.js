@@ -110,3 +110,34 @@ export const LdapUserTeamsService = {
     return ApiService.delete(`${BASE_URL}user/${uid}/teams`, '', params)
   }
 }
+
+export const LdapJobsService = {
+  get (jobId) {
+    return ApiService.get(`${BASE_URL}jobs`, jobId)
+  },
+
+  // resolves with job when it's finished, polling it every `interval` ms
+  wait (jobId, interval = 1000) {
+    return new Promise((resolve, reject) => {
+      const poll = () => {
+        this.get(jobId).then(response => {
+          let job = response.data
+          if (job.status === 'succeeded' || job.status === 'failed') {
+            resolve(job)
+          } else {
+            setTimeout(poll, interval)
+          }
+        }, reject)
+      }
+      poll()
+    })
+  }
+}
+
+const STEP_TITLES = {ldap: 'ldap entry', teams: 'teams', folder: 'group folder', rocket: 'rocket chat channel'}
+
+export function notifyFailedSteps (notifier, job, unitName) {
+  job.steps.filter(step => step.status === 'failed').forEach(step => {
+    notifier.error({title: `Error creating ${STEP_TITLES[step.name] || step.name} for ${unitName}`, text: step.message})
+  })
+}
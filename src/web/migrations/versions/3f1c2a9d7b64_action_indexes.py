@@ -0,0 +1,27 @@
+"""action keyset pagination indexes
+
+Revision ID: 3f1c2a9d7b64
+Revises: eaef07e04540
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b64'
+down_revision = 'eaef07e04540'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_action_timestamp_id', 'action', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_action_event_name_timestamp_id', 'action', ['event_name', 'timestamp', 'id'], unique=False)
+    op.create_index('ix_action_status_timestamp_id', 'action', ['status', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_action_status_timestamp_id', table_name='action')
+    op.drop_index('ix_action_event_name_timestamp_id', table_name='action')
+    op.drop_index('ix_action_timestamp_id', table_name='action')
@@ -0,0 +1,34 @@
+"""job state table
+
+Revision ID: 8b5e0d2c4a17
+Revises: 3f1c2a9d7b64
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b5e0d2c4a17'
+down_revision = '3f1c2a9d7b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('_data', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_job_finished_at'), 'job', ['finished_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_finished_at'), table_name='job')
+    op.drop_table('job')
@@ -9,3 +9,4 @@ CACHE_TYPE = 'simple'  # Can be "memcached", "redis", etc.
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 WEBPACK_MANIFEST_PATH = 'webpack/manifest.json'
 WTF_CSRF_ENABLED = False  # Allows form testing
+ACTIONS_WRITE_SYNC = True  # audit log actions are visible right after they are recorded
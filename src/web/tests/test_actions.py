@@ -0,0 +1,129 @@
+import base64
+import time
+from datetime import datetime, timedelta
+
+from backend.actions.api import decode_cursor, encode_cursor
+from backend.actions.models import Action
+from backend.actions.writer import ActionWriter
+
+
+class TestActionWriter:
+
+    def test_actions_are_written_in_batches(self, app, db):
+        writer = ActionWriter(app, batch_size=3, interval=60)
+        for number in range(7):
+            writer.record(Action.INVITE_USER_TO_CHANNEL, rocket_user=f'user{number}', rocket_channel='c1')
+        assert writer.flush(timeout=5)
+        assert writer.stats()['batches'] == 3
+        assert Action.query.count() == 7
+        assert Action.query.first().data == {'rocket_user': 'user0', 'rocket_channel': 'c1'}
+        writer.close()
+
+    def test_actions_are_written_after_interval(self, app, db):
+        writer = ActionWriter(app, batch_size=100, interval=0.05)
+        writer.record(Action.CREATE_ROCKET_CHANNEL, status=False, message='exists', channel_name='general')
+        writer.close()
+        action = Action.query.one()
+        assert not action.status and action.message == 'exists'
+
+    def test_full_buffer_drops_actions(self, app, db):
+        writer = ActionWriter(app, batch_size=100, interval=60, max_buffered=2, put_timeout=0.01)
+        for _ in range(3):
+            writer.record(Action.CREATE_ROCKET_CHANNEL, channel_name='general')
+        assert writer.stats()['dropped'] == 1
+        writer.close()
+        assert Action.query.count() == 2
+
+    def test_failed_batch_is_retried(self, app, db):
+        writer = ActionWriter(app, batch_size=100, interval=0.01)
+        original_write = writer._write
+        attempts = []
+
+        def write(rows):
+            attempts.append(len(rows))
+            return len(attempts) > 1 and original_write(rows)
+
+        writer._write = write
+        writer.record(Action.CREATE_ROCKET_CHANNEL, channel_name='general')
+        writer.record(Action.CREATE_ROCKET_CHANNEL, channel_name='random')
+        assert writer.flush(timeout=5)
+        assert attempts == [2, 2]
+        assert Action.query.count() == 2
+        assert writer.stats()['retries'] == 0
+        writer.close()
+
+    def test_close_interrupts_backoff_and_drops_unwritten(self, app, db):
+        writer = ActionWriter(app, batch_size=100, interval=0.01, max_backoff=60)
+        attempts = []
+        writer._write = lambda rows: attempts.append(len(rows)) and False
+        writer.retries = 20  # next backoff is max_backoff
+        writer.record(Action.CREATE_ROCKET_CHANNEL, channel_name='general')
+        writer.flush(timeout=0.2)
+        started = time.monotonic()
+        writer.close(timeout=5)
+        assert time.monotonic() - started < 5
+        assert attempts == [1, 1]
+        assert writer.stats()['dropped'] == 1
+        assert writer.stats()['buffered'] == 0
+
+    def test_failed_batch_is_dropped_only_without_room(self, app, db):
+        writer = ActionWriter(app, max_buffered=2)
+        writer._buffer = [(0, {'event_name': 'newer'})]
+        writer._requeue([(0, {'event_name': 'first'}), (0, {'event_name': 'second'})])
+        assert [row['event_name'] for _, row in writer._buffer] == ['first', 'newer']
+        assert writer.stats()['dropped'] == 1
+
+    def test_sync_mode_writes_right_away(self, app, db):
+        writer = ActionWriter(app, sync=True)
+        writer.record(Action.CREATE_ROCKET_USER, username='jdoe')
+        assert Action.query.count() == 1
+        assert writer.stats()['buffered'] == 0
+
+
+class TestActionsApi:
+
+    @staticmethod
+    def create_actions(db, count):
+        start = datetime(2020, 1, 1)
+        for number in range(count):
+            db.session.add(Action(event_name=Action.INVITE_USER_TO_CHANNEL if number % 2 else Action.CREATE_ROCKET_USER,
+                                  timestamp=start + timedelta(minutes=number // 2), status=number % 3 != 0,
+                                  data={'number': number}))
+        db.session.commit()
+
+    def test_pages_follow_cursor_newest_first(self, client, db):
+        self.create_actions(db, 5)
+        res = client.get('/api/actions?page_size=2')
+        assert [action['data']['number'] for action in res.json['data']] == [4, 3]
+        assert 'count' not in res.json
+        numbers = []
+        cursor = res.json['cursor']
+        while cursor:
+            res = client.get('/api/actions', query_string={'page_size': 2, 'cursor': cursor})
+            numbers += [action['data']['number'] for action in res.json['data']]
+            cursor = res.json['cursor']
+        # actions with the same timestamp are ordered by id
+        assert numbers == [2, 1, 0]
+
+    def test_filters_and_count(self, client, db):
+        self.create_actions(db, 6)
+        res = client.get('/api/actions', query_string={'event_name': Action.INVITE_USER_TO_CHANNEL, 'status': 'true',
+                                                       'since': '2020-01-01T00:01:00', 'count': 'exact'})
+        assert [action['data']['number'] for action in res.json['data']] == [5]
+        assert res.json['count'] == 1
+        assert res.json['cursor'] is None
+
+    def test_invalid_cursor(self, client, db):
+        res = client.get('/api/actions?cursor=nonsense')
+        assert res.status_code == 400
+
+    def test_garbage_cursors(self, client, db):
+        for value in ['["2020-01-01", 1]', '["2020-01-01T00:00:00", "x"]', '[1, 2]', '"ab"', '{}', '\xff']:
+            cursor = base64.urlsafe_b64encode(value.encode()).decode()
+            res = client.get('/api/actions', query_string={'cursor': cursor})
+            assert res.status_code == 400
+
+    def test_cursor_timestamp_with_and_without_microseconds(self):
+        for timestamp in [datetime(2020, 1, 1, 12, 30), datetime(2020, 1, 1, 12, 30, 0, 500)]:
+            action = Action(id=7, timestamp=timestamp)
+            assert decode_cursor(encode_cursor(action)) == (timestamp, 7)
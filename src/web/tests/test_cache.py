@@ -0,0 +1,119 @@
+import time
+
+from unittest.mock import MagicMock, patch
+
+from backend.cache import TTLCache
+from backend.ldap.edap_client import TeapEdap
+
+
+class TestTTLCache:
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=2)
+        assert cache.get('a') is None
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # 'b' is least recently used now
+        cache.set('c', 3)
+        assert 'b' not in cache
+        assert 'a' in cache
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl_expiration(self):
+        cache = TTLCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+
+    def test_get_or_set_loads_once(self):
+        cache = TTLCache()
+        loader = MagicMock(return_value=[1, 2])
+        assert cache.get_or_set('key', loader) == [1, 2]
+        assert cache.get_or_set('key', loader) == [1, 2]
+        loader.assert_called_once_with()
+
+    def test_value_loaded_during_invalidation_is_not_cached(self):
+        cache = TTLCache()
+
+        def loader():
+            cache.invalidate()
+            return 'stale'
+
+        assert cache.get_or_set('key', loader) == 'stale'
+        assert 'key' not in cache
+
+
+@patch('backend.ldap.edap_client.Edap.__init__', MagicMock(return_value=None))
+class TestTeapEdapCache:
+
+    def make_edap(self, entries):
+        edap = TeapEdap('localhost', 'admin', 'admin', 'example.com', cache=TTLCache())
+        edap.ldap = MagicMock()
+        edap.ldap.search_s.return_value = [(entry['fqdn'], {k: v for k, v in entry.items() if k != 'fqdn'})
+                                           for entry in entries]
+        return edap
+
+    def test_divisions_are_cached_and_copied(self):
+        edap = self.make_edap([{'fqdn': 'cn=it,ou=divisions,dc=example,dc=com', 'cn': [b'it']}])
+        first = edap.get_divisions()
+        first[0]['cn'] = b'it'  # serializers unpack values in place
+        assert edap.get_divisions() == [{'fqdn': 'cn=it,ou=divisions,dc=example,dc=com', 'cn': [b'it']}]
+        assert edap.ldap.search_s.call_count == 1
+
+    def test_member_searches_are_not_cached(self):
+        edap = self.make_edap([])
+        edap.get_teams('memberUid=jdoe')
+        edap.get_teams('memberUid=jdoe')
+        assert edap.ldap.search_s.call_count == 2
+
+    @patch('backend.ldap.edap_client.Edap.create_team', create=True)
+    def test_write_invalidates_cache(self, create_team_mock):
+        edap = self.make_edap([])
+        edap.get_teams()
+        edap.create_team('fr-it', 'France IT')
+        edap.get_teams()
+        assert edap.ldap.search_s.call_count == 2
+
+    def test_group_reads_skip_members(self):
+        edap = self.make_edap([{'fqdn': 'cn=everybody,ou=teams,dc=example,dc=com', 'cn': [b'everybody']}])
+        assert edap.get_team('everybody')['cn'] == [b'everybody']
+        base_dn, _, search_filter = edap.ldap.search_s.call_args[0]
+        assert base_dn == 'ou=teams,dc=example,dc=com'
+        assert search_filter == '(&(objectClass=posixGroup)(cn=everybody))'
+        assert 'memberUid' not in edap.ldap.search_s.call_args[1]['attrlist']
+
+    def test_group_members(self):
+        edap = self.make_edap([{'fqdn': 'cn=it,ou=divisions,dc=example,dc=com', 'memberUid': [b'jdoe', b'adam']}])
+        assert edap.get_group_members('divisions', 'it') == ['adam', 'jdoe']
+        assert edap.ldap.search_s.call_args[1]['attrlist'] == ['memberUid']
+
+    def test_user_photo_is_cached_until_user_is_deleted(self):
+        edap = TeapEdap('localhost', 'admin', 'admin', 'example.com', photo_cache=TTLCache())
+        edap.ldap = MagicMock()
+        edap.ldap.search_s.return_value = [('uid=jdoe,ou=people,dc=example,dc=com', {'jpegPhoto': [b'jpeg']})]
+        photo, digest = edap.get_user_photo('jdoe')
+        assert photo == b'jpeg'
+        assert edap.get_user_photo('jdoe') == (photo, digest)
+        assert edap.ldap.search_s.call_count == 1
+        assert edap.ldap.search_s.call_args[1]['attrlist'] == ['jpegPhoto']
+
+        with patch('backend.ldap.edap_client.Edap.delete_user', create=True):
+            edap.delete_user('jdoe')
+        edap.get_user_photo('jdoe')
+        assert edap.ldap.search_s.call_count == 2
+
+    def test_user_searches_skip_photos(self):
+        edap = TeapEdap('localhost', 'admin', 'admin', 'example.com')
+        edap.ldap = MagicMock()
+        edap.ldap.search_s.return_value = [('uid=jdoe,ou=people,dc=example,dc=com', {'uid': [b'jdoe']})]
+        assert edap.get_user('jdoe') == {'fqdn': 'uid=jdoe,ou=people,dc=example,dc=com', 'uid': [b'jdoe']}
+        assert 'jpegPhoto' not in edap.ldap.search_s.call_args[1]['attrlist']
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import ldap
+
+from unittest.mock import MagicMock, patch
+
+from backend.concurrency import map_concurrently, iter_concurrently
+from backend.ldap.models import LdapTeam
+
+
+def test_map_concurrently_keeps_order_and_errors(app):
+    def func(item):
+        if item == 2:
+            raise ValueError('bad item')
+        return item * 10
+
+    results = map_concurrently(func, [1, 2, 3], max_workers=2)
+    assert [(item, result) for item, result, _ in results] == [(1, 10), (2, None), (3, 30)]
+    assert isinstance(results[1][2], ValueError)
+
+
+def test_iter_concurrently_bounds_in_flight_calls(app):
+    in_flight = []
+    max_in_flight = []
+    lock = threading.Lock()
+
+    def func(item):
+        with lock:
+            in_flight.append(item)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(item)
+
+    results = list(iter_concurrently(func, iter(range(10)), max_workers=3))
+    assert len(results) == 10
+    assert max(max_in_flight) <= 3
+
+
+@patch('backend.ldap.models.get_edap')
+def test_create_many_teams_skips_existing(get_edap_mock, app):
+    edap = get_edap_mock.return_value
+    edap.get_teams.return_value = [{'cn': [b'fr-it']}]
+    edap.create_team = MagicMock(side_effect=[None, ldap.ALREADY_EXISTS()])
+
+    results = LdapTeam.create_many([('fr-it', 'France IT'), ('fr-hr', 'France HR'), ('fr-leg', 'France Legal')],
+                                   max_workers=1)
+
+    statuses = {each['machine_name']: each['status'] for each in results}
+    assert statuses == {'fr-it': 'exists', 'fr-hr': 'created', 'fr-leg': 'exists'}
+    assert edap.create_team.call_count == 2
@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from backend.core.models import JobRecord
+from backend.jobs import Job, JobRunner, Step, run_steps, RUNNING, SUCCEEDED, FAILED, SKIPPED
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def wait_finished(job, timeout=5):
+    wait_for(lambda: job.finished, timeout=timeout)
+
+
+@pytest.mark.usefixtures('app')
+class TestJob:
+
+    def test_steps_results_and_progress(self):
+        job = Job('create', [Step('ldap', lambda: 'entry'), Step('rocket', lambda: {'success': True}, ('ldap',))],
+                  make_result=lambda results: results['rocket'])
+        assert job.to_dict()['progress'] == 0
+        job.run()
+        data = job.to_dict()
+        assert data['status'] == SUCCEEDED
+        assert data['progress'] == 1
+        assert data['result'] == {'success': True}
+        assert [step['status'] for step in data['steps']] == [SUCCEEDED, SUCCEEDED]
+
+    def test_failure_skips_dependent_steps(self):
+        rocket = MagicMock()
+        job = Job('create', [Step('ldap', MagicMock(side_effect=Exception('exists'))),
+                             Step('teams', MagicMock(), ('ldap',)), Step('rocket', rocket, ('teams',))])
+        job.run()
+        assert job.status == FAILED
+        assert [step.status for step in job.steps] == [FAILED, SKIPPED, SKIPPED]
+        assert job.steps[0].message == 'exists'
+        assert not rocket.called
+
+    def test_failure_doesnt_stop_independent_steps(self):
+        rocket = MagicMock()
+        job = Job('create', [Step('folder', MagicMock(side_effect=Exception('no nextcloud'))), Step('rocket', rocket)])
+        job.run()
+        assert job.status == FAILED
+        assert rocket.called
+
+    def test_independent_steps_run_concurrently(self):
+        order = []
+        steps = [Step('ldap', lambda: order.append('ldap'))] + [
+            Step(name, lambda: order.append(time.sleep(0.1)), ('ldap',)) for name in ('teams', 'folder', 'rocket')]
+        started = time.monotonic()
+        assert run_steps(steps)
+        assert time.monotonic() - started < 0.25
+        assert order[0] == 'ldap'
+
+
+def test_runner_runs_jobs_in_background(app, db):
+    runner = JobRunner(max_workers=1)
+    job = runner.submit('create', [Step('ldap', lambda: None)])
+    wait_finished(job)
+    assert runner.get(job.id)['status'] == SUCCEEDED
+    assert runner.get('unknown') is None
+
+
+def test_job_is_seen_by_other_workers(app, db):
+    started, release = threading.Event(), threading.Event()
+    runner, other_worker_runner = JobRunner(max_workers=1), JobRunner(max_workers=1)
+    job = runner.submit('create', [Step('ldap', lambda: started.set() or release.wait(5))])
+    assert started.wait(5)
+    assert other_worker_runner.get(job.id)['status'] == RUNNING
+    assert wait_for(lambda: other_worker_runner.get(job.id)['steps'][0]['status'] == RUNNING)
+    release.set()
+    wait_finished(job)
+    assert other_worker_runner.get(job.id)['steps'][0]['status'] == SUCCEEDED
+    assert [data['id'] for data in other_worker_runner.list()] == [job.id]
+
+
+def test_job_not_updated_is_reported_failed(app, db):
+    release = threading.Event()
+    runner = JobRunner(max_workers=1, stale_after=60)
+    job = runner.submit('create', [Step('ldap', lambda: release.wait(5))])
+    assert wait_for(lambda: runner.get(job.id)['steps'][0]['status'] == RUNNING)
+    db.session.execute(JobRecord.__table__.update().values(updated_at=datetime.utcnow() - timedelta(seconds=61)))
+    db.session.commit()
+    data = runner.get(job.id)
+    release.set()
+    wait_finished(job)
+    assert data['status'] == FAILED
+    assert data['steps'][0]['message'] == 'Job was interrupted'
+
+
+def test_create_franchise_returns_job(client, app, db):
+    franchise_steps = [('ldap', MagicMock(return_value=None), ()), ('rocket', MagicMock(return_value={}), ('ldap',))]
+    with patch('backend.ldap.api.LdapFranchise.check_exists_by_display_name', return_value=False), \
+            patch('backend.ldap.api.LdapFranchise.provisioning_steps', return_value=franchise_steps):
+        res = client.post('/api/ldap/franchises', json={'machineName': 'fr', 'displayName': 'France'})
+    assert res.status_code == 202
+    location = res.headers['Location']
+    assert wait_for(lambda: client.get(location).json['status'] in (SUCCEEDED, FAILED))
+    res = client.get(location)
+    assert res.json['status'] == SUCCEEDED
+    assert res.json['result'] == {'rocket': {}, 'folder': {'success': None}}
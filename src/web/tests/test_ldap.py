@@ -1,4 +1,7 @@
-from backend.ldap.utils import merge_divisions
+import json
+from unittest.mock import MagicMock, patch
+
+from backend.ldap.utils import merge_divisions, classify_groups
 
 
 def test_merge_divisions():
@@ -35,4 +38,84 @@ def test_merge_divisions():
             raise Exception('Unknown division')
 
 
+def test_classify_groups():
+    groups = [{'fqdn': 'cn=fr,ou=franchises,dc=entint,dc=org', 'cn': [b'fr']},
+              {'fqdn': 'cn=it,ou=divisions,dc=entint,dc=org', 'cn': [b'it']},
+              {'fqdn': 'cn=fr-it,ou=teams,dc=entint,dc=org', 'cn': [b'fr-it']},
+              {'fqdn': 'cn=everybody,ou=teams,dc=entint,dc=org', 'cn': [b'everybody']},
+              {'fqdn': 'cn=random,ou=groups,dc=entint,dc=org', 'cn': [b'random']}]
+    units = classify_groups(groups)
+    assert [each['cn'] for each in units['franchises']] == [[b'fr']]
+    assert [each['cn'] for each in units['divisions']] == [[b'it']]
+    assert [each['cn'] for each in units['teams']] == [[b'fr-it'], [b'everybody']]
+
+
+def test_user_photo_etag(client):
+    edap = MagicMock()
+    edap.get_user_photo.return_value = (b'jpeg', 'abc')
+    with patch('backend.ldap.utils.get_edap', return_value=edap):
+        res = client.get('/api/ldap/users/jdoe/photo')
+        assert res.status_code == 200
+        assert res.data == b'jpeg'
+        assert res.headers['ETag'] == '"abc"'
+        res = client.get('/api/ldap/users/jdoe/photo', headers={'If-None-Match': '"abc"'})
+        assert res.status_code == 304
+
+
+def test_group_members_pages(client):
+    edap = MagicMock()
+    edap.get_group_members.return_value = ['adam', 'jdoe', 'zoe']
+    with patch('backend.ldap.utils.get_edap', return_value=edap):
+        res = client.get('/api/ldap/teams/everybody/members?page_size=2')
+        assert res.json == {'data': ['adam', 'jdoe'], 'total': 3, 'cursor': 'jdoe'}
+        res = client.get('/api/ldap/teams/everybody/members?page_size=2&cursor=jdoe')
+        assert res.json == {'data': ['zoe'], 'total': 3, 'cursor': None}
+    edap.get_group_members.assert_called_with('teams', 'everybody')
+
+
+def test_user_import_reports_every_row(client):
+    everybody = MagicMock(machine_name='everybody')
+    csv_body = ('uid,name,surname,mail,password\njdoe,John,Doe,jdoe@example.com,secret\nnoname,,Doe,,secret\n'
+                'adoe,Anna,Doe,adoe@example.com,no-chat\n')
+    with patch('backend.ldap.api.LdapTeam.get_everybody_team', return_value=everybody), \
+            patch('backend.ldap.api.LdapUser.create_for_import',
+                  side_effect=lambda password, team: {'rocket': {'success': password == 'secret'}}) as create, \
+            patch('backend.ldap.api.request_ldap_cache_flush', return_value=None) as flush:
+        res = client.post('/api/ldap/users/import', data=csv_body, content_type='text/csv')
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+
+    results = {line['row']: line for line in lines[:-1]}
+    assert results[1]['status'] == 'created'
+    assert results[2]['status'] == 'invalid' and 'name' in results[2]['errors']
+    assert results[3]['status'] == 'chat_failed'
+    assert lines[-1]['summary'] == {'created': 1, 'chat_failed': 1, 'invalid': 1, 'failed': 0}
+    create.assert_any_call('secret', everybody)
+    flush.assert_called_once_with(wait=True)
+
+
+def test_user_import_concurrency_is_bounded_by_pool(client, app):
+    app.extensions['edap_pool'].size = 4
+    with patch('backend.ldap.api.LdapTeam.get_everybody_team'), \
+            patch('backend.ldap.api.iter_concurrently', return_value=iter([])) as iter_concurrently:
+        client.post('/api/ldap/users/import', data='uid,name,surname,mail,password\n', content_type='text/csv')
+    assert iter_concurrently.call_args[1]['max_workers'] == 2
+
+
+def test_user_import_rejects_unknown_format(client):
+    res = client.post('/api/ldap/users/import', data='<users/>', content_type='application/xml')
+    assert res.status_code == 415
+
 
+def test_sync_franchise_channel_members(client):
+    edap = MagicMock()
+    edap.get_unit_group.return_value = {'fqdn': 'cn=fr,ou=franchises,dc=example,dc=com', 'cn': [b'fr'],
+                                        'description': [b'France']}
+    edap.get_group_members.return_value = ['adam', 'jdoe']
+    report = {'channel': 'Franchise-France', 'invited': ['jdoe'], 'kicked': [], 'missing': [], 'failed': []}
+    with patch('backend.ldap.utils.get_edap', return_value=edap), \
+            patch('backend.ldap.models.rutils.rocket_service') as rocket_service:
+        rocket_service.sync_channel_members.return_value = report
+        res = client.post('/api/ldap/franchises/fr/chat/sync')
+    assert res.status_code == 200
+    assert res.json == report
+    rocket_service.sync_channel_members.assert_called_once_with('Franchise-France', ['adam', 'jdoe'], max_workers=8)
@@ -0,0 +1,110 @@
+import sys
+
+import ldap
+import pytest
+
+from unittest.mock import MagicMock, patch
+
+from edap import ObjectDoesNotExist
+
+from backend.jobs import Step, run_steps, FAILED, SUCCEEDED
+from backend.ldap.models import LdapFranchise, LdapTeam, LdapUser
+
+
+@pytest.fixture
+def edap_mock():
+    edap = MagicMock()
+    with patch('backend.ldap.models.get_edap', return_value=edap), \
+            patch('backend.ldap.utils.get_edap', return_value=edap):
+        edap.get_franchises.return_value = [{'fqdn': 'cn=fr,ou=franchises,dc=example,dc=com',
+                                             'cn': [b'fr'], 'description': [b'France']}]
+        edap.get_divisions.return_value = [{'fqdn': 'cn=it,ou=divisions,dc=example,dc=com',
+                                            'cn': [b'it'], 'description': [b'IT']}]
+        edap.make_team_machine_name = lambda franchise, division: f'{franchise}-{division}'
+        edap.make_team_display_name = lambda franchise, division: f'{franchise} {division}'
+        edap.get_teams.return_value = []
+        yield edap
+
+
+def test_provisioning_steps_fail_on_unsuccessful_results(edap_mock, app):
+    franchise = LdapFranchise(machine_name='fr', display_name='France')
+    edap_mock.create_team = MagicMock(side_effect=Exception('no space'))
+    with patch.object(LdapFranchise, 'check_exists_by_display_name', return_value=False), \
+            patch.object(LdapFranchise, 'create_folder', return_value=False), \
+            patch.object(LdapFranchise, 'create_channel', return_value={'success': False, 'error': 'duplicate'}):
+        steps = [Step(name, func, depends) for name, func, depends in franchise.provisioning_steps()]
+        assert not run_steps(steps)
+    statuses = {step.name: step.status for step in steps}
+    assert statuses == {'ldap': SUCCEEDED, 'teams': FAILED, 'folder': FAILED, 'rocket': FAILED}
+    messages = {step.name: step.message for step in steps}
+    assert messages['teams'] == 'Failed to create teams: fr-it (no space)'
+    assert 'duplicate' in messages['rocket']
+
+
+def test_virtual_teams(edap_mock, app):
+    edap_mock.unit_dn = lambda unit: f'ou={unit},dc=example,dc=com'
+    teams = LdapTeam.get_virtual_teams()
+    assert [(team.machine_name, team.display_name) for team in teams] == [('fr-it', 'France IT')]
+    assert teams[0].fqdn == 'cn=fr-it,ou=teams,dc=example,dc=com'
+
+
+def test_ensure_team_exists_creates_missing_team(edap_mock, app):
+    edap_mock.get_team.side_effect = ObjectDoesNotExist()
+    edap_mock.get_team_component_units.return_value = (edap_mock.get_franchises.return_value[0],
+                                                       edap_mock.get_divisions.return_value[0])
+    result = LdapTeam.ensure_exists('fr-it')
+    assert result['status'] == 'created'
+    edap_mock.create_team.assert_called_once_with('fr-it', 'France IT')
+    assert not edap_mock.get_franchises.called
+
+
+def test_ensure_existing_team_exists(edap_mock, app):
+    assert LdapTeam.ensure_exists('fr-it')['status'] == 'exists'
+    assert not edap_mock.create_team.called
+
+
+def test_ensure_unknown_team_exists(edap_mock, app):
+    edap_mock.get_team.side_effect = ObjectDoesNotExist()
+    edap_mock.get_team_component_units.side_effect = ObjectDoesNotExist()
+    with pytest.raises(ObjectDoesNotExist):
+        LdapTeam.ensure_exists('unknown')
+    assert not edap_mock.create_team.called
+
+
+@patch('backend.ldap.models.rutils.rocket_service')
+def test_delete_user_reports_steps(rocket_service_mock, edap_mock, app):
+    edap_mock.get_user_groups.return_value = [{'fqdn': 'cn=fr,ou=franchises,dc=example,dc=com'},
+                                              {'fqdn': 'cn=it,ou=divisions,dc=example,dc=com'}]
+    rocket_service_mock.get_user_id.return_value = 'rocket-id'
+    rocket_service_mock.delete_user.return_value = MagicMock(status_code=200)
+
+    result = LdapUser(uid='jdoe').delete()
+
+    assert result['groups']['success'] and result['ldap']['success'] and result['rocket']['success']
+    assert [each['success'] for each in result['groups']['result']] == [True, True]
+    assert edap_mock.remove_uid_member_of.call_count == 2
+    edap_mock.delete_user.assert_called_once_with('jdoe')
+    rocket_service_mock.delete_user.assert_called_once_with('rocket-id', username='jdoe')
+
+
+@patch('backend.ldap.models.rutils.rocket_service')
+def test_delete_user_keeps_entry_if_group_removal_failed(rocket_service_mock, edap_mock, app):
+    edap_mock.get_user_groups.return_value = [{'fqdn': 'cn=fr,ou=franchises,dc=example,dc=com'}]
+    edap_mock.remove_uid_member_of.side_effect = ldap.SERVER_DOWN()
+    rocket_service_mock.get_user_id.return_value = None
+
+    result = LdapUser(uid='jdoe').delete()
+
+    assert not result['ldap']['success']
+    assert not edap_mock.delete_user.called
+    assert result['rocket'] == {'success': True, 'duration': result['rocket']['duration'], 'result': False}
+
+
+def test_models_are_slotted_and_intern_names():
+    from backend.ldap.serializers import edap_teams_schema
+    team, = edap_teams_schema.load([{'fqdn': 'cn=fr-it,ou=teams,dc=example,dc=com', 'cn': [b'fr-it'],
+                                     'description': [b'France IT']}])
+    assert not hasattr(team, '__dict__')
+    assert not hasattr(LdapUser(uid='jdoe'), '__dict__')
+    assert team.machine_name is sys.intern(''.join(['fr-', 'it']))
+    assert LdapTeam(machine_name='Team', nextcloud_string_operation='lowercase').n_conversion_fun('Team') == 'team'
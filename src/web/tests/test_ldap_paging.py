@@ -0,0 +1,150 @@
+import re
+
+from unittest.mock import MagicMock
+
+import ldap
+import pytest
+from ldap.controls import SimplePagedResultsControl
+
+from backend.ldap.paging import iter_pages, search_after
+
+
+def make_connection(pages):
+    """ Mock ldap connection returning `pages` of entries one by one for paged search """
+    conn = MagicMock()
+    results = []
+    for number, page in enumerate(pages):
+        cookie = str(number + 1).encode() if number + 1 < len(pages) else b''
+        control = MagicMock(controlType=SimplePagedResultsControl.controlType, cookie=cookie)
+        data = [(f'uid={uid},ou=people,dc=example,dc=com', {'uid': [uid.encode()]}) for uid in page]
+        results.append((101, data, 1, [control]))
+    conn.result3.side_effect = results
+    return conn
+
+
+def test_iter_pages():
+    conn = make_connection([['alice', 'bob'], ['carol']])
+    pages = list(iter_pages(conn, 'ou=people,dc=example,dc=com', '(uid=*)', page_size=2, sort_by='uid'))
+    assert [[entry['uid'] for entry in page] for page in pages] == [[[b'alice'], [b'bob']], [[b'carol']]]
+    assert pages[0][0]['fqdn'] == 'uid=alice,ou=people,dc=example,dc=com'
+    assert conn.search_ext.call_count == 2
+
+
+def test_iter_pages_abandons_unfinished_search():
+    conn = make_connection([['alice', 'bob'], ['carol']])
+    pages = iter_pages(conn, 'ou=people,dc=example,dc=com', '(uid=*)', page_size=2)
+    next(pages)
+    pages.close()
+    assert conn.search_ext.call_count == 2
+    assert conn.search_ext.call_args[1]['serverctrls'][0].size == 0
+
+
+class FakeLdapServer:
+    """
+    Ldap connection serving `uids` in storage order with Simple Paged Results control. Like the standard schema,
+    uid has only equality and substrings matching rules: ordering filters and critical sorting by it are rejected.
+    """
+
+    def __init__(self, uids, base_dn='ou=people,dc=example,dc=com'):
+        self.entries = [(f'uid={uid},{base_dn}', {'uid': [uid.encode()], 'cn': [uid.title().encode()]})
+                        for uid in uids]
+        self.filters = []
+        self._results = {}
+
+    def search_ext(self, base_dn, scope, search_filter, attrlist=None, serverctrls=()):
+        self.filters.append(search_filter)
+        if '>=' in search_filter or '<=' in search_filter:
+            raise ldap.INAPPROPRIATE_MATCHING({'desc': 'uid has no ordering matching rule'})
+        paging = None
+        for control in serverctrls:
+            if isinstance(control, SimplePagedResultsControl):
+                paging = control
+            elif control.criticality:
+                raise ldap.UNAVAILABLE_CRITICAL_EXTENSION({'desc': 'uid has no ordering matching rule'})
+        matches = [(dn, self._project(attrs, attrlist)) for dn, attrs in self.entries
+                   if self._matches(search_filter, attrs)]
+        start = int(paging.cookie or 0)
+        end = start + paging.size
+        cookie = str(end).encode() if paging.size and end < len(matches) else b''
+        msgid = len(self.filters)
+        self._results[msgid] = (matches[start:end], [SimplePagedResultsControl(True, size=0, cookie=cookie)])
+        return msgid
+
+    def result3(self, msgid):
+        data, controls = self._results.pop(msgid)
+        return 101, data, msgid, controls
+
+    @staticmethod
+    def _project(attrs, attrlist):
+        return {name: values for name, values in attrs.items() if attrlist is None or name in attrlist}
+
+    def _matches(self, search_filter, attrs):
+        """ Evaluate `(&...)`, `(|...)` and `(uid=value*)` filters """
+        body = search_filter[1:-1]
+        if body[0] in '&|':
+            parts, depth, part_start = [], 0, 1
+            for index, char in enumerate(body[1:], start=1):
+                depth += {'(': 1, ')': -1}.get(char, 0)
+                if depth == 0:
+                    parts.append(body[part_start:index + 1])
+                    part_start = index + 1
+            results = [self._matches(part, attrs) for part in parts]
+            return all(results) if body[0] == '&' else any(results)
+        attribute, pattern = body.split('=', 1)
+        pieces = [re.sub(r'\\([0-9a-f]{2})', lambda match: chr(int(match.group(1), 16)), piece)
+                  for piece in pattern.split('*')]
+        pattern = '.*'.join(re.escape(piece) for piece in pieces)
+        return any(re.fullmatch(pattern, value.decode(), re.IGNORECASE) for value in attrs.get(attribute, []))
+
+
+class TestSearchAfter:
+    BASE_DN = 'ou=people,dc=example,dc=com'
+
+    def iter_all_pages(self, conn, search_filter='(uid=*)', page_size=2):
+        after = None
+        while True:
+            entries, after = search_after(conn, self.BASE_DN, search_filter, attrlist=['uid', 'cn'],
+                                          page_size=page_size, after=after)
+            yield [entry['uid'][0].decode() for entry in entries], after
+            if after is None:
+                break
+
+    def test_fake_server_enforces_matching_rules(self):
+        conn = FakeLdapServer(['alice'])
+        with pytest.raises(ldap.INAPPROPRIATE_MATCHING):
+            conn.search_ext(self.BASE_DN, ldap.SCOPE_SUBTREE, '(uid>=alice)')
+
+    def test_pages_are_sorted_by_uid(self):
+        conn = FakeLdapServer(['dave', 'Alice', 'erin', 'carol', 'bob'])
+        assert list(self.iter_all_pages(conn)) == [(['Alice', 'bob'], 'bob'), (['carol', 'dave'], 'dave'),
+                                                   (['erin'], None)]
+
+    def test_entries_have_requested_attributes(self):
+        conn = FakeLdapServer(['bob', 'alice'])
+        entries, after = search_after(conn, self.BASE_DN, '(uid=*)', attrlist=['uid', 'cn'], page_size=1)
+        assert entries == [{'fqdn': 'uid=alice,ou=people,dc=example,dc=com', 'uid': [b'alice'], 'cn': [b'Alice']}]
+        assert after == 'alice'
+
+    def test_next_page_is_stateless(self):
+        uids = ['carol', 'alice', 'bob']
+        entries, after = search_after(FakeLdapServer(uids), self.BASE_DN, '(uid=*)', page_size=2)
+        # any worker can continue with its own connection
+        entries, after = search_after(FakeLdapServer(uids), self.BASE_DN, '(uid=*)', page_size=2, after=after)
+        assert [entry['uid'] for entry in entries] == [[b'carol']]
+        assert after is None
+
+    def test_query(self):
+        conn = FakeLdapServer(['carl', 'bob', 'carol', 'alice'])
+        assert list(self.iter_all_pages(conn, search_filter='(uid=car*)')) == [(['carl', 'carol'], None)]
+
+    def test_page_larger_than_filter_chunk(self):
+        uids = [f'user{number:03}' for number in range(250)]
+        conn = FakeLdapServer(reversed(uids))
+        pages = list(self.iter_all_pages(conn, page_size=120))
+        assert [uid for page, _ in pages for uid in page] == uids
+        assert [after for _, after in pages] == ['user119', 'user239', None]
+
+    def test_empty_result(self):
+        conn = FakeLdapServer(['alice'])
+        assert search_after(conn, self.BASE_DN, '(uid=bob*)', page_size=2) == ([], None)
+        assert search_after(conn, self.BASE_DN, '(uid=*)', page_size=2, after='alice') == ([], None)
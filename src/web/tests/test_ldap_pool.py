@@ -0,0 +1,96 @@
+import threading
+
+import ldap
+import pytest
+
+from unittest.mock import MagicMock
+
+from backend.ldap.pool import EdapPool, PoolTimeout, ErrorTrackingConnection
+
+
+@pytest.fixture
+def pool():
+    return EdapPool(factory=MagicMock, size=2, timeout=0.1, keepalive=60)
+
+
+class TestEdapPool:
+
+    def test_connection_is_reused(self, pool):
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        assert first is second
+        assert pool.stats()['created'] == 1
+        assert pool.stats()['checkouts'] == 2
+
+    def test_stats_in_use_and_idle(self, pool):
+        edap = pool.checkout()
+        stats = pool.stats()
+        assert stats['in_use'] == 1
+        assert stats['idle'] == 0
+        pool.checkin(edap)
+        stats = pool.stats()
+        assert stats['in_use'] == 0
+        assert stats['idle'] == 1
+
+    def test_timeout_when_exhausted(self, pool):
+        pool.checkout()
+        pool.checkout()
+        with pytest.raises(PoolTimeout):
+            pool.checkout()
+
+    def test_waiter_gets_released_connection(self, pool):
+        pool.timeout = 2
+        first = pool.checkout()
+        pool.checkout()
+        threading.Timer(0.05, pool.checkin, args=(first,)).start()
+        assert pool.checkout() is first
+        assert pool.stats()['wait_max'] > 0
+
+    def test_server_down_discards_connection(self, pool):
+        with pytest.raises(ldap.SERVER_DOWN):
+            with pool.connection() as edap:
+                raise ldap.SERVER_DOWN()
+        edap.ldap.unbind_s.assert_called_once_with()
+        assert pool.stats()['created'] == 0
+        with pool.connection() as new_edap:
+            assert new_edap is not edap
+
+    def test_connection_error_caught_by_caller_discards_connection(self, pool):
+        edap = MagicMock()
+        edap.ldap = ErrorTrackingConnection(MagicMock())
+        edap.ldap.conn.search_s.side_effect = ldap.TIMEOUT()
+        pool.factory = lambda: edap
+        with pool.connection() as conn:
+            with pytest.raises(ldap.TIMEOUT):
+                conn.ldap.search_s('ou=people,dc=example,dc=com', ldap.SCOPE_SUBTREE)
+        assert edap.ldap.broken
+        assert pool.stats()['created'] == 0
+        assert pool.stats()['idle'] == 0
+
+    def test_other_ldap_errors_keep_connection(self, pool):
+        edap = MagicMock()
+        edap.ldap = ErrorTrackingConnection(MagicMock())
+        edap.ldap.conn.add_s.side_effect = ldap.ALREADY_EXISTS()
+        pool.factory = lambda: edap
+        with pool.connection() as conn:
+            with pytest.raises(ldap.ALREADY_EXISTS):
+                conn.ldap.add_s('uid=john,ou=people,dc=example,dc=com', [])
+        assert not edap.ldap.broken
+        assert pool.stats()['idle'] == 1
+
+    def test_dead_idle_connection_is_replaced(self, pool):
+        pool.keepalive = 0
+        with pool.connection() as edap:
+            edap.ldap.whoami_s.side_effect = ldap.SERVER_DOWN()
+        with pool.connection() as new_edap:
+            assert new_edap is not edap
+        assert pool.stats()['reconnects'] == 1
+
+    def test_factory_failure_frees_slot(self, pool):
+        pool.factory = MagicMock(side_effect=ldap.SERVER_DOWN())
+        with pytest.raises(ldap.SERVER_DOWN):
+            pool.checkout()
+        assert pool.stats()['created'] == 0
+        assert pool.stats()['in_use'] == 0
@@ -1,4 +1,8 @@
+import threading
+import time
+
 import pytest
+import requests
 
 from unittest.mock import patch, MagicMock
 
@@ -306,3 +310,190 @@ class TestGroupWithFolderApi:
         nextcloud_mock.add_group.assert_called_once_with(data['group_name'])
         nextcloud_mock.create_group_folder.assert_called_once_with('/'.join([data['group_type'], data['group_name']]))
         nextcloud_mock.delete_group.assert_called_once_with(data['group_name'])
+
+
+class TestLdapCacheFlusher:
+
+    @staticmethod
+    def make_flusher(delay=0.05):
+        from backend.nextcloud.utils import LdapCacheFlusher
+        nextcloud = MagicMock()
+        nextcloud.get_ldap_lowest_existing_config_id.return_value = 's01'
+        nextcloud.ldap_cache_flush.return_value = MagicMock(is_ok=True)
+        return LdapCacheFlusher(lambda: nextcloud, delay=delay), nextcloud
+
+    def test_requests_are_coalesced(self):
+        flusher, nextcloud = self.make_flusher()
+        for _ in range(5):
+            flusher.request()
+        time.sleep(0.2)
+        nextcloud.ldap_cache_flush.assert_called_once_with('s01')
+        assert flusher.stats()['requests'] == 5
+        assert not flusher.stats()['pending']
+
+    def test_sync_flush_serves_pending_requests_and_caches_config_id(self):
+        flusher, nextcloud = self.make_flusher(delay=60)
+        flusher.request()
+        flusher.request(wait=True)
+        flusher.request(wait=True)
+        assert nextcloud.ldap_cache_flush.call_count == 2
+        nextcloud.get_ldap_lowest_existing_config_id.assert_called_once_with()
+        assert not flusher.stats()['pending']
+
+    def test_failed_flush_refetches_config_id(self):
+        flusher, nextcloud = self.make_flusher()
+        flusher.request(wait=True)
+        nextcloud.ldap_cache_flush.side_effect = [MagicMock(is_ok=False), MagicMock(is_ok=True)]
+        flusher.request(wait=True)
+        assert nextcloud.get_ldap_lowest_existing_config_id.call_count == 2
+
+    def test_failed_background_flush_is_retried(self):
+        flusher, nextcloud = self.make_flusher(delay=0.02)
+        nextcloud.ldap_cache_flush.side_effect = [Exception('unavailable'), MagicMock(is_ok=True)]
+        flusher.request()
+        time.sleep(0.3)
+        assert nextcloud.ldap_cache_flush.call_count == 2
+        assert flusher.stats()['failures'] == 1
+        assert not flusher.stats()['pending']
+        assert flusher.stats()['retries'] == 0
+
+
+class TestGroupFolderIndex:
+
+    @staticmethod
+    def make_nextcloud():
+        nextcloud = MagicMock()
+        nextcloud.get_group_folders.return_value = MagicMock(data={
+            '1': {'mount_point': 'Franchises', 'groups': {'everybody': 1}},
+        })
+        return nextcloud
+
+    def test_lookups_are_served_from_index(self):
+        from backend.nextcloud.folder_index import GroupFolderIndex
+        index, nextcloud = GroupFolderIndex(), self.make_nextcloud()
+        assert index.get(nextcloud, 'Franchises') == {'id': '1', 'groups': {'everybody': 1}}
+        assert index.get(nextcloud, 'Franchises')['id'] == '1'
+        nextcloud.get_group_folders.assert_called_once_with()
+
+    def test_created_folders_are_applied_in_place(self):
+        from backend.nextcloud.folder_index import GroupFolderIndex
+        index, nextcloud = GroupFolderIndex(), self.make_nextcloud()
+        index.refresh(nextcloud)
+        index.add('Franchises/fr', 2)
+        index.set_access(2, 'fr', 31)
+        assert index.get(nextcloud, 'Franchises/fr') == {'id': '2', 'groups': {'fr': 31}}
+        assert nextcloud.get_group_folders.call_count == 1
+
+    def test_miss_and_ttl_trigger_refresh(self):
+        from backend.nextcloud.folder_index import GroupFolderIndex
+        index, nextcloud = GroupFolderIndex(ttl=60, miss_refresh=0), self.make_nextcloud()
+        assert index.get(nextcloud, 'Divisions') is None
+        assert index.get(nextcloud, 'Divisions') is None
+        assert nextcloud.get_group_folders.call_count == 2
+        index.miss_refresh = 60
+        assert index.get(nextcloud, 'Divisions') is None
+        assert nextcloud.get_group_folders.call_count == 2
+
+    def test_concurrent_lookups_refresh_once(self):
+        from backend.nextcloud.folder_index import GroupFolderIndex
+        index, nextcloud = GroupFolderIndex(), self.make_nextcloud()
+        response = nextcloud.get_group_folders.return_value
+        nextcloud.get_group_folders.side_effect = lambda: time.sleep(0.1) or response
+        threads = [threading.Thread(target=index.get, args=(nextcloud, 'Franchises')) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        nextcloud.get_group_folders.assert_called_once_with()
+
+    def test_lookups_are_not_blocked_by_refresh(self):
+        from backend.nextcloud.folder_index import GroupFolderIndex
+        index, nextcloud = GroupFolderIndex(miss_refresh=0), self.make_nextcloud()
+        index.refresh(nextcloud)
+        response = nextcloud.get_group_folders.return_value
+        fetching, release = threading.Event(), threading.Event()
+        nextcloud.get_group_folders.side_effect = lambda: fetching.set() or release.wait(5) and response
+        refresh = threading.Thread(target=index.get, args=(nextcloud, 'Divisions'))
+        refresh.start()
+        assert fetching.wait(5)
+        try:
+            assert index.get(nextcloud, 'Franchises')['id'] == '1'
+        finally:
+            release.set()
+            refresh.join()
+
+
+class TestNextcloudConnections:
+
+    @staticmethod
+    def serve():
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.send_header('Set-Cookie', 'nc_session_id=1')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_connections_are_reused(self):
+        from backend.nextcloud.connections import NextcloudHttp
+        server = self.serve()
+        http = NextcloudHttp(pool_size=2)
+        try:
+            for _ in range(5):
+                assert http.get(f'http://127.0.0.1:{server.server_port}/ocs', params={'format': 'json'}).text == 'ok'
+        finally:
+            server.shutdown()
+        stats = http.stats()
+        assert stats['calls'] == 5
+        assert stats['connections_opened'] == 1
+        assert stats['connections_reused'] == 4
+        assert not http.session.cookies
+        assert http.RequestException is requests.RequestException
+
+    def test_client_per_thread(self):
+        from backend.nextcloud.connections import NextcloudClients
+        clients = NextcloudClients(MagicMock)
+        client = clients.get()
+        assert clients.get() is client
+        other = []
+        thread = threading.Thread(target=lambda: other.append(clients.get()))
+        thread.start()
+        thread.join()
+        assert other[0] is not client
+        assert clients.stats() == {'clients': 2}
+
+    def test_install_patches_nextcloud_requester(self):
+        from nextcloud import requester
+        from backend.nextcloud.connections import NextcloudHttp, install
+        original = requester.requests
+        http = NextcloudHttp()
+        try:
+            install(http)
+            assert requester.requests is http
+        finally:
+            requester.requests = original
+
+    def test_requester_is_the_only_module_calling_requests(self):
+        """ Fails if nextcloud-API layout changes and `install` doesn't cover all its HTTP calls anymore """
+        import sys
+        import nextcloud  # noqa: F401, loads all api wrappers modules
+        from nextcloud import requester
+        from backend.nextcloud.connections import NextcloudHttp
+        assert requester.requests is requests or isinstance(requester.requests, NextcloudHttp)
+        assert hasattr(requester, 'Requester')
+        modules = {name: module for name, module in list(sys.modules.items()) if name.split('.')[0] == 'nextcloud'}
+        others = [name for name, module in modules.items()
+                  if name != 'nextcloud.requester' and getattr(module, 'requests', None) is requests]
+        assert others == []
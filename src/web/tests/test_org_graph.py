@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+from backend.ldap.org_graph import OrgGraph
+
+ENTRIES = [
+    {'fqdn': 'uid=jdoe,ou=people,dc=example,dc=com', 'objectClass': [b'inetOrgPerson'], 'uid': [b'jdoe'],
+     'givenName': [b'John'], 'sn': [b'Doe'], 'modifyTimestamp': [b'20191101000000Z']},
+    {'fqdn': 'cn=fr,ou=franchises,dc=example,dc=com', 'objectClass': [b'posixGroup'], 'cn': [b'fr'],
+     'description': [b'France'], 'memberUid': [b'jdoe'], 'modifyTimestamp': [b'20191102000000Z']},
+    {'fqdn': 'cn=it,ou=divisions,dc=example,dc=com', 'objectClass': [b'posixGroup'], 'cn': [b'it'],
+     'description': [b'IT'], 'modifyTimestamp': [b'20191101000000Z']},
+    {'fqdn': 'cn=fr-it,ou=teams,dc=example,dc=com', 'objectClass': [b'posixGroup'], 'cn': [b'fr-it'],
+     'description': [b'France IT'], 'memberUid': [b'jdoe'], 'modifyTimestamp': [b'20191101000000Z']},
+]
+
+
+@pytest.fixture
+def edap():
+    edap = MagicMock(domain_dn='dc=example,dc=com')
+    edap.make_team_machine_name = lambda franchise, division: f'{franchise}-{division}'
+    return edap
+
+
+@pytest.fixture
+def graph(edap):
+    pool = MagicMock()
+
+    @contextmanager
+    def connection():
+        yield edap
+
+    pool.connection = connection
+    return OrgGraph(pool, max_age=60)
+
+
+@pytest.fixture
+def pages():
+    with patch('backend.ldap.org_graph.iter_pages') as iter_pages_mock:
+        iter_pages_mock.side_effect = lambda *args, **kwargs: iter([[dict(entry) for entry in ENTRIES]])
+        yield iter_pages_mock
+
+
+class TestOrgGraph:
+
+    def test_build_and_memberships(self, graph, pages):
+        assert graph.get_user('jdoe')['givenName'] == [b'John']
+        assert graph.get_user('unknown') is None
+        assert sorted(group['fqdn'] for group in graph.get_user_groups('jdoe')) == [
+            'cn=fr,ou=franchises,dc=example,dc=com', 'cn=fr-it,ou=teams,dc=example,dc=com']
+        assert pages.call_count == 1
+        assert graph.stats()['memberships'] == 2
+
+    def test_groups_by_unit_and_query(self, graph, pages):
+        assert [group['cn'] for group in graph.get_groups('teams')] == [[b'fr-it']]
+        assert [group['cn'] for group in graph.get_groups(query='fr')] == [[b'fr'], [b'fr-it']]
+        assert [group['cn'] for group in graph.get_groups(query='fr-', attribute='cn')] == [[b'fr-it']]
+
+    def test_team_component_units(self, graph, pages):
+        franchise, division = graph.get_team_component_units('fr-it')
+        assert franchise['cn'] == [b'fr']
+        assert division['cn'] == [b'it']
+        assert graph.get_team_component_units('everybody') is None
+
+    def test_write_triggers_incremental_refresh(self, graph, pages):
+        graph.get_users()
+        graph.on_write('make_uid_member_of', 'jdoe', 'cn=it,ou=divisions,dc=example,dc=com')
+        graph.get_users()
+        assert pages.call_count == 2
+        search_filter = pages.call_args[0][2]
+        assert '(modifyTimestamp>=20191102000000Z)' in search_filter
+        assert graph.stats()['incremental_refreshes'] == 1
+
+    def test_names_version_changes_only_with_names(self, graph, pages):
+        graph.get_users()
+        version = graph.names_version
+        graph.refresh()  # the same entries re-read, as the newest one always is
+        graph.refresh(full=True)
+        assert graph.names_version == version
+        entry = dict(ENTRIES[2], description=[b'Information Technology'])
+        pages.side_effect = lambda *args, **kwargs: iter([[entry]])
+        graph.refresh()
+        assert graph.names_version == version + 1
+        graph.on_write('delete_division', 'it')
+        assert graph.names_version == version + 2
+
+    def test_deleted_user_is_removed(self, graph, pages):
+        graph.get_users()
+        graph.on_write('delete_user', 'jdoe')
+        assert graph._users == {}
+        assert graph._members['cn=fr,ou=franchises,dc=example,dc=com'] == set()
+
+    def test_failed_delete_keeps_user(self, graph, pages):
+        graph.get_users()
+        graph.on_write('delete_user', 'jdoe', succeeded=False)
+        assert graph.stats()['stale']
+        assert graph.get_user('jdoe') is not None
+
+    def test_returned_entries_are_copies(self, graph, pages):
+        graph.get_groups('teams')[0]['cn'] = 'fr-it'
+        assert graph.get_groups('teams')[0]['cn'] == [b'fr-it']
+
+    def test_members_are_served_separately(self, graph, pages):
+        assert 'memberUid' not in graph.get_groups('franchises')[0]
+        assert graph.get_members('franchises', 'fr') == ['jdoe']
+        assert graph.get_members('franchises', 'unknown') is None
+
+    def test_start_builds_snapshot_in_background(self, graph, pages):
+        graph.start()
+        deadline = time.monotonic() + 5
+        while graph.stats()['full_refreshes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert graph.get_user('jdoe') is not None
+        assert pages.call_count == 1
+
+    def test_requests_do_only_incremental_refreshes_when_started(self, graph, pages):
+        graph.full_refresh = 0
+        graph.get_users()
+        graph._refresher = MagicMock()  # background rebuilds are running
+        graph.max_age = 0
+        graph.get_users()
+        assert graph.stats()['full_refreshes'] == 1
+        assert graph.stats()['incremental_refreshes'] == 1
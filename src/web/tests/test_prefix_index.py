@@ -0,0 +1,39 @@
+from backend.ldap.prefix_index import PrefixIndex
+
+TEAMS = [
+    {'fqdn': 'cn=fr-it,ou=teams,dc=example,dc=com', 'cn': [b'fr-it'], 'description': [b'France IT']},
+    {'fqdn': 'cn=fr-hr,ou=teams,dc=example,dc=com', 'cn': [b'fr-hr'], 'description': [b'France HR']},
+    {'fqdn': 'cn=it-it,ou=teams,dc=example,dc=com', 'cn': [b'it-it'], 'description': [b'Italy IT']},
+    {'fqdn': 'cn=it,ou=teams,dc=example,dc=com', 'cn': [b'it'], 'description': [b'IT']},
+    {'fqdn': 'cn=nodesc,ou=teams,dc=example,dc=com', 'cn': [b'nodesc']},
+]
+
+
+def names(entries):
+    return [entry['cn'][0] for entry in entries]
+
+
+class TestPrefixIndex:
+
+    def test_case_insensitive_display_name_prefix(self):
+        index = PrefixIndex(TEAMS)
+        assert names(index.search('fRaNcE')) == [b'fr-hr', b'fr-it']
+
+    def test_ranking(self):
+        index = PrefixIndex(TEAMS)
+        # full match, display name prefix, machine name prefix, word prefix
+        assert names(index.search('it')) == [b'it', b'it-it', b'fr-it']
+
+    def test_limit(self):
+        index = PrefixIndex(TEAMS)
+        assert names(index.search('it', limit=2)) == [b'it', b'it-it']
+
+    def test_machine_name_and_missing_description(self):
+        index = PrefixIndex(TEAMS)
+        assert names(index.search('nod')) == [b'nodesc']
+        assert index.search('unknown') == []
+
+    def test_results_are_copies(self):
+        index = PrefixIndex(TEAMS)
+        index.search('it')[0]['cn'] = 'it'
+        assert TEAMS[3]['cn'] == [b'it']
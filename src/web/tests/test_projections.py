@@ -0,0 +1,26 @@
+from backend.ldap.api_serializers import api_users_schema, api_divisions_schema
+from backend.ldap.projections import project_users, project_groups
+from backend.ldap.serializers import edap_users_schema, edap_divisions_schema
+
+USERS = [
+    {'fqdn': 'uid=jdoe,ou=people,dc=example,dc=com', 'uid': [b'jdoe'], 'givenName': [b'John'], 'sn': [b'Doe'],
+     'mail': [b'jdoe@example.com', b'john@example.com'], 'objectClass': [b'inetOrgPerson']},
+    {'fqdn': 'uid=nomail,ou=people,dc=example,dc=com', 'uid': [b'nomail'], 'givenName': [b'No'], 'sn': [b'Mail']},
+]
+
+DIVISIONS = [
+    {'fqdn': 'cn=it,ou=divisions,dc=example,dc=com', 'cn': [b'it'], 'description': [b'IT'], 'memberUid': [b'jdoe']},
+    {'fqdn': 'cn=qwe,ou=divisions,dc=example,dc=com', 'cn': [b'qwe']},
+]
+
+
+def copies(entries):
+    return [dict(entry) for entry in entries]
+
+
+def test_users_projection_matches_schemas(app):
+    assert project_users(USERS) == api_users_schema.dump(edap_users_schema.load(copies(USERS)))
+
+
+def test_groups_projection_matches_schemas(app):
+    assert project_groups(DIVISIONS) == api_divisions_schema.dump(edap_divisions_schema.load(copies(DIVISIONS)))
@@ -0,0 +1,174 @@
+import json
+
+from unittest.mock import MagicMock, patch
+
+from backend.rocket_chat.connections import RocketAuth, AUTH_TOKEN_HEADER, USER_ID_HEADER
+
+
+def make_login(*tokens):
+    """ RocketChat mock, which logs in with given tokens one after another """
+    tokens = iter(tokens)
+
+    def rocket(user=None, password=None, auth_token=None, user_id=None, **kwargs):
+        client = MagicMock()
+        if user:
+            client.headers = {AUTH_TOKEN_HEADER: next(tokens), USER_ID_HEADER: 'admin-id'}
+        else:
+            client.headers = {AUTH_TOKEN_HEADER: auth_token, USER_ID_HEADER: user_id}
+        return client
+    return rocket
+
+
+def response(status_code):
+    res = MagicMock()
+    res.status_code = status_code
+    return res
+
+
+class TestRocketAuth:
+
+    def test_token_is_reused_between_clients(self):
+        with patch('backend.rocket_chat.connections.RocketChat', side_effect=make_login('t1')):
+            auth = RocketAuth('admin', 'admin', 'http://rocket')
+            clients = [auth.client() for _ in range(3)]
+        assert [client.headers[AUTH_TOKEN_HEADER] for client in clients] == ['t1'] * 3
+        assert auth.stats() == {'logins': 1, 'refreshes': 0, 'authenticated': True}
+
+    def test_rejected_token_is_refreshed_and_call_repeated(self):
+        with patch('backend.rocket_chat.connections.RocketChat', side_effect=make_login('t1', 't2')):
+            auth = RocketAuth('admin', 'admin', 'http://rocket')
+            headers = auth.client().headers
+            with patch('requests.Session.request', side_effect=[response(401), response(200)]) as request:
+                res = auth.http.get('http://rocket/api/v1/me', headers=headers)
+        assert res.status_code == 200
+        assert request.call_count == 2
+        assert headers[AUTH_TOKEN_HEADER] == 't2'
+        # other clients, which still have stale token, don't cause another login
+        assert auth.refresh(stale='t1')[AUTH_TOKEN_HEADER] == 't2'
+        assert auth.stats()['logins'] == 2
+
+
+class TestRocketIds:
+
+    @staticmethod
+    def make_rocket():
+        rocket = MagicMock()
+        rocket.users_list.return_value = MagicMock(status_code=200, json=lambda: {'users': [{'_id': 'u1'}]})
+        rocket.channels_create.return_value = MagicMock(status_code=200, json=lambda: {'channel': {'_id': 'c1'}})
+        return rocket
+
+    def test_ids_are_cached_until_forgotten(self, app):
+        from backend.rocket_chat.utils import RocketChatService
+        rocket, service = self.make_rocket(), RocketChatService()
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket):
+            assert [service.get_user_id('jdoe') for _ in range(3)] == ['u1'] * 3
+            assert rocket.users_list.call_count == 1
+            service.forget_ids(username='jdoe')
+            service.get_user_id('jdoe')
+            assert rocket.users_list.call_count == 2
+
+    def test_created_channel_id_is_cached(self, app):
+        from backend.rocket_chat.utils import RocketChatService
+        rocket, service = self.make_rocket(), RocketChatService()
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket):
+            service.create_channel('Franchise-France')
+            assert service.get_channel_id('Franchise-France') == 'c1'
+        assert not rocket.channels_list.called
+
+    def test_missing_ids_are_not_cached(self, app):
+        from backend.rocket_chat.utils import RocketChatService
+        rocket, service = self.make_rocket(), RocketChatService()
+        rocket.users_list.return_value = MagicMock(status_code=200, json=lambda: {'users': []})
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket):
+            assert service.get_user_id('jdoe') is None
+            assert service.get_user_id('jdoe') is None
+        assert rocket.users_list.call_count == 2
+
+    def test_batch_lookup_is_chunked_and_paged(self, app):
+        from backend.rocket_chat import utils
+        rocket, service = self.make_rocket(), utils.RocketChatService()
+
+        def users_list(query, count, offset):
+            usernames = json.loads(query)['username']['$in']
+            page = usernames[offset:offset + count]
+            return MagicMock(status_code=200, json=lambda: {
+                'users': [{'_id': f'id-{name}', 'username': name} for name in page], 'total': len(usernames)})
+        rocket.users_list.side_effect = users_list
+
+        usernames = [f'user{n}' for n in range(5)]
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket), \
+                patch.object(utils, 'LOOKUP_CHUNK_SIZE', 3), patch.object(utils, 'LOOKUP_PAGE_SIZE', 2):
+            assert service.get_user_ids(usernames + ['user0']) == {name: f'id-{name}' for name in usernames}
+            # 2 chunks, 2 and 1 pages
+            assert rocket.users_list.call_count == 3
+            assert service.get_user_ids(usernames)['user4'] == 'id-user4'
+            assert rocket.users_list.call_count == 3
+
+    def test_sync_channel_members_applies_only_difference(self, app):
+        from backend.rocket_chat.utils import RocketChatService
+        rocket, service = self.make_rocket(), RocketChatService()
+        app.config['ROCKETCHAT_USER'] = 'admin'
+        app.config['ROCKETCHAT_SYNC_KEEP'] = ['bot']
+        rocket.channels_list.return_value = MagicMock(status_code=200, json=lambda: {
+            'channels': [{'_id': 'c1', 'fname': 'Franchise-France'}]})
+        members = [{'_id': 'a', 'username': 'admin'}, {'_id': 'u-adam', 'username': 'adam'},
+                   {'_id': 'u-old', 'username': 'old'}, {'_id': 'u-bot', 'username': 'bot'},
+                   {'_id': 'u-owner', 'username': 'owner'}]
+        rocket.channels_roles.return_value = MagicMock(status_code=200, json=lambda: {
+            'roles': [{'u': {'_id': 'u-owner', 'username': 'owner'}, 'roles': ['owner']}]})
+        rocket.channels_members.side_effect = lambda room_id, count, offset: MagicMock(status_code=200, json=lambda: {
+            'members': members[offset:offset + count], 'total': len(members)})
+        rocket.users_list.return_value = MagicMock(status_code=200, json=lambda: {
+            'users': [{'_id': 'u-jdoe', 'username': 'jdoe'}]})
+        rocket.channels_invite.return_value = MagicMock(status_code=200)
+        rocket.channels_kick.return_value = MagicMock(status_code=200)
+
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket):
+            report = service.sync_channel_members('Franchise-France', ['adam', 'jdoe', 'nochat'], max_workers=2)
+
+        assert report == {'channel': 'Franchise-France', 'invited': ['jdoe'], 'kicked': ['old'],
+                          'kept': ['admin', 'bot', 'owner'], 'missing': ['nochat'], 'failed': []}
+        rocket.channels_invite.assert_called_once_with('c1', 'u-jdoe')
+        rocket.channels_kick.assert_called_once_with('c1', 'u-old')
+
+
+class TestChannelKicks:
+
+    @staticmethod
+    def make_rocket():
+        rocket = MagicMock()
+        rocket.channels_list.return_value = MagicMock(status_code=200, json=lambda: {
+            'channels': [{'_id': 'c1', 'fname': 'Franchise-France'}]})
+        rocket.channels_members.return_value = MagicMock(status_code=200, json=lambda: {
+            'members': [{'_id': 'u-old', 'username': 'old'}], 'total': 1})
+        rocket.channels_roles.return_value = MagicMock(status_code=200, json=lambda: {'roles': []})
+        return rocket
+
+    def test_kick_is_recorded(self, app):
+        from backend.actions.models import Action
+        from backend.rocket_chat.utils import LoggingRocketChatService
+        rocket = self.make_rocket()
+        rocket.channels_kick.return_value = MagicMock(status_code=200)
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket), \
+                patch('backend.rocket_chat.utils.record_action') as record_action:
+            LoggingRocketChatService().kick_user_from_channel(rocket_channel='c1', rocket_user='u-old')
+        record_action.assert_called_once_with(Action.KICK_USER_FROM_CHANNEL, status=True, message=None,
+                                              rocket_channel='c1', rocket_user='u-old')
+
+    def test_failed_kick_is_reported(self, app):
+        from backend.rocket_chat.utils import LoggingRocketChatService
+        rocket = self.make_rocket()
+        rocket.channels_kick.side_effect = ConnectionError('Connection refused')
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket), \
+                patch('backend.rocket_chat.utils.record_action'):
+            report = LoggingRocketChatService().sync_channel_members('Franchise-France', [])
+        assert report['kicked'] == []
+        assert report['failed'] == [{'username': 'old', 'action': 'kick', 'message': 'Failed to kick user'}]
+
+    def test_unsuccessful_kick_without_json_is_reported(self, app):
+        from backend.rocket_chat.utils import RocketChatService
+        rocket = self.make_rocket()
+        rocket.channels_kick.return_value = MagicMock(status_code=502, json=MagicMock(side_effect=ValueError))
+        with patch('backend.rocket_chat.utils.get_rocket', return_value=rocket):
+            report = RocketChatService().sync_channel_members('Franchise-France', [])
+        assert report['failed'] == [{'username': 'old', 'action': 'kick', 'message': 'Failed to kick user'}]